@@ -0,0 +1,112 @@
+"""
+End-to-end load test of EAConnector against the local EA simulator (src.sim.ea_server).
+
+The simulator publishes ticks at --rate messages/s over --symbols symbols. The driver
+reports the sustained received ticks/s, the ticks dropped (from the sequence numbers
+encoded in the prices), the publish -> handler latency percentiles, and the TRADE round
+trip of --orders commands sent while the feed runs. Run from the repository root:
+
+    python -m benchmarks.ea_load --symbols 40 --rate 50000 --seconds 10
+"""
+
+import argparse
+from time import perf_counter, sleep, time_ns
+
+from src.client.ea_api import EAConnector
+from src.client.latency import LatencyHistogram
+from src.sim.ea_server import SEQ_MODULO, EAServer, decode_seq, synthetic_symbols
+
+
+class LoadProbe:
+    """
+    EAConnector subscriber counting received and dropped ticks and their end-to-end latency
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.latency = LatencyHistogram()
+        self.received = 0
+        self.dropped = 0
+        self._last = {}  # {SYMBOL: last sequence number}
+
+    def onTick(self, symbol, time_ns_, bid, ask):
+        now = time_ns()
+        seq = decode_seq(bid)
+        last = self._last.get(symbol)
+        if last is not None:
+            self.dropped += (seq - last - 1) % SEQ_MODULO
+        self._last[symbol] = seq
+        self.received += 1
+
+        sent = self.server.sent_at(symbol, seq)
+        if sent:
+            self.latency.record(now - sent)
+
+    def onRate(self, *args):
+        pass
+
+
+def _orders(conn, symbol, n):
+    """ :return: (LatencyHistogram) TRADE OPEN round trips, one command in flight at a time """
+    hist = LatencyHistogram()
+    for _ in range(n):
+        start = perf_counter()
+        conn.send_command('OPEN', 0, symbol).result(timeout=5)
+        hist.record(int((perf_counter() - start) * 1e9))
+    return hist
+
+
+def _report(label, summary):
+    print('{:<24} n={:<9} mean={:>8.1f}us p50={:>8.1f}us p99={:>8.1f}us p99.9={:>8.1f}us max={:>9.1f}us'.format(
+        label, summary['count'], summary['mean_us'], summary['p50_us'], summary['p99_us'], summary['p99.9_us'],
+        summary['max_us']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=40, help='number of synthetic symbols')
+    parser.add_argument('--rate', type=float, default=20000, help='ticks published per second')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of the run')
+    parser.add_argument('--orders', type=int, default=200, help='TRADE commands sent during the run')
+    parser.add_argument('--order-latency', type=float, default=0.0, help='simulated EA order latency (s)')
+    parser.add_argument('--port', type=int, default=32768, help='first of the three ports used')
+    args = parser.parse_args()
+
+    symbols = synthetic_symbols(args.symbols)
+    server = EAServer(symbols, tick_rate=0, push_port=args.port, pull_port=args.port + 1,
+                      sub_port=args.port + 2, order_latency=args.order_latency).start()
+    conn = EAConnector(push_port=args.port, pull_port=args.port + 1, sub_port=args.port + 2, low_latency=True,
+                       tag_requests=True)
+    probe = LoadProbe(server)
+    conn.add_subscriber(probe, kinds=('tick',))
+    for symbol in symbols:
+        conn.subscribe_marketdata(symbol)
+    sleep(0.5)  # let the SUB subscriptions reach the publisher
+
+    try:
+        warmup = server.ticks_sent
+        server.tick_rate = args.rate
+        start = perf_counter()
+        orders = _orders(conn, symbols[0], args.orders) if args.orders else None
+        sleep(max(args.seconds - (perf_counter() - start), 0.0))
+        server.tick_rate = 0
+        run = perf_counter() - start
+        sleep(0.5)  # drain
+        sent = server.ticks_sent - warmup
+        elapsed = perf_counter() - start
+    finally:
+        conn.zmq_shutdown()
+        server.stop()
+
+    lost = sent - probe.received
+    print('published {} ticks ({:.0f}/s), received {} ({:.0f}/s), {} dropped in sequence, {} not received'.format(
+        sent, sent / run, probe.received, probe.received / run, probe.dropped, max(lost, 0)))
+    _report('publish -> onTick', probe.latency.summary())
+    _report('socket -> handler', conn.latency.summary())
+    if orders is not None:
+        _report('TRADE round trip', orders.summary())
+    print('elapsed {:.1f}s ({:.1f}s publishing), {} symbols'.format(elapsed, run, len(symbols)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Order submission throughput of Connector against the simulated terminal (src.sim.fake_mt5).
+
+Compares the legacy make_request() + send_command() path with an OrderTemplate sent
+through send_order(). Run from the repository root:
+
+    python -m benchmarks.order_throughput --orders 20000 --latency 0
+"""
+
+import argparse
+import contextlib
+import io
+from time import perf_counter
+
+from src.sim import fake_mt5
+
+
+def _time(send, orders):
+    start = perf_counter()
+    for _ in range(orders):
+        send()
+    return perf_counter() - start
+
+
+def _report(label, elapsed, orders):
+    print('{:<32} {:>10.0f} orders/s {:>8.1f} us/order'.format(label, orders / elapsed, elapsed / orders * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=20000, help='orders sent per path')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated terminal call latency (s)')
+    parser.add_argument('--symbol', default='EURUSD')
+    args = parser.parse_args()
+
+    mt5 = fake_mt5.install(latency=args.latency)
+    from src.client.connector import Connector
+
+    conn = Connector()
+    # legacy path prints on every order, keep it off the terminal but still pay for it
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy = _time(lambda: conn.send_command(Connector.make_request(symbol=args.symbol)), args.orders)
+    _report('make_request + send_command', legacy, args.orders)
+
+    template = Connector.order_template(args.symbol)
+    fast = _time(lambda: conn.send_order(template), args.orders)
+    _report('order_template + send_order', fast, args.orders)
+
+    tick = mt5.symbol_info_tick(args.symbol)
+    _report('send_order, tick given', _time(lambda: conn.send_order(template, tick=tick), args.orders), args.orders)
+
+    # request preparation alone, without the terminal's order_send()
+    _report('make_request only', _time(lambda: Connector.make_request(symbol=args.symbol), args.orders),
+            args.orders)
+    _report('template.build only', _time(lambda: template.build(tick.bid, tick.ask), args.orders), args.orders)
+
+    print('speedup: {:.1f}x, {} orders sent'.format(legacy / fast, fake_mt5.orders_sent()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+OHLC bars built locally from the SUB tick feed.
+
+BarAggregator is an EAConnector subscriber (see EAConnector.add_subscriber()) that builds
+every configured bar type from each tick at once:
+
+    'M1', 'M5', 'M15', 'M30', 'H1', 'H4', 'D1'   time bars, aligned on the broker's clock like MT5 bars
+    'T500'                                        tick bars, one bar every 500 ticks
+    'V1000'                                       volume bars, one bar every 1000 volume units
+
+BID/ASK messages carry no volume, so ticks from the SUB feed count as one unit each
+(update() takes a real volume when the caller has one). Completed bars are appended to
+preallocated ring buffers and handed to handler.onBar(symbol, spec, bar), with bar a
+tuple in BAR_FIELDS order.
+
+A time bar is completed by the first tick of the next bar, or by poll() once its end has
+passed, so a timer can close bars of quiet symbols without waiting for a tick.
+
+Time bars are aligned on time_ns + tz_offset, so H4 and D1 bars open at the broker's
+midnight like the terminal's, and bar times stay in UTC. Handlers are called after the
+aggregator's lock is released, so onBar() can call update() or poll().
+"""
+
+from threading import Lock
+from time import time_ns
+
+import numpy as np
+
+from src.client.dispatch import TICK
+from src.client.tick_store import RingBuffer
+
+
+BAR_FIELDS = (('time', np.int64),  # bar open time (ns since epoch, UTC)
+              ('close_time', np.int64),  # time of the bar's last tick (ns)
+              ('open', np.float64),
+              ('high', np.float64),
+              ('low', np.float64),
+              ('close', np.float64),
+              ('ticks', np.int64),
+              ('volume', np.float64))
+
+TIMEFRAMES = {'M1': 60, 'M5': 300, 'M15': 900, 'M30': 1800, 'H1': 3600, 'H4': 14400, 'D1': 86400}
+
+TIME_BARS, TICK_BARS, VOLUME_BARS = 'time', 'tick', 'volume'
+
+
+def parse_spec(spec):
+    """
+    :param spec: (str) 'M1'...'D1', 'T<n>' or 'V<n>'
+    :return: (tuple) (kind, size), size in ns for time bars
+    """
+    if spec in TIMEFRAMES:
+        return TIME_BARS, TIMEFRAMES[spec] * 1000000000
+    try:
+        size = float(spec[1:])
+    except ValueError:
+        size = 0
+    if spec[:1] == 'T' and size >= 1:
+        return TICK_BARS, int(size)
+    if spec[:1] == 'V' and size > 0:
+        return VOLUME_BARS, size
+    raise ValueError('Unknown bar spec {}, expected one of {}, T<ticks> or V<volume>'.format(spec,
+                                                                                             list(TIMEFRAMES)))
+
+
+class BarAggregator:
+
+    def __init__(self, specs=('M1', 'M5', 'H1'), capacity=10000, price='bid', tz_offset=0):
+        """
+        :param specs: (tuple of str) bar types to build (see parse_spec())
+        :param capacity: (int) completed bars kept per symbol and spec
+        :param price: (str) 'bid' (like MT5 bars), 'ask' or 'mid'
+        :param tz_offset: (float) hours the broker's server time is ahead of UTC, like BaseStrategy.broker_tz_offset
+        """
+        if price not in ('bid', 'ask', 'mid'):
+            raise ValueError("price must be 'bid', 'ask' or 'mid', got {}".format(price))
+
+        self.specs = tuple(specs)
+        self._parsed = tuple((spec,) + parse_spec(spec) for spec in self.specs)
+        self.capacity = capacity
+        self.price = price
+        self.tz_offset = tz_offset
+        self._offset_ns = int(round(tz_offset * 3600)) * 1000000000
+
+        self._bars = {}  # {(SYMBOL, SPEC): RingBuffer(BAR_FIELDS)}
+        self._current = {}  # {SYMBOL: [[SPEC, KIND, SIZE, OPEN_TIME, CLOSE_TIME, O, H, L, C, TICKS, VOLUME], ...]}
+        self._handlers = []
+        # update() runs on the feed thread, poll() usually on a timer thread
+        self._lock = Lock()
+        self._completed = []  # (SYMBOL, SPEC, BAR) completed under the lock, dispatched after it
+
+    def add_handler(self, handler):
+        """
+        :param handler: (obj) implements onBar(symbol, spec, bar)
+        """
+        if not callable(getattr(handler, 'onBar', None)):
+            raise TypeError('[BAR_AGGREGATOR] {} does not implement onBar()'.format(type(handler).__name__))
+        if handler not in self._handlers:
+            self._handlers = self._handlers + [handler]
+
+    def remove_handler(self, handler):
+        self._handlers = [h for h in self._handlers if h is not handler]
+
+    def attach(self, conn, symbols=None):
+        """
+        Build bars from conn's parsed ticks
+        :param conn: (EAConnector)
+        :param symbols: (list of str) (optional) symbols to build bars for, default is every symbol
+        """
+        conn.add_subscriber(self, symbols, kinds=(TICK,))
+
+    # EAConnector subscriber interface
+    def onTick(self, symbol, time_ns, bid, ask):
+        if self.price == 'bid':
+            price = bid
+        elif self.price == 'ask':
+            price = ask
+        else:
+            price = (bid + ask) / 2.0
+        self.update(symbol, time_ns, price)
+
+    def update(self, symbol, time_ns, price, volume=1.0):
+        """
+        Add one trade/quote to every bar type of the symbol
+        :param time_ns: (int) tick time (ns since epoch)
+        :param price: (float)
+        :param volume: (float) tick volume
+        """
+        with self._lock:
+            self._update(symbol, time_ns, price, volume)
+            completed, self._completed = self._completed, []
+        self._dispatch(completed)
+
+    def _update(self, symbol, time_ns, price, volume):
+        current = self._current.get(symbol)
+        if current is None:
+            current = self._current[symbol] = [[spec, kind, size, None, 0, 0.0, 0.0, 0.0, 0.0, 0, 0.0]
+                                               for spec, kind, size in self._parsed]
+
+        for bar in current:
+            kind = bar[1]
+            if kind == TIME_BARS:
+                open_time = time_ns - (time_ns + self._offset_ns) % bar[2]
+                if bar[3] is not None and open_time != bar[3]:
+                    self._complete(symbol, bar)
+                if bar[3] is None:
+                    bar[3:11] = [open_time, time_ns, price, price, price, price, 1, volume]
+                    continue
+            elif bar[3] is None:
+                bar[3:11] = [time_ns, time_ns, price, price, price, price, 1, volume]
+                self._complete_if_full(symbol, bar)
+                continue
+
+            bar[4] = time_ns
+            if price > bar[6]:
+                bar[6] = price
+            elif price < bar[7]:
+                bar[7] = price
+            bar[8] = price
+            bar[9] += 1
+            bar[10] += volume
+            if kind != TIME_BARS:
+                self._complete_if_full(symbol, bar)
+
+    def _complete_if_full(self, symbol, bar):
+        if (bar[1] == TICK_BARS and bar[9] >= bar[2]) or (bar[1] == VOLUME_BARS and bar[10] >= bar[2]):
+            self._complete(symbol, bar)
+
+    def _complete(self, symbol, bar):
+        spec = bar[0]
+        row = tuple(bar[3:11])
+        bar[3] = None
+
+        buf = self._bars.get((symbol, spec))
+        if buf is None:
+            buf = self._bars[(symbol, spec)] = RingBuffer(BAR_FIELDS, self.capacity)
+        buf.append(*row)
+        self._completed.append((symbol, spec, row))
+
+    def _dispatch(self, completed):
+        for symbol, spec, row in completed:
+            for hnd in self._handlers:
+                hnd.onBar(symbol, spec, row)
+
+    def poll(self, now_ns=None):
+        """
+        Complete the time bars whose end has passed
+        :param now_ns: (int) (optional) current time (ns since epoch), default is the clock
+        :return: (int) number of bars completed
+        """
+        now_ns = time_ns() if now_ns is None else now_ns
+        completed = 0
+        with self._lock:
+            for symbol, current in self._current.items():
+                for bar in current:
+                    if bar[1] == TIME_BARS and bar[3] is not None and now_ns >= bar[3] + bar[2]:
+                        self._complete(symbol, bar)
+                        completed += 1
+            bars, self._completed = self._completed, []
+        self._dispatch(bars)
+        return completed
+
+    def bars(self, symbol, spec, n=None):
+        """
+        :param n: (int) (optional) number of most recent bars
+        :return: (dict) {FIELD: ndarray} zero-copy views of the completed bars, oldest first
+        """
+        buf = self._bars.get((symbol, spec))
+        if buf is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in BAR_FIELDS}
+        return buf.view(n)
+
+    def bar_buffer(self, symbol, spec):
+        """ :return: (RingBuffer) completed bars, None before the first one (use since() to read incrementally) """
+        return self._bars.get((symbol, spec))
+
+    def current(self, symbol, spec):
+        """
+        :return: (tuple) the bar in progress in BAR_FIELDS order, None if there is none
+        """
+        for bar in self._current.get(symbol, ()):
+            if bar[0] == spec:
+                return None if bar[3] is None else tuple(bar[3:11])
+        return None
+
+    def symbols(self):
+        """ :return: (list of str) symbols with at least one tick """
+        return list(self._current)
@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 from time import sleep
 
 from src.client import ea_api
+from src.client.tick_store import ChunkedColumns, TICK_FIELDS
 
 
 class Client:
@@ -9,26 +11,130 @@ class Client:
     TODO: move class methods to connector.py
     """
 
-    def __init__(self):
-        self.conn = ea_api.EAConnector(client_id='ai_001')
-        self.market_data = pd.DataFrame()
+    def __init__(self, incremental=True, hub_address=None, conn=None):
+        """
+        :param incremental: (bool) True to append only new ticks on each market_to_df() call, False to rebuild
+                            market_data from every tick held in the Connector's tick store
+        :param hub_address: (str) (optional) MarketDataHub address to share one EA feed with other clients
+        :param conn: (EAConnector) (optional) connector to read ticks from, default is a new one
+        """
+        self.conn = ea_api.EAConnector(client_id='ai_001', hub_address=hub_address) if conn is None else conn
+        self.incremental = incremental
+
+        # Incremental materialization state
+        self._tick_cursors = {}  # {SYMBOL: tick store sequence number already materialized}
+        self._tick_blocks = {}  # {SYMBOL: ChunkedColumns}
+        self.dropped_ticks = 0  # ticks overwritten in the tick store before market_to_df() read them
+
+        # Frames built on access only, extended with the rows appended since
+        self._symbol_frames = {}  # {SYMBOL: (DataFrame, rows of the block it holds)}
+        self._market_data = pd.DataFrame()
+        self._market_rows = {}  # {SYMBOL: rows of the symbol's frame already aligned into market_data}
+        self._market_data_stale = False
+        self._market_realign = False
+
+    @property
+    def market_data(self):
+        """
+        (DataFrame) BUY/SELL columns per symbol indexed by receive time. Aligning the symbols costs a pass over
+        every tick, so it is built on access only, and cached until market_to_df() brings new ticks. Use
+        symbol_data() to read one symbol without aligning them all.
+        """
+        if self._market_data_stale:
+            tails = []
+            for symbol in self._tick_blocks:
+                frame = self.symbol_data(symbol)
+                tails.append(frame.iloc[self._market_rows.get(symbol, 0):])
+                self._market_rows[symbol] = len(frame)
+            tails = [tail for tail in tails if not tail.empty]
+            tail = pd.concat(tails, axis=1, sort=True) if tails else pd.DataFrame()
+
+            # Receive times only grow, so the aligned tail extends the cached frame unless a symbol's last row was
+            # replaced by a tick with the same timestamp or the tail starts before the cached frame ends
+            if not self._market_realign and (self._market_data.empty or tail.empty or (
+                    tail.index[0] > self._market_data.index[-1] and tail.columns.isin(self._market_data.columns).all())):
+                self._market_data = pd.concat([self._market_data, tail]) if not self._market_data.empty else tail
+            else:
+                frames = [self.symbol_data(symbol) for symbol in self._tick_blocks]
+                frames = [frame for frame in frames if not frame.empty]
+                self._market_data = pd.concat(frames, axis=1, sort=True) if frames else pd.DataFrame()
+            self._market_data_stale = self._market_realign = False
+        return self._market_data
+
+    def symbol_data(self, symbol):
+        """
+        :param symbol: (str) symbol
+        :return: (DataFrame) the symbol's materialized ticks with (SYMBOL, BUY/SELL) columns, the latest tick per
+                 timestamp so the symbols can be aligned on one index
+        """
+        block = self._tick_blocks.get(symbol)
+        if block is None:
+            return pd.DataFrame()
+
+        frame, rows = self._symbol_frames.get(symbol, (None, 0))
+        if frame is not None and rows == len(block):
+            return frame
+
+        ticks = block.consolidate()
+        tail = self._to_frame(symbol, {name: values[rows:] for name, values in ticks.items()})
+        if frame is not None and len(frame) and len(tail) and tail.index[0] == frame.index[-1]:
+            frame = frame.iloc[:-1]
+            if self._market_rows.get(symbol, 0) > len(frame):
+                self._market_realign = True  # market_data holds the replaced row
+        frame = tail if frame is None else pd.concat([frame, tail])
+        self._symbol_frames[symbol] = (frame, len(block))
+        return frame
+
+    @staticmethod
+    def _to_frame(symbol, ticks):
+        """
+        :param ticks: (dict) {FIELD: ndarray} ticks in receive order
+        :return: (DataFrame) (SYMBOL, BUY/SELL) columns, the latest tick per timestamp
+        """
+        times = ticks['time']
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]
+        df = pd.DataFrame({(symbol, 'BUY'): ticks['bid'][keep], (symbol, 'SELL'): ticks['ask'][keep]},
+                          index=pd.DatetimeIndex(times[keep].astype('datetime64[ns]')))
+        df.columns = pd.MultiIndex.from_tuples(df.columns)
+        return df
 
     def market_to_df(self):
         """
-        Returns a DataFrame object of the market_data_db variable which collects data from the Connector's subscribe socket
+        Collects the ticks received on the Connector's subscribe socket. market_data and symbol_data() are only
+        built when read.
+
+        In incremental mode only the ticks that arrived since the previous call are copied, so the cost of a call
+        depends on the number of new ticks and not on the session length.
+        :return: (DataFrame) the new ticks, BUY/SELL columns per symbol indexed by receive time
         """
-        rawdata = self.conn.market_data_db
-        df = pd.DataFrame(rawdata)
+        store = self.conn.tick_store
+        frames = []
+
+        for symbol in store.symbols():
+            buf = store.tick_buffer(symbol)
+            if buf is None:
+                continue
+
+            if self.incremental:
+                new, self._tick_cursors[symbol], lost = buf.since(self._tick_cursors.get(symbol, 0))
+                self.dropped_ticks += lost
+            else:
+                new = buf.view()
+                self._tick_cursors[symbol] = buf.total
+                self._tick_blocks.pop(symbol, None)
+                self._symbol_frames.pop(symbol, None)
+                self._market_rows.pop(symbol, None)
+                self._market_data = pd.DataFrame()
 
-        # Flush market_data_db
-        self.conn.market_data_db = {}
+            if len(new['time']):
+                if symbol not in self._tick_blocks:
+                    self._tick_blocks[symbol] = ChunkedColumns(TICK_FIELDS)
+                self._tick_blocks[symbol].append(new)
+                self._market_data_stale = True
+                frames.append(self._to_frame(symbol, new))
 
-        for symbol in df.columns:
-            new = pd.DataFrame()
-            new['buy'] = df[symbol].apply(lambda x: x[0] if type(x) is tuple else x)
-            new['sell'] = df[symbol].apply(lambda x: x[1] if type(x) is tuple else x)
-            new.columns = pd.MultiIndex.from_arrays([[symbol, symbol], ['BUY', 'SELL']])
-            self.market_data = pd.concat([self.market_data, new], axis=1)
+        return pd.concat(frames, axis=1, sort=True) if frames else pd.DataFrame()
 
     def stream_market(self, symbols):
 
@@ -1,12 +1,22 @@
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
+import numpy as np
 import pandas as pd
 import datetime
 
 import MetaTrader5 as mt5
 
-from src.db.db_connection import DBConnector
+from src.client.gateway import PRIORITY_HISTORY, PRIORITY_ORDER, call_priority
+from src.client.order_templates import OrderTemplate
+from src.client.positions import PositionBook
+from src.client.retcodes import ReturnCodeRegistry
+from src.client.symbol_cache import SymbolCache
+
+# Trade server return codes, loaded once per process (see ReturnCodeRegistry)
+RETURN_CODES = ReturnCodeRegistry()
+# Static symbol properties (point, digits, ...), read once per symbol (see SymbolCache)
+SYMBOLS = SymbolCache(mt5)
 
 
 def connect():
@@ -65,9 +75,11 @@ class Connector:
             for symbol in symbols:
                 symbol_info = mt5.symbol_info(symbol)
                 if symbol_info is not None:
-                    info_list.append(symbol_info._asdict())
+                    info_list.append(symbol_info)
 
-            return pd.concat(info_list)
+            if not info_list:
+                return pd.DataFrame()
+            return pd.DataFrame(info_list, columns=info_list[0]._fields)
         else:
             print('[symbol_info] Unable to get info from unselected symbols')
 
@@ -93,26 +105,22 @@ class Connector:
         :return: (stack) [request, return-code]
         """
 
-        symbol_info = mt5.symbol_info(symbol)
+        symbol_info = SYMBOLS.get(symbol)
         if symbol_info is None:
             print(symbol, "not found, can not call order_check()")
+            return None
 
-        # if the symbol is unavailable in MarketWatch, add it
-        if not symbol_info.visible:
-            print(symbol, "is not visible, trying to switch on")
-            if not mt5.symbol_select(symbol, True):
-                print("symbol_select({}}) failed, exit", symbol)
-
-        # prepare the request
-        point = mt5.symbol_info(symbol).point
+        # one tick for price, SL and TP
+        tick = mt5.symbol_info_tick(symbol)
+        point, digits = symbol_info['point'], symbol_info['digits']
         request = {
             "action": action,
             "symbol": symbol,
             "volume": volume,
             "type": type,
-            "price": mt5.symbol_info_tick(symbol).ask,
-            "sl": round(mt5.symbol_info_tick(symbol).ask - sl_points * point, 5),
-            "tp": round(mt5.symbol_info_tick(symbol).ask + tp_points * point, 5),
+            "price": tick.ask,
+            "sl": round(tick.ask - sl_points * point, digits),
+            "tp": round(tick.ask + tp_points * point, digits),
             "deviation": 10,
             "magic": magic,
             "comment": comment,
@@ -126,6 +134,7 @@ class Connector:
 
         return request
 
+    @call_priority(PRIORITY_ORDER)
     def check_request(self, request, verbose=False):
         """
         :return: The Structure of Results of a Trade Request Check
@@ -136,7 +145,7 @@ class Connector:
         if int(result_dict['retcode']) == 0:
             print('[MT5 SERVER] REQUEST VALID.')
         else:
-            cont, description = self._return_code_dict(result_dict.retcode)
+            cont, description = self._return_code_dict(result.retcode)
             print('[MT5 SERVER] Request Issue. Description: {}'.format(description))
 
         if verbose:
@@ -150,37 +159,93 @@ class Connector:
 
     @staticmethod
     def _return_code_dict(ret_code):
-        dbconn = DBConnector()
-        df = dbconn.get_df_from_query("SELECT * FROM mt5_return_codes WHERE id={}".format(ret_code))
-
-        return df['Constant'].values, df['Description'].values
+        """
+        :return: (tuple) (CONSTANT, DESCRIPTION) of a trade server return code
+        """
+        return RETURN_CODES.lookup(ret_code)
 
+    def _report_failure(self, result):
+        """
+        Log and print a failed order_send() result
+        """
+        # log issue
+        self.logger.debug(result)
+        result_dict = result._asdict()
+        cont, description = self._return_code_dict(result_dict['retcode'])
+        print('[MT5 SERVER] Order Issue. Description: {}'.format(description))
+
+        for field in result_dict.keys():
+            print("   {}={}".format(field, result_dict[field]))
+            # if this is a trading request structure, display it element by element as well
+            if field == "request":
+                traderequest_dict = result_dict[field]._asdict()
+                for tradereq_filed in traderequest_dict:
+                    print("       traderequest: {}={}".format(tradereq_filed, traderequest_dict[tradereq_filed]))
+
+    @call_priority(PRIORITY_ORDER)
     def send_command(self, request):
         """
         Send command to Mt5 Terminal
         """
         result = mt5.order_send(request)
-        result_dict = result._asdict()
         # check the execution result
         if result.retcode != mt5.TRADE_RETCODE_DONE:
-            # log issue
-            self.logger.debug(result)
-            cont, description = self._return_code_dict(result_dict['retcode'])
-            print('[MT5 SERVER] Order Issue. Description: {}'.format(description))
-
-            for field in result_dict.keys():
-                print("   {}={}".format(field, result_dict[field]))
-                # if this is a trading request structure, display it element by element as well
-                if field == "request":
-                    traderequest_dict = result_dict[field]._asdict()
-                    for tradereq_filed in traderequest_dict:
-                        print("       traderequest: {}={}".format(tradereq_filed, traderequest_dict[tradereq_filed]))
+            self._report_failure(result)
             print("shutdown() and quit")
             mt5.shutdown()
         else:
             print("[MT5 SERVER] COMMAND EXECUTED SUCCESSFULLY!")
             return result
 
+    @staticmethod
+    @call_priority(PRIORITY_ORDER)
+    def order_template(symbol, type=mt5.ORDER_TYPE_BUY, action=mt5.TRADE_ACTION_DEAL, market=False, **kwargs):
+        """
+        Prepare a reusable request for send_order()
+        :param symbol: (str) symbol
+        :param type: (int) trade type. example: mt5.ORDER_TYPE_BUY
+        :param action: (int) trade action. example: mt5.TRADE_ACTION_DEAL
+        :param market: (bool) True for market order. Default is False
+        :param kwargs: volume, sl_points, tp_points, deviation, magic, comment (see OrderTemplate)
+        :return: (OrderTemplate) None if the symbol is not found
+        """
+        symbol_info = SYMBOLS.get(symbol)
+        if symbol_info is None:
+            print(symbol, "not found, can not prepare an order template")
+            return None
+
+        kwargs.setdefault('type_time', mt5.ORDER_TIME_GTC)
+        kwargs.setdefault('type_filling', mt5.ORDER_FILLING_RETURN if market else mt5.ORDER_FILLING_FOK)
+        return OrderTemplate(symbol, symbol_info['point'], symbol_info['digits'], action, type, market=market,
+                             **kwargs)
+
+    @call_priority(PRIORITY_ORDER)
+    def send_fast(self, request):
+        """
+        Send command to Mt5 Terminal without any output on success. Failures are logged and printed, the
+        terminal connection is kept.
+        :return: (obj) order_send() result, None if the terminal did not answer
+        """
+        result = mt5.order_send(request)
+        if result is None:
+            print('[MT5 SERVER] order_send() failed, error code: {}'.format(mt5.last_error()))
+        elif result.retcode != mt5.TRADE_RETCODE_DONE:
+            self._report_failure(result)
+        return result
+
+    @call_priority(PRIORITY_ORDER)
+    def send_order(self, template, volume=None, tick=None):
+        """
+        Fill in template with the current prices and send it through the fast path
+        :param template: (OrderTemplate) see order_template()
+        :param volume: (float) (optional) trade volume, default is the template's
+        :param tick: (obj) (optional) symbol_info_tick() result to price the order with, default is a fresh one
+        :return: (obj) order_send() result, None if the terminal did not answer
+        """
+        if tick is None:
+            tick = mt5.symbol_info_tick(template.symbol)
+        return self.send_fast(template.build(tick.bid, tick.ask, volume))
+
     @staticmethod
     def get_orders_count():
         return mt5.orders_total()
@@ -202,30 +267,43 @@ class Connector:
             return df
 
     @staticmethod
-    def get_rates(symbol, start=0, timeframe='TIMEFRAME_D1', count=270, end=None):
+    @call_priority(PRIORITY_HISTORY)
+    def get_rates(symbol, start=0, timeframe='TIMEFRAME_D1', count=270, end=None, cache=None):
         """
 
         :param symbol: (str)
-        :param timeframe: (str) the time interval, TIMEFRAME_M1: 1min, _H, _D, _W, _MN
+        :param timeframe: (str or int) the time interval, TIMEFRAME_M1: 1min, _H, _D, _W, _MN
         :param start: (str or int) the start of the data, can be date or bar index
         :param count: (int) number of bars to return
         :param end: (str) (optional) sets the end date instead of using count
+        :param cache: (RatesCache) (optional) local bar cache, only the bars it is missing get downloaded.
+                      Used for bar index and date range requests.
         :return: (DateFrame)
         """
+        if isinstance(timeframe, str):
+            timeframe = getattr(mt5, timeframe)
+
         # check if start is a bar index
         if isinstance(start, int):
-            rates = pd.DataFrame(mt5.copy_rates_from_pos(symbol, timeframe, start, count))
+            if cache is not None:
+                rates = pd.DataFrame(cache.get_latest(symbol, timeframe, start, count))
+            else:
+                rates = pd.DataFrame(mt5.copy_rates_from_pos(symbol, timeframe, start, count))
             rates['time'] = pd.to_datetime(rates['time'], unit='s')
             return rates
         else:
             try:
                 start_time = datetime.datetime.strptime(start, '%Y-%m-%d %H:%M:%S UTC')
                 # create 'datetime' object in UTC time zone to avoid the implementation of a local time zone offset
-                start_time.replace(tzinfo=datetime.timezone.utc)
+                start_time = start_time.replace(tzinfo=datetime.timezone.utc)
                 if end is not None:
                     end_time = datetime.datetime.strptime(end, '%Y-%m-%d %H:%M:%S UTC')
-                    end_time.replace(tzinfo=datetime.timezone.utc)
-                    rates = pd.DataFrame(mt5.copy_rates_range(symbol, timeframe, start_time, end_time))
+                    end_time = end_time.replace(tzinfo=datetime.timezone.utc)
+                    if cache is not None:
+                        rates = pd.DataFrame(cache.get_range(symbol, timeframe,
+                                                             start_time.timestamp(), end_time.timestamp()))
+                    else:
+                        rates = pd.DataFrame(mt5.copy_rates_range(symbol, timeframe, start_time, end_time))
                     rates['time'] = pd.to_datetime(rates['time'], unit='s')
                     return rates
                 else:
@@ -244,10 +322,35 @@ class Connector:
         """
         tick_info_list = []
         for symbol in symbols:
-            tick_info = mt5.symbol_info_tick(symbol)._asdict()
+            tick_info = mt5.symbol_info_tick(symbol)
             if tick_info is not None:
                 tick_info_list.append(tick_info)
-        return pd.concat(tick_info_list)
+        if not tick_info_list:
+            return pd.DataFrame()
+        return pd.DataFrame(tick_info_list, columns=tick_info_list[0]._fields)
+
+    @staticmethod
+    def snapshot(symbols):
+        """
+        Last tick of every symbol, read in one pass
+        :param symbols: (list of str) list of symbols
+        :return: (dict) {FIELD: ndarray} symbol, time_msc (ms since epoch), bid, ask, last, volume.
+                 Symbols without a tick have time_msc 0 and NaN prices.
+        """
+        n = len(symbols)
+        time_msc = np.zeros(n, dtype=np.int64)
+        prices = np.full((3, n), np.nan)
+        volume = np.zeros(n, dtype=np.float64)
+
+        for i, symbol in enumerate(symbols):
+            tick = mt5.symbol_info_tick(symbol)
+            if tick is not None:
+                time_msc[i] = tick.time_msc
+                prices[0, i], prices[1, i], prices[2, i] = tick.bid, tick.ask, tick.last
+                volume[i] = tick.volume_real
+
+        return {'symbol': np.array(symbols, dtype=object), 'time_msc': time_msc,
+                'bid': prices[0], 'ask': prices[1], 'last': prices[2], 'volume': volume}
 
     @staticmethod
     def _get_open_trades_count():
@@ -263,6 +366,30 @@ class Connector:
         """
         return mt5.positions_get(**kwargs)
 
+    @staticmethod
+    def position_book(book=None, symbols=None):
+        """
+        Open positions as a columnar PositionBook, marked at the current prices. Calls the terminal, run it on the
+        MT5 thread, e.g. gateway.run(Connector.position_book, None, symbols).
+        :param book: (PositionBook) (optional) book to reconcile with the terminal, default is a new one
+        :param symbols: (list of str) (optional) symbols traded later, registered with those of the open positions
+        :return: (PositionBook) keep it updated with open()/close() and ticks, sync again on a slow timer
+        """
+        if book is None:
+            book = PositionBook()
+        positions = mt5.positions_get()
+        symbols = sorted(set(symbols or ()) | {p.symbol for p in positions or ()})
+        contract_sizes = {}
+        for symbol in symbols:
+            info = SYMBOLS.get(symbol)
+            if info:
+                contract_sizes[symbol] = info['trade_contract_size']
+        book.register(contract_sizes)
+        book.sync(positions)
+        if symbols:
+            book.update_prices(Connector.snapshot(symbols))
+        return book
+
     def _select_symbol(self, symbols):
         """
         Adds input symbols to mt5 market watch
@@ -0,0 +1,197 @@
+"""
+Request/response correlation for commands sent to the Expert Advisor.
+
+Every command gets a request id and a concurrent.futures.Future. Responses arriving on
+the PULL socket are matched back to the pending request:
+    - exactly, by '_request_id', when the EA echoes the id back (see EAConnector tag_requests)
+    - otherwise FIFO per expected response key, which is safe because the EA answers the
+      commands of one kind in the order it received them.
+
+'ERROR' replies (malformed or unknown commands) name the rejected command instead of the
+response key, they fail the oldest request sent with that command.
+
+Without ids a command the EA ignores would hold the head of its FIFO queue forever and
+shift every later response of that kind onto the wrong request, so untagged requests need
+a timeout. A request failed by expire() stays in its queue as a tombstone that drops its
+late response instead of completing the next request of the same kind. Tombstones live
+for one more timeout period and are then reclaimed, so an expired request that is never
+answered stops shifting the matches of its key. A response carrying an unknown
+'_request_id' is dropped for the same reason.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+
+# TRADE action -> '_action' of the EA's response
+TRADE_RESPONSE_ACTIONS = {'OPEN': 'EXECUTION',
+                          'CLOSE': 'CLOSE',
+                          'CLOSE_PARTIAL': 'CLOSE',
+                          'CLOSE_MAGIC': 'CLOSE_ALL_MAGIC',
+                          'CLOSE_ALL': 'CLOSE_ALL',
+                          'MODIFY': 'MODIFY',
+                          'GET_OPEN_TRADES': 'OPEN_TRADES'}
+
+
+def response_key(response):
+    """
+    :param response: (dict) decoded PULL message
+    :return: (tuple) (ACTION, SYMBOL or None)
+    """
+    return response.get('_action'), response.get('_symbol')
+
+
+def as_awaitable(future, loop=None):
+    """
+    :param future: (Future) future returned by an EAConnector send_*() method
+    :param loop: (AbstractEventLoop) (optional) event loop the awaitable belongs to
+    :return: (asyncio.Future) awaitable resolving with the EA's response
+    """
+    return asyncio.wrap_future(future, loop=loop)
+
+
+class PendingRequests:
+    """
+    Thread-safe table of the requests waiting for a response.
+    """
+
+    def __init__(self, timeout=None, tombstone_ttl=None):
+        """
+        :param timeout: (float) (optional) seconds after which an unanswered request fails with TimeoutError
+        :param tombstone_ttl: (float) (optional) seconds an expired request waits for its late response before it
+                              is forgotten, default is timeout
+        """
+        self.timeout = timeout
+        self.tombstone_ttl = timeout if tombstone_ttl is None else tombstone_ttl
+
+        self._lock = Lock()
+        self._ids = count(1)
+        self._by_key = {}  # {(ACTION, SYMBOL): deque([REQUEST_ID, ...])}
+        self._by_id = {}  # {REQUEST_ID: (KEY, COMMAND, FUTURE, DEADLINE)}, FUTURE is None for expired requests
+        self._tombstones = 0
+
+    def __len__(self):
+        return len(self._by_id) - self._tombstones
+
+    def create(self, action, symbol=None, command=None):
+        """
+        :param action: (str) '_action' expected in the response
+        :param symbol: (str) (optional) '_symbol' expected in the response
+        :param command: (str) (optional) command name ('TRADE', 'HIST', ...) an 'ERROR' reply would name
+        :return: (tuple) (request id, Future)
+        """
+        future = Future()
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        key = (action, symbol)
+        with self._lock:
+            request_id = next(self._ids)
+            self._by_id[request_id] = (key, command, future, deadline)
+            self._by_key.setdefault(key, deque()).append(request_id)
+        future.request_id = request_id
+        return request_id, future
+
+    def _pop(self, request_id):
+        key, _, future, _ = self._by_id.pop(request_id)
+        queue = self._by_key[key]
+        queue.remove(request_id)
+        if not queue:
+            del self._by_key[key]
+        if future is None:
+            self._tombstones -= 1
+        return future
+
+    def _match(self, response, request_id):
+        """
+        :return: (int) id of the request response answers, None if there is none
+        """
+        if request_id is not None:
+            return request_id if request_id in self._by_id else None  # unknown: late response to a failed request
+
+        if response.get('_action') == 'ERROR':
+            # Commands are answered in order, so the rejected one is the oldest sent with that name
+            command = response.get('_command')
+            return min((i for i, entry in self._by_id.items() if entry[1] == command), default=None)
+
+        action, symbol = response_key(response)
+        queue = self._by_key.get((action, symbol)) or self._by_key.get((action, None))
+        return queue[0] if queue else None
+
+    def resolve(self, response):
+        """
+        Complete the request matching response, if any. An 'ERROR' reply fails it with RuntimeError.
+        :return: (Future) the completed future or None if nothing was waiting for this response
+        """
+        with self._lock:
+            request_id = response.get('_request_id')
+            try:
+                request_id = int(request_id) if request_id is not None else None
+            except (TypeError, ValueError):
+                request_id = None
+
+            request_id = self._match(response, request_id)
+            if request_id is None:
+                return None
+            future = self._pop(request_id)
+
+        if future is None:
+            return None  # absorbed by the tombstone of an expired request
+        if future.set_running_or_notify_cancel():
+            if response.get('_action') == 'ERROR':
+                reason = (str(response[k]) for k in ('_response', '_response_value') if response.get(k))
+                exc = RuntimeError('EA rejected {} command: {}'.format(response.get('_command'), ' '.join(reason)))
+                exc.response = response
+                future.set_exception(exc)
+            else:
+                future.set_result(response)
+        return future
+
+    def fail(self, request_id, exc):
+        """
+        Fail a pending request, e.g. when the command could not be sent
+        """
+        with self._lock:
+            if request_id not in self._by_id:
+                return
+            future = self._pop(request_id)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_exception(exc)
+
+    def next_deadline(self):
+        """
+        :return: (float) seconds until the earliest deadline or tombstone expiry, None if nothing can expire
+        """
+        with self._lock:
+            deadlines = [deadline for _, _, _, deadline in self._by_id.values() if deadline is not None]
+        return None if not deadlines else max(min(deadlines) - monotonic(), 0.0)
+
+    def expire(self):
+        """
+        Fail every request past its deadline with TimeoutError. The request is kept as a tombstone that absorbs
+        its late response for tombstone_ttl seconds, tombstones past that are forgotten.
+        """
+        now = monotonic()
+        expired = []
+        with self._lock:
+            for request_id, (key, command, future, deadline) in list(self._by_id.items()):
+                if deadline is None or deadline > now:
+                    continue
+                if future is None:
+                    self._pop(request_id)  # never answered
+                else:
+                    self._by_id[request_id] = (key, command, None, now + self.tombstone_ttl)
+                    self._tombstones += 1
+                    expired.append((request_id, future))
+        for request_id, future in expired:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(TimeoutError('No response to request {} within {}s'.format(request_id,
+                                                                                                self.timeout)))
+
+    def fail_all(self, exc):
+        with self._lock:
+            request_ids = list(self._by_id)
+        for request_id in request_ids:
+            self.fail(request_id, exc)
@@ -0,0 +1,251 @@
+"""
+Decoders for the responses received from the Expert Advisor on the PULL socket.
+
+The stock DWX EA formats its responses as Python-style dicts with single quotes, which
+is not valid JSON. DWXDecoder accepts both, without ever evaluating code. EAs patched to
+send strict JSON or msgpack can use the faster decoders below.
+
+HIST responses are handled separately by HistParser, which writes the bars straight into
+typed NumPy arrays instead of building one dict per bar.
+"""
+
+import ast
+import json
+import re
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+class JSONDecoder:
+    """
+    Strict JSON decoder (standard library).
+    """
+    name = 'json'
+    binary = False  # True if decode() expects bytes instead of str
+
+    def decode(self, msg):
+        return json.loads(msg)
+
+
+class DWXDecoder(JSONDecoder):
+    """
+    JSON decoder falling back to ast.literal_eval() for the single-quoted dicts sent by the stock DWX EA.
+    literal_eval only accepts literals, so unlike eval() it cannot run code.
+    """
+    name = 'dwx'
+
+    def decode(self, msg):
+        try:
+            return json.loads(msg)
+        except ValueError:
+            return ast.literal_eval(msg)
+
+
+class OrjsonDecoder(JSONDecoder):
+    """
+    Strict JSON decoder backed by orjson. Works on the raw bytes, skipping the utf-8 decode.
+    """
+    name = 'orjson'
+    binary = True
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('OrjsonDecoder requires the orjson package (pip install orjson)')
+
+    def decode(self, msg):
+        return orjson.loads(msg)
+
+
+class MsgpackDecoder(JSONDecoder):
+    """
+    Decoder for EAs that send msgpack encoded maps.
+    """
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('MsgpackDecoder requires the msgpack package (pip install msgpack)')
+
+    def decode(self, msg):
+        return msgpack.unpackb(msg, raw=False)
+
+
+DECODERS = {decoder.name: decoder for decoder in (JSONDecoder, DWXDecoder, OrjsonDecoder, MsgpackDecoder)}
+
+
+def get_decoder(decoder='dwx'):
+    """
+    :param decoder: (str or obj) decoder name ('json', 'dwx', 'orjson', 'msgpack') or an object with a
+                    decode(msg) method and a binary attribute
+    :return: (obj) decoder instance
+    """
+    if isinstance(decoder, str):
+        try:
+            return DECODERS[decoder]()
+        except KeyError:
+            raise ValueError('Unknown decoder {}, expected one of {}'.format(decoder, list(DECODERS)))
+    return decoder
+
+
+# Bar layout of HIST responses: [{'time': TIME, 'open': OPEN, ..., 'real_volume': REAL_VOLUME}, ...]
+HIST_FIELDS = (('time', np.int64),  # bar open time (s since epoch)
+               ('open', np.float64),
+               ('high', np.float64),
+               ('low', np.float64),
+               ('close', np.float64),
+               ('tick_volume', np.int64),
+               ('spread', np.int64),
+               ('real_volume', np.int64))
+
+_HIST_HEAD_RE = re.compile(r"""^\s*\{\s*['"]_action['"]\s*:\s*['"]HIST['"]""")
+_DATA_KEY_RE = re.compile(r"""['"]_data['"]\s*:\s*\[""")
+_HEADER_ITEM_RE = re.compile(r"""['"](\w+)['"]\s*:\s*(?:['"]([^'"]*)['"]|([^,}\s]+))""")
+_BAR_KEY_RE = re.compile(r"""['"](\w+)['"]\s*:""")
+_NUMBER_RE = re.compile(r""":\s*([-+0-9.eE]+)\s*[,}]""")
+_FIELD_RES = {name: re.compile(r"""['"]{}['"]\s*:\s*(?:['"]([^'"]*)['"]|([^,}}\s]+))""".format(name))
+              for name, _ in HIST_FIELDS}
+
+
+class HistParser:
+    """
+    Single pass parser for HIST responses.
+
+    The bar list is scanned in slices of ``chunk_bars`` bars and each field is converted to its
+    typed array in C, so memory stays bounded by one slice of strings plus the output arrays.
+    """
+
+    def __init__(self, decoder=None, chunk_bars=8192):
+        """
+        :param decoder: (obj) decoder used for non-HIST messages and HIST responses without bars
+        :param chunk_bars: (int) bars converted per slice
+        """
+        self.decoder = DWXDecoder() if decoder is None else decoder
+        self.chunk_bars = chunk_bars
+
+    @staticmethod
+    def is_hist(msg):
+        """ :return: (bool) True if msg is a HIST response """
+        if isinstance(msg, bytes):
+            msg = msg[:64].decode('utf-8', 'replace')
+        return _HIST_HEAD_RE.match(msg[:64]) is not None
+
+    def parse(self, msg):
+        """
+        :param msg: (str or bytes) HIST response
+        :return: (dict) the response header keys, with '_data' as {FIELD: ndarray} when bars were returned
+        """
+        if isinstance(msg, bytes):
+            msg = msg.decode('utf-8')
+
+        match = _DATA_KEY_RE.search(msg)
+        if match is None:
+            return self.decoder.decode(msg)
+
+        end = msg.rfind(']')
+        if end < match.end():
+            raise ValueError('Truncated HIST payload')
+
+        # Header keys ('_action', '_symbol', '_request_id', ...) sit before and after '_data'
+        header = self._parse_header(msg[:match.start()])
+        header.update(self._parse_header(msg[end + 1:]))
+        header['_data'] = self._parse_bars(msg, match.end(), end)
+        return header
+
+    @staticmethod
+    def _parse_header(text):
+        """ :return: (dict) the scalar 'key': value items of text """
+        header = {}
+        for key, quoted, raw in _HEADER_ITEM_RE.findall(text):
+            if quoted or not raw:
+                header[key] = quoted
+            else:
+                try:
+                    header[key] = ast.literal_eval(raw)
+                except (ValueError, SyntaxError):
+                    header[key] = raw
+        return header
+
+    def _parse_bars(self, msg, start, end):
+        n_bars = msg.count('}', start, end)
+        bars = {name: np.zeros(n_bars, dtype=dtype) for name, dtype in HIST_FIELDS}
+
+        # Key order of the first bar, used by the all-numeric fast path
+        first_end = msg.find('}', start, end)
+        keys = _BAR_KEY_RE.findall(msg, start, first_end) if first_end != -1 else []
+
+        filled = 0
+        pos = start
+        while pos < end and filled < n_bars:
+            # Cut the slice on a bar boundary
+            stop = pos
+            for _ in range(self.chunk_bars):
+                stop = msg.find('}', stop, end)
+                if stop == -1:
+                    stop = end
+                    break
+                stop += 1
+            chunk = msg[pos:stop]
+
+            n = self._parse_numeric_chunk(chunk, keys, bars, filled)
+            if n is not None:
+                filled += n
+                pos = stop
+                continue
+
+            n = None
+            for name, dtype in HIST_FIELDS:
+                values = _FIELD_RES[name].findall(chunk)
+                if not values:
+                    continue  # field not sent by this EA version, left at 0
+                if n is None:
+                    n = len(values)
+                elif len(values) != n:
+                    raise ValueError('Malformed HIST payload: inconsistent {} count'.format(name))
+                bars[name][filled:filled + n] = self._convert(name, values, dtype)
+
+            filled += n or 0
+            pos = stop
+
+        if filled != n_bars:
+            bars = {name: col[:filled] for name, col in bars.items()}
+        return bars
+
+    @staticmethod
+    def _parse_numeric_chunk(chunk, keys, bars, filled):
+        """
+        Fast path for bars made only of numbers in a fixed key order: one scan, one conversion.
+        :return: (int) n# of bars written, None if the chunk does not fit the fast path
+        """
+        if not keys:
+            return None
+        values = _NUMBER_RE.findall(chunk)
+        n, rest = divmod(len(values), len(keys))
+        if rest or n != chunk.count('}'):
+            return None
+
+        table = np.array(values).astype(np.float64).reshape(n, len(keys))
+        for i, key in enumerate(keys):
+            if key in bars:
+                bars[key][filled:filled + n] = table[:, i]
+        return n
+
+    @staticmethod
+    def _convert(name, values, dtype):
+        if name == 'time' and values[0][0]:
+            # MT 'YYYY.MM.DD HH:MM[:SS]' -> epoch seconds
+            iso = np.char.replace(np.char.replace(np.array([q for q, _ in values]), '.', '-'), ' ', 'T')
+            return iso.astype('datetime64[s]').astype(np.int64)
+
+        # Through float64 so that volumes sent as '12.0' are accepted too
+        return np.array([quoted or raw for quoted, raw in values]).astype(np.float64).astype(dtype)
@@ -0,0 +1,84 @@
+"""
+Symbol/kind routing of the SUB feed to handlers.
+
+The poll loop parses each SUB message once and asks the registry which handlers want
+that (symbol, kind). Routes are cached per (symbol, kind), so the cost of dispatching a
+message depends on the number of interested handlers and not on the total number of
+handlers registered.
+
+Handlers receive the parsed fields:
+    onTick(symbol, time_ns, bid, ask)
+    onRate(symbol, time_ns, bar_time, open, high, low, close, tick_volume, spread, real_volume)
+"""
+
+from threading import Lock
+
+
+TICK = 'tick'  # BID/ASK messages
+RATE = 'rate'  # TRACK_RATES messages
+KINDS = (TICK, RATE)
+
+
+class SubscriptionRegistry:
+    """
+    Maps (SYMBOL, KIND) to the handlers subscribed to it.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._subscriptions = []  # [(handler, frozenset of symbols or None for all, frozenset of kinds)]
+
+        # {(SYMBOL, KIND): (handler, ...)}. Replaced, never mutated, when subscriptions change so the poll
+        # thread can read it without locking.
+        self._routes = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def register(self, handler, symbols=None, kinds=KINDS):
+        """
+        :param handler: (obj) object implementing onTick() and/or onRate()
+        :param symbols: (list of str) (optional) symbols to receive, default is every symbol
+        :param kinds: (tuple of str) message kinds to receive, 'tick' and/or 'rate'
+        """
+        kinds = (kinds,) if isinstance(kinds, str) else tuple(kinds)
+        for kind in kinds:
+            if kind not in KINDS:
+                raise ValueError('Unknown message kind {}, expected one of {}'.format(kind, KINDS))
+            method = 'onTick' if kind == TICK else 'onRate'
+            if not hasattr(handler, method):
+                raise TypeError('{} handler must implement {}()'.format(kind, method))
+
+        symbols = None if symbols is None else frozenset([symbols] if isinstance(symbols, str) else symbols)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [(handler, symbols, frozenset(kinds))]
+            self._routes = {}
+
+    def unregister(self, handler):
+        """
+        Remove every subscription of handler
+        """
+        with self._lock:
+            self._subscriptions = [sub for sub in self._subscriptions if sub[0] is not handler]
+            self._routes = {}
+
+    def route(self, symbol, kind):
+        """
+        :return: (tuple) handlers subscribed to symbol's messages of the given kind
+        """
+        routes = self._routes
+        handlers = routes.get((symbol, kind))
+        if handlers is None:
+            handlers = tuple(dict.fromkeys(hnd for hnd, symbols, kinds in self._subscriptions
+                                           if kind in kinds and (symbols is None or symbol in symbols)))
+            # Only cache if the subscriptions did not change while building the route
+            with self._lock:
+                if routes is self._routes:
+                    routes[(symbol, kind)] = handlers
+        return handlers
+
+    def symbols(self):
+        """
+        :return: (set of str) symbols explicitly subscribed to (handlers subscribed to all symbols are not listed)
+        """
+        return set().union(*(symbols for _, symbols, _ in self._subscriptions if symbols is not None))
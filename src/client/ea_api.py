@@ -16,13 +16,22 @@
 
 
 import zmq
-from time import sleep
+from time import sleep, time_ns, perf_counter_ns
 from pandas import DataFrame, Timestamp
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import Future
 
 # 30-07-2019 10:58 CEST
 from zmq.utils.monitor import recv_monitor_message
 
+from src.client.correlation import PendingRequests, TRADE_RESPONSE_ACTIONS, as_awaitable
+from src.client.decoders import HistParser, get_decoder
+from src.client.dispatch import SubscriptionRegistry, TICK, RATE, KINDS
+from src.client.feed_capture import FeedCapture, SUB, PULL
+from src.client.latency import LatencyHistogram
+from src.client.market_hub import request_snapshot, snapshot_address
+from src.client.tick_store import TickStore
+
 
 # noinspection PyUnresolvedReferences
 class EAConnector:
@@ -39,11 +48,23 @@ class EAConnector:
                  sub_port=32770,  # Port for Subscribing for prices
                  delimiter=';',
                  pulldata_handlers=None,  # Handlers to process data received through PULL port.
-                 subdata_handlers=None,  # Handlers to process data received through SUB port.
+                 subdata_handlers=None,  # Handlers to process data received through SUB port (onSubData(msg) or
+                 #                         onSubDataBatch([msg, ...]) to get every message of a poll wakeup at once).
                  verbose=False,  # String delimiter
                  poll_timeout=1000,  # ZMQ Poller Timeout (ms)
                  sleep_delay=0.001,  # 1 ms for time.sleep()
-                 monitor=False):  # Experimental ZeroMQ Socket Monitoring
+                 monitor=False,  # Experimental ZeroMQ Socket Monitoring
+                 tick_capacity=100000,  # Ticks/rates kept per symbol in the tick store
+                 decoder='dwx',  # PULL message decoder ('json', 'dwx', 'orjson', 'msgpack' or an instance)
+                 low_latency=False,  # Block in the ZMQ poller only, no sleep_delay between polls
+                 sub_batch_size=1000,  # Max SUB messages drained per poll wakeup
+                 request_timeout=30.0,  # Seconds before an unanswered command's future fails (None: never, only
+                 #                        safe with tag_requests: an ignored untagged command shifts later matches)
+                 tag_requests=False,  # Append the request id to commands, for EAs that echo '_request_id'
+                 push_hwm=1000,  # Commands queued on the PUSH socket before sends fail (pipelining depth)
+                 capture_path=None,  # Log every raw SUB/PULL message to this file (see FeedCapture)
+                 hub_address=None,  # Read market data from a MarketDataHub at this address instead of sub_port
+                 hub_snapshot_address=None):  # Snapshot endpoint of that hub (default: see market_hub.snapshot_address)
 
         # Strategy Status (if this is False, ZeroMQ will not listen for data)
         if subdata_handlers is None:
@@ -71,6 +92,9 @@ class EAConnector:
         self._pulldata_handlers = pulldata_handlers
         self._subdata_handlers = subdata_handlers
 
+        # Handlers receiving parsed SUB data for the symbols/kinds they subscribed to (see add_subscriber())
+        self.subscriptions = SubscriptionRegistry()
+
         # Ports for PUSH, PULL and SUB sockets respectively
         self._PUSH_PORT = push_port
         self._PULL_PORT = pull_port
@@ -78,8 +102,9 @@ class EAConnector:
 
         # Create Sockets
         self._PUSH_SOCKET = self._ZMQ_CONTEXT.socket(zmq.PUSH)
-        self._PUSH_SOCKET.setsockopt(zmq.SNDHWM, 1)
+        self._PUSH_SOCKET.setsockopt(zmq.SNDHWM, push_hwm)
         self._PUSH_SOCKET_STATUS = {'state': True, 'latest_event': 'N/A'}
+        self._PUSH_LOCK = Lock()  # commands can be sent from several threads, ZMQ sockets are not thread safe
 
         self._PULL_SOCKET = self._ZMQ_CONTEXT.socket(zmq.PULL)
         self._PULL_SOCKET.setsockopt(zmq.RCVHWM, 1)
@@ -95,14 +120,33 @@ class EAConnector:
         self._PULL_SOCKET.connect(self._URL + str(self._PULL_PORT))
         print("[INIT] Listening for responses from METATRADER (PULL): " + str(self._PULL_PORT))
 
-        # Connect SUB Socket to receive market data from MetaTrader
-        print("[INIT] Listening for market data from METATRADER (SUB): " + str(self._SUB_PORT))
-        self._SUB_SOCKET.connect(self._URL + str(self._SUB_PORT))
-
-        # Initialize POLL set and register PULL and SUB sockets
+        # Connect SUB Socket to receive market data from MetaTrader, or from the local hub sharing its feed
+        self._hub_address = hub_address
+        if hub_address is None:
+            print("[INIT] Listening for market data from METATRADER (SUB): " + str(self._SUB_PORT))
+            self._SUB_SOCKET.connect(self._URL + str(self._SUB_PORT))
+        else:
+            print("[INIT] Listening for market data from MARKET HUB (SUB): " + hub_address)
+            self._SUB_SOCKET.connect(hub_address)
+        # DEALER socket asking the hub for last values, created on the first hub TRACK_PRICES
+        self._hub_snapshot_address = hub_snapshot_address or (
+            None if hub_address is None else snapshot_address(hub_address))
+        self._SNAPSHOT_SOCKET = None
+        self._SNAPSHOT_LOCK = Lock()
+
+        # Control PAIR sockets used to wake the poll thread up on shutdown
+        self._CONTROL_URL = "inproc://ea_control_{}".format(id(self))
+        self._CONTROL_SOCKET = self._ZMQ_CONTEXT.socket(zmq.PAIR)
+        self._CONTROL_SOCKET.bind(self._CONTROL_URL)
+        self._CONTROL_SENDER = self._ZMQ_CONTEXT.socket(zmq.PAIR)
+        self._CONTROL_SENDER.connect(self._CONTROL_URL)
+        self._CONTROL_LOCK = Lock()
+
+        # Initialize POLL set and register PULL, SUB and control sockets
         self._poller = zmq.Poller()
         self._poller.register(self._PULL_SOCKET, zmq.POLLIN)
         self._poller.register(self._SUB_SOCKET, zmq.POLLIN)
+        self._poller.register(self._CONTROL_SOCKET, zmq.POLLIN)
 
         # Start listening for responses to commands and new market data
         self._string_delimiter = delimiter
@@ -114,17 +158,19 @@ class EAConnector:
         self._PUSH_Monitor_Thread = None
         self._PULL_Monitor_Thread = None
 
-        # Market Data Dictionary by Symbol (holds tick data)
-        self.market_data_db = {}  # {SYMBOL: {TIMESTAMP: (BID, ASK)}}
-        self.market_data_df = DataFrame()
+        # Market Data ring buffers by Symbol (holds the latest tick_capacity ticks and rates)
+        self.tick_store = TickStore(capacity=tick_capacity)  # {SYMBOL: [TIME_NS, BID, ASK]}
 
         # Order Data Dictionary
         self.order_data_db = []
 
         # History Data Dictionary by Symbol (holds historic data of the last HIST request for each symbol)
-        self._History_DB = {}  # {SYMBOL_TF: [{'time': TIME, 'open': OPEN_PRICE, 'high': HIGH_PRICE,
-        #               'low': LOW_PRICE, 'close': CLOSE_PRICE, 'tick_volume': TICK_VOLUME,
-        #               'spread': SPREAD, 'real_volume': REAL_VOLUME}, ...]}
+        self._History_DB = {}  # {SYMBOL: {'time': ndarray, 'open': ndarray, 'high': ndarray, 'low': ndarray,
+        #               'close': ndarray, 'tick_volume': ndarray, 'spread': ndarray, 'real_volume': ndarray}}
+
+        # PULL message decoders (HIST responses are parsed straight into arrays)
+        self._decoder = get_decoder(decoder)
+        self._hist_parser = HistParser(self._decoder)
 
         # Temporary Order STRUCT for convenience wrappers later.
         self.temp_order_dict = self.generate_default_order_dict()
@@ -132,6 +178,10 @@ class EAConnector:
         # Thread returns the most recently received DATA block here
         self._thread_data_output = None
 
+        # Commands waiting for their response ({REQUEST_ID: Future})
+        self._requests = PendingRequests(timeout=request_timeout)
+        self._tag_requests = tag_requests
+
         # Verbosity
         self._verbose = verbose
 
@@ -141,6 +191,16 @@ class EAConnector:
         # Global Sleep Delay
         self._sleep_delay = sleep_delay
 
+        # Latency-optimized polling (no sleep between polls) and socket-readable -> handler latency (ns)
+        self._low_latency = low_latency
+        self.latency = LatencyHistogram()
+
+        # SUB messages read per wakeup, handed to handlers implementing onSubDataBatch(list) at once
+        self._sub_batch_size = max(int(sub_batch_size), 1)
+
+        # Raw feed log, replayed with FeedReplayer
+        self._capture = None if capture_path is None else FeedCapture(capture_path)
+
         # Begin polling for PULL / SUB data
         self._MarketData_Thread = Thread(target=self.poll_data,
                                          args=(self._string_delimiter,
@@ -190,8 +250,8 @@ class EAConnector:
 
         # Set INACTIVE
         self._ACTIVE = False
+        self._wake_poller()
 
-        # Get all threads to shutdown
         # Get all threads to shutdown
         if self._MarketData_Thread is not None:
             self._MarketData_Thread.join()
@@ -202,9 +262,16 @@ class EAConnector:
         if self._PULL_Monitor_Thread is not None:
             self._PULL_Monitor_Thread.join()
 
+        if self._capture is not None:
+            self._capture.close()
+
+        # Fail commands still waiting for a response
+        self._requests.fail_all(ConnectionAbortedError('EAConnector shut down before the response arrived'))
+
         # Unregister sockets from Poller
         self._poller.unregister(self._PULL_SOCKET)
         self._poller.unregister(self._SUB_SOCKET)
+        self._poller.unregister(self._CONTROL_SOCKET)
         print("\n++ [KERNEL] Sockets unregistered from ZMQ Poller()! ++")
 
         # Terminate context
@@ -217,20 +284,60 @@ class EAConnector:
         """
 
         self._ACTIVE = new_status
+        self._wake_poller()
         print("\n**\n[KERNEL] Setting Status to {} - Deactivating Threads.. please wait a bit.\n**".format(new_status))
 
+    def _wake_poller(self):
+        """
+        Interrupt a blocking poll in poll_data() through the inproc control socket
+        """
+        try:
+            with self._CONTROL_LOCK:
+                self._CONTROL_SENDER.send(b'WAKE', zmq.DONTWAIT)
+        except zmq.error.ZMQError:
+            pass  # a wake-up is already pending or the context is gone
+
     def remote_send(self, _socket, _data):
         """
         Function to send commands to MetaTrader (PUSH)
+        :return: (bool) True if the command was queued for sending
         """
         if self._PUSH_SOCKET_STATUS['state']:
             try:
-                _socket.send_string(_data, zmq.DONTWAIT)
+                with self._PUSH_LOCK:
+                    _socket.send_string(_data, zmq.DONTWAIT)
+                return True
             except zmq.error.Again:
                 print("\nResource timeout.. please try again.")
                 sleep(self._sleep_delay)
         else:
             print('\n[KERNEL] NO HANDSHAKE ON PUSH SOCKET.. Cannot SEND data')
+        return False
+
+    def _send_request(self, msg, _action, _symbol=None):
+        """
+        Send a command and register it as waiting for a response
+        :param _action: (str) '_action' of the expected response
+        :param _symbol: (str) (optional) '_symbol' of the expected response
+        :return: (Future) resolves with the decoded response
+        """
+        _request_id, _future = self._requests.create(_action, _symbol, msg.split(self._string_delimiter, 1)[0])
+        if self._tag_requests:
+            msg = msg + self._string_delimiter + str(_request_id)
+
+        if not self.remote_send(self._PUSH_SOCKET, msg):
+            self._requests.fail(_request_id, ConnectionError('Could not send command: ' + msg))
+        elif self._low_latency and self._requests.timeout is not None:
+            self._wake_poller()  # let the poll loop pick a finite timeout for the new deadline
+        return _future
+
+    @staticmethod
+    def awaitable(_future, loop=None):
+        """
+        Function to await a command's response from asyncio code,
+        e.g. response = await conn.awaitable(conn.send_hist_request('EURUSD'))
+        """
+        return as_awaitable(_future, loop)
 
     def get_response(self):
         return self._thread_data_output
@@ -249,13 +356,15 @@ class EAConnector:
         else:
             return isinstance(_input, _types)
 
-    def remote_recv(self, _socket):
+    def remote_recv(self, _socket, _binary=False):
         """
         Function to retrieve data from MetaTrader (PULL)
         """
 
         if self._PULL_SOCKET_STATUS['state']:
             try:
+                if _binary:
+                    return _socket.recv(zmq.DONTWAIT)
                 msg = _socket.recv_string(zmq.DONTWAIT)
                 return msg
             except zmq.error.Again:
@@ -266,6 +375,21 @@ class EAConnector:
 
         return None
 
+    def generate_default_order_dict(self):
+        """
+        Default TRADE order parameters, see send_command()
+        """
+        return {'_action': 'OPEN',
+                '_type': 0,
+                '_symbol': 'EURUSD',
+                '_price': 0.0,
+                '_SL': 500,  # SL/TP in POINTS, not pips.
+                '_TP': 500,
+                '_comment': self._ClientID,
+                '_lots': 0.01,
+                '_magic': 123456,
+                '_ticket': 0}
+
     def send_hist_request(self,
                           symbol='EURUSD',
                           timeframe=1440,
@@ -275,6 +399,8 @@ class EAConnector:
         Function to construct messages for sending HIST commands to MetaTrader
 
         Because of broker GMT offset _end time might have to be modified.
+
+        :return: (Future) resolves with the HIST response
         """
 
         msg = "{};{};{};{};{}".format('HIST',
@@ -284,27 +410,70 @@ class EAConnector:
                                       end)
 
         # Send via PUSH Socket
-        self.remote_send(self._PUSH_SOCKET, msg)
+        return self._send_request(msg, 'HIST', symbol)
 
     def send_trackprices_request(self, symbols=None):
         """
         Function to construct messages for sending TRACK_PRICES commands to
         MetaTrader for real-time price updates
+
+        :return: (Future) resolves with the TRACK_PRICES response
         """
 
         if symbols is None:
             symbols = ['EURUSD']
+
+        if self._hub_address is not None:
+            # The hub tracks the union of its consumers' subscriptions, a TRACK_PRICES from here would replace it
+            for s in symbols:
+                self._SUB_SOCKET.setsockopt_string(zmq.SUBSCRIBE, s)
+            _future = Future()
+            _future.set_result({'_action': 'TRACK_PRICES', '_data': {'symbol_count': len(symbols)}, '_hub': True,
+                                '_snapshot': self._hub_snapshot(symbols)})
+            return _future
         msg = 'TRACK_PRICES'
         for s in symbols:
             msg = msg + ";{}".format(s)
 
         # Send via PUSH Socket
-        self.remote_send(self._PUSH_SOCKET, msg)
+        return self._send_request(msg, 'TRACK_PRICES')
+
+    def _hub_snapshot(self, symbols):
+        """
+        Last values the hub holds for symbols, requested after subscribing so no tick falls in between.
+        They are not ticks: the tick store and the handlers only receive the feed.
+
+        :return: (dict) {SYMBOL: (BID, ASK)} or {SYMBOL_TF: rate fields}, empty if the hub did not answer
+        """
+        with self._SNAPSHOT_LOCK:
+            if self._SNAPSHOT_SOCKET is None:
+                self._SNAPSHOT_SOCKET = self._ZMQ_CONTEXT.socket(zmq.DEALER)
+                self._SNAPSHOT_SOCKET.setsockopt(zmq.LINGER, 0)
+                self._SNAPSHOT_SOCKET.connect(self._hub_snapshot_address)
+            _values = request_snapshot(self._SNAPSHOT_SOCKET, symbols)
+            if _values is None:
+                # A late reply would answer the next request, start over with a new socket
+                print("[KERNEL] No snapshot from MARKET HUB at " + self._hub_snapshot_address)
+                self._SNAPSHOT_SOCKET.close(0)
+                self._SNAPSHOT_SOCKET = None
+                return {}
+
+        _snapshot = {}
+        for _topic, _data in _values.items():
+            _fields = _data.split(self._string_delimiter)
+            if len(_fields) == 2:
+                _snapshot[_topic] = (float(_fields[0]), float(_fields[1]))
+            elif len(_fields) == 8:
+                _snapshot[_topic] = (int(_fields[0]), float(_fields[1]), float(_fields[2]), float(_fields[3]),
+                                     float(_fields[4]), int(_fields[5]), int(_fields[6]), int(_fields[7]))
+        return _snapshot
 
     def send_trackrates_request(self, instruments=None):
         """
         Function to construct messages for sending TRACK_RATES commands to
         MetaTrader for OHLC
+
+        :return: (Future) resolves with the TRACK_RATES response
         """
         if instruments is None:
             instruments = [('EURUSD_M1', 'EURUSD', 1)]
@@ -314,7 +483,7 @@ class EAConnector:
             msg = msg + ";{};{}".format(i[1], i[2])
 
         # Send via PUSH Socket
-        self.remote_send(self._PUSH_SOCKET, msg)
+        return self._send_request(msg, 'TRACK_RATES')
 
     def send_command(self, _action='OPEN', _type=0,
                      _symbol='EURUSD', _price=0.0,
@@ -348,6 +517,8 @@ class EAConnector:
         compArray[8] = Lots
         compArray[9] = Magic Number
         compArray[10] = Ticket Number (MODIFY/CLOSE)
+
+        Returns a Future resolving with the EA's response (EXECUTION, CLOSE, MODIFY, ...)
         """
 
         msg = "{};{};{};{};{};{};{};{};{};{};{}".format('TRADE', _action, _type,
@@ -357,20 +528,38 @@ class EAConnector:
                                                         _ticket)
 
         # Send via PUSH Socket
-        self.remote_send(self._PUSH_SOCKET, msg)
+        return self._send_request(msg, TRADE_RESPONSE_ACTIONS.get(_action, _action))
 
     def poll_data(self,
                   string_delimiter=';',
                   poll_timeout=1000):
         """
         Function to check Poller for new responses (PULL) and market data (SUB)
+
+        In low latency mode the thread only blocks inside the ZMQ poller (no sleep, no timeout) and is woken up
+        for shutdown through the inproc control socket.
         """
 
         while self._ACTIVE:
 
-            sleep(self._sleep_delay)  # poll timeout is in ms, sleep() is s.
+            if not self._low_latency:
+                sleep(self._sleep_delay)  # poll timeout is in ms, sleep() is s.
+                _timeout = poll_timeout
+            else:
+                # Block until data arrives, or until the next request deadline
+                _deadline = self._requests.next_deadline() if self._requests else None
+                _timeout = -1 if _deadline is None else int(_deadline * 1000) + 1
+
+            sockets = dict(self._poller.poll(_timeout))
+            _ready = perf_counter_ns()
 
-            sockets = dict(self._poller.poll(poll_timeout))
+            if self._requests:
+                self._requests.expire()
+
+            # Wake-up call from zmq_shutdown() / _setStatus(), re-check self._ACTIVE
+            if self._CONTROL_SOCKET in sockets:
+                self._CONTROL_SOCKET.recv()
+                continue
 
             # Process response to commands sent to MetaTrader
             if self._PULL_SOCKET in sockets and sockets[self._PULL_SOCKET] == zmq.POLLIN:
@@ -379,95 +568,163 @@ class EAConnector:
                     try:
 
                         # msg = self._PULL_SOCKET.recv_string(zmq.DONTWAIT)
-                        msg = self.remote_recv(self._PULL_SOCKET)
+                        msg = self.remote_recv(self._PULL_SOCKET, self._decoder.binary)
 
                         # If data is returned, store as pandas Series
-                        if msg != '' and msg is not None:
-
-                            try:
-                                _data = eval(msg)
-
-                                if _data['_action'] == 'HIST':
-                                    _symbol = _data['_symbol']
-                                    if '_data' in _data.keys():
-                                        if _symbol not in self._History_DB.keys():
-                                            self._History_DB[_symbol] = {}
-                                        self._History_DB[_symbol] = _data['_data']
-                                    else:
-                                        print(
-                                            'No data found. MT4 often needs multiple requests when accessing data of symbols without open charts.')
-                                        print('message: ' + msg)
-
-                                # invokes data handlers on pull port
-                                for hnd in self._pulldata_handlers:
-                                    hnd.onPullData(_data)
-
-                                self._thread_data_output = _data
-                                if self._verbose:
-                                    print(_data)  # default logic
-
-                            except Exception as ex:
-                                _exstr = "Exception Type {0}. Args:\n{1!r}"
-                                _msg = _exstr.format(type(ex).__name__, ex.args)
-                                print(_msg)
+                        if msg:
+                            if self._capture is not None:
+                                self._capture.write(PULL, msg)
+                            self._process_pull(msg, _ready)
 
                     except zmq.error.Again:
                         pass  # resource temporarily unavailable, nothing to print
-                    except ValueError:
-                        pass  # No data returned, passing iteration.
-                    except UnboundLocalError:
-                        pass  # _symbol may sometimes get referenced before being assigned.
 
                 else:
                     print('\r[KERNEL] NO HANDSHAKE on PULL SOCKET.. Cannot READ data.', end='', flush=True)
 
-            # Receive new market data from MetaTrader
+            # Receive new market data from MetaTrader, draining up to _sub_batch_size queued messages
             if self._SUB_SOCKET in sockets and sockets[self._SUB_SOCKET] == zmq.POLLIN:
 
-                try:
-                    msg = self._SUB_SOCKET.recv_string(zmq.DONTWAIT)
-                    if msg != "":
-
-                        _timestamp = str(Timestamp.now('UTC'))[:-6]
-                        _symbol, _data = msg.split(" ")
-                        if len(_data.split(string_delimiter)) == 2:
-                            _bid, _ask = _data.split(string_delimiter)
-
-                            if self._verbose:
-                                print("\n[" + _symbol + "] " + _timestamp + " (" + _bid + "/" + _ask + ") BID/ASK")
-
-                            # Update Market Data DB
-                            if _symbol not in self.market_data_db.keys():
-                                self.market_data_db[_symbol] = {}
-
-                            self.market_data_db[_symbol][_timestamp] = (float(_bid), float(_ask))
-
-                        elif len(_data.split(string_delimiter)) == 8:
-                            _time, _open, _high, _low, _close, _tick_vol, _spread, _real_vol = _data.split(
-                                string_delimiter)
-                            if self._verbose:
-                                print(
-                                    "\n[" + _symbol + "] " + _timestamp + " (" + _time + "/" + _open + "/" + _high + "/" + _low + "/" + _close + "/" + _tick_vol + "/" + _spread + "/" + _real_vol + ") TIME/OPEN/HIGH/LOW/CLOSE/TICKVOL/SPREAD/VOLUME")
-                            # Update Market Rate DB
-                            if _symbol not in self.market_data_db.keys():
-                                self.market_data_db[_symbol] = {}
-                            self.market_data_db[_symbol][_timestamp] = (
-                                int(_time), float(_open), float(_high), float(_low), float(_close), int(_tick_vol),
-                                int(_spread), int(_real_vol))
-
-                        # invokes data handlers on sub port
-                        for hnd in self._subdata_handlers:
-                            hnd.onSubData(msg)
-
-                except zmq.error.Again:
-                    pass  # resource temporarily unavailable, nothing to print
-                except ValueError:
-                    pass  # No data returned, passing iteration.
-                except UnboundLocalError:
-                    pass  # _symbol may sometimes get referenced before being assigned.
+                _batch_handlers = [hnd for hnd in self._subdata_handlers if hasattr(hnd, 'onSubDataBatch')]
+                _msg_handlers = [hnd for hnd in self._subdata_handlers if not hasattr(hnd, 'onSubDataBatch')]
+                _batch = []
+
+                for _ in range(self._sub_batch_size):
+                    try:
+                        if self._hub_address is None:
+                            msg = self._SUB_SOCKET.recv_string(zmq.DONTWAIT)
+                        else:
+                            # [SYMBOL, DATA] frames, see MarketDataHub
+                            msg = " ".join(f.decode('utf-8') for f in self._SUB_SOCKET.recv_multipart(zmq.DONTWAIT))
+                        if msg != "":
+                            if self._capture is not None:
+                                # Same receive time in the log and in the tick store, so replays match
+                                _timestamp = time_ns()
+                                self._capture.write(SUB, msg, _timestamp)
+                                self._process_sub(msg, string_delimiter, _ready, _msg_handlers, _timestamp)
+                            else:
+                                self._process_sub(msg, string_delimiter, _ready, _msg_handlers)
+                            _batch.append(msg)
+
+                    except zmq.error.Again:
+                        break  # SUB queue drained
+                    except ValueError:
+                        pass  # No data returned, passing iteration.
+                    except UnboundLocalError:
+                        pass  # _symbol may sometimes get referenced before being assigned.
+
+                # invokes batch data handlers on sub port
+                if _batch:
+                    for hnd in _batch_handlers:
+                        hnd.onSubDataBatch(_batch)
 
         print("\n++ [KERNEL] poll_data() Signing Out ++")
 
+    def _process_pull(self, msg, _ready=None):
+        """
+        Decode a response received on the PULL socket, store it and invoke the PULL data handlers
+        :param _ready: (int) perf_counter_ns() when the socket was found readable, for the latency histogram
+        """
+
+        try:
+            if self._hist_parser.is_hist(msg):
+                _data = self._hist_parser.parse(msg)
+            else:
+                _data = self._decoder.decode(msg)
+
+            try:
+                if _data['_action'] == 'HIST':
+                    _symbol = _data['_symbol']
+                    if '_data' in _data.keys():
+                        if _symbol not in self._History_DB.keys():
+                            self._History_DB[_symbol] = {}
+                        self._History_DB[_symbol] = _data['_data']
+                    else:
+                        print(
+                            'No data found. MT4 often needs multiple requests when accessing data of symbols without open charts.')
+                        print('message: ' + str(msg))
+
+                if _ready is not None:
+                    self.latency.record(perf_counter_ns() - _ready)
+
+                # invokes data handlers on pull port
+                for hnd in self._pulldata_handlers:
+                    hnd.onPullData(_data)
+
+                self._thread_data_output = _data
+                if self._verbose:
+                    print(_data)  # default logic
+            finally:
+                # completes the future of the matching command, even if a handler raised
+                self._requests.resolve(_data)
+
+        except Exception as ex:
+            _exstr = "Exception Type {0}. Args:\n{1!r}"
+            _msg = _exstr.format(type(ex).__name__, ex.args)
+            print(_msg)
+
+    def _process_sub(self, msg, string_delimiter=';', _ready=None, _handlers=None, _timestamp=None):
+        """
+        Parse a message received on the SUB socket into the tick store and invoke the SUB data handlers
+        :param _ready: (int) perf_counter_ns() when the socket was found readable, for the latency histogram
+        :param _handlers: (list) handlers to call with onSubData(msg), default is every SUB data handler
+        :param _timestamp: (int) receive time (ns since epoch), default is now (replays pass the recorded one)
+        """
+
+        if _timestamp is None:
+            _timestamp = time_ns()
+        _symbol, _data = msg.split(" ")
+        _fields = _data.split(string_delimiter)
+        if len(_fields) == 2:
+            _bid, _ask = _fields
+
+            if self._verbose:
+                print("\n[" + _symbol + "] " + str(Timestamp(_timestamp)) + " (" + _bid + "/" + _ask + ") BID/ASK")
+
+            # Update Market Data DB
+            _bid, _ask = float(_bid), float(_ask)
+            self.tick_store.append_tick(_symbol, _timestamp, _bid, _ask)
+
+            for hnd in self.subscriptions.route(_symbol, TICK):
+                hnd.onTick(_symbol, _timestamp, _bid, _ask)
+
+        elif len(_fields) == 8:
+            _time, _open, _high, _low, _close, _tick_vol, _spread, _real_vol = _fields
+            if self._verbose:
+                print(
+                    "\n[" + _symbol + "] " + str(Timestamp(_timestamp)) + " (" + _time + "/" + _open + "/" + _high + "/" + _low + "/" + _close + "/" + _tick_vol + "/" + _spread + "/" + _real_vol + ") TIME/OPEN/HIGH/LOW/CLOSE/TICKVOL/SPREAD/VOLUME")
+            # Update Market Rate DB
+            _rate = (int(_time), float(_open), float(_high), float(_low),
+                     float(_close), int(_tick_vol), int(_spread), int(_real_vol))
+            self.tick_store.append_rate(_symbol, _timestamp, *_rate)
+
+            for hnd in self.subscriptions.route(_symbol, RATE):
+                hnd.onRate(_symbol, _timestamp, *_rate)
+
+        if _ready is not None:
+            self.latency.record(perf_counter_ns() - _ready)
+
+        # invokes data handlers on sub port
+        for hnd in (self._subdata_handlers if _handlers is None else _handlers):
+            hnd.onSubData(msg)
+
+    def add_subscriber(self, handler, symbols=None, kinds=KINDS):
+        """
+        Function to route parsed market data of the given symbols to handler.
+        Ticks are passed to handler.onTick(symbol, time_ns, bid, ask) and rates to
+        handler.onRate(symbol, time_ns, bar_time, open, high, low, close, tick_volume, spread, real_volume)
+
+        :param symbols: (list of str) (optional) symbols to receive, default is every symbol
+        :param kinds: (tuple of str) 'tick' and/or 'rate'
+        """
+        self.subscriptions.register(handler, symbols, kinds)
+
+    def remove_subscriber(self, handler):
+        """
+        Function to stop routing market data to handler
+        """
+        self.subscriptions.unregister(handler)
+
     def subscribe_marketdata(self,
                              symbol='EURUSD'):
         """
@@ -477,7 +734,7 @@ class EAConnector:
         # Subscribe to SYMBOL first.
         self._SUB_SOCKET.setsockopt_string(zmq.SUBSCRIBE, symbol)
 
-        print("[KERNEL] Subscribed to {} BID/ASK updates. See self.market_data_db.".format(symbol))
+        print("[KERNEL] Subscribed to {} BID/ASK updates. See self.tick_store.".format(symbol))
 
     def unsubscribe_marketdata(self, _symbol):
         """
@@ -493,7 +750,7 @@ class EAConnector:
         """
 
         # 31-07-2019 12:22 CEST
-        for _symbol in self.market_data_db.keys():
+        for _symbol in self.tick_store.symbols():
             self.unsubscribe_marketdata(_symbol=_symbol)
 
     def zmq_event_monitor(self,
@@ -503,7 +760,8 @@ class EAConnector:
         # 05-08-2019 11:21 CEST
         while self._ACTIVE:
 
-            sleep(self._sleep_delay)  # poll timeout is in ms, sleep() is s.
+            if not self._low_latency:
+                sleep(self._sleep_delay)  # poll timeout is in ms, sleep() is s.
 
             # while monitor_socket.poll():
             while monitor_socket.poll(self._poll_timeout):
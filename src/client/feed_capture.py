@@ -0,0 +1,247 @@
+"""
+Binary capture and replay of the raw EAConnector feed.
+
+FeedCapture appends every message received on the SUB and PULL sockets, with its
+receive time, to a memory-mapped log file. A write costs one struct.pack_into() and one
+slice copy into the mapping, and the file is grown by doubling.
+
+Layout (little endian):
+    header   8s magic b'MT5FEED1', Q end offset of the last complete record
+    record   q receive time (ns since epoch), B channel (SUB or PULL), I payload length, payload bytes
+
+The end offset is updated after each record, so a log cut short by a crash is read up to
+its last complete record.
+
+FeedReplayer pushes a log back through EAConnector._process_sub() / _process_pull(),
+the same parsing, tick store and handler path as live data. It runs at real time, at N
+times real time, or as fast as possible.
+"""
+
+import mmap
+import os
+import struct
+from threading import Event, Lock
+from time import perf_counter_ns, sleep, time_ns
+
+
+MAGIC = b'MT5FEED1'
+HEADER = struct.Struct('<8sQ')
+RECORD = struct.Struct('<qBI')
+
+SUB = 0
+PULL = 1
+CHANNELS = {SUB: 'SUB', PULL: 'PULL'}
+
+
+class FeedCapture:
+
+    def __init__(self, path, initial_size=64 * 1024 * 1024):
+        """
+        :param path: (str) log file, appended to if it exists
+        :param initial_size: (int) bytes mapped up front for a new file
+        """
+        self.path = path
+        self._lock = Lock()
+        self.messages = 0
+
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(max(int(initial_size), HEADER.size + RECORD.size))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        if exists:
+            magic, self._end = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                self._map.close()
+                self._file.close()
+                raise ValueError('{} is not a feed capture file'.format(path))
+        else:
+            self._end = HEADER.size
+            HEADER.pack_into(self._map, 0, MAGIC, self._end)
+
+    def write(self, channel, payload, timestamp=None):
+        """
+        :param channel: (int) SUB or PULL
+        :param payload: (str or bytes) message as received
+        :param timestamp: (int) (optional) receive time (ns since epoch), default is now
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        size = RECORD.size + len(payload)
+
+        with self._lock:
+            if self._map is None:
+                return
+            end = self._end
+            if end + size > len(self._map):
+                self._grow(end + size)
+            RECORD.pack_into(self._map, end, time_ns() if timestamp is None else timestamp, channel, len(payload))
+            self._map[end + RECORD.size:end + size] = payload
+            self._end = end + size
+            struct.pack_into('<Q', self._map, 8, self._end)
+            self.messages += 1
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    @property
+    def size(self):
+        """ Bytes written, header included """
+        return self._end
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        """
+        Flush the log and trim the file to its content
+        """
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.truncate(self._end)
+            self._file.close()
+
+
+class FeedReader:
+    """
+    Sequential reader of a capture file (memory-mapped, records are zero-copy memoryviews)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.end = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('{} is not a feed capture file'.format(path))
+
+    def __iter__(self):
+        """
+        :return: (iterator) (TIME_NS, CHANNEL, memoryview payload)
+        """
+        view = memoryview(self._map)
+        offset = HEADER.size
+        try:
+            while offset + RECORD.size <= self.end:
+                timestamp, channel, length = RECORD.unpack_from(self._map, offset)
+                start = offset + RECORD.size
+                yield timestamp, channel, view[start:start + length]
+                offset = start + length
+        finally:
+            view.release()
+
+    def count(self):
+        """ :return: (dict) {CHANNEL NAME: n# of messages} """
+        counts = {name: 0 for name in CHANNELS.values()}
+        for _, channel, _ in self:
+            counts[CHANNELS[channel]] += 1
+        return counts
+
+    def close(self):
+        self._map.close()
+
+
+class FeedReplayer:
+
+    def __init__(self, conn, path, speed=1.0, channels=(SUB, PULL)):
+        """
+        :param conn: (EAConnector) connector whose parsing and handlers receive the messages
+        :param path: (str) capture file
+        :param speed: (float) 1.0 for real time, N for N times faster, None or 0 for as fast as possible
+        :param channels: (tuple of int) channels to replay
+        """
+        self.conn = conn
+        self.path = path
+        self.speed = speed
+        self.channels = frozenset(channels)
+        self._stop = Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """
+        Replay the whole log in the calling thread. SUB messages go through the same handlers as in poll_data():
+        onSubData() per message, and onSubDataBatch() with the messages read in a row, until the next PULL message,
+        a wait for the schedule or the connector's sub_batch_size.
+        :return: (dict) messages replayed, wall time (s), messages/s and max lag behind schedule (ms)
+        """
+        conn = self.conn
+        binary_pull = conn._decoder.binary
+        delimiter = conn._string_delimiter
+        batch_size = conn._sub_batch_size
+        batch_handlers = [hnd for hnd in conn._subdata_handlers if hasattr(hnd, 'onSubDataBatch')]
+        msg_handlers = [hnd for hnd in conn._subdata_handlers if not hasattr(hnd, 'onSubDataBatch')]
+        reader = FeedReader(self.path)
+
+        replayed = 0
+        max_lag = 0
+        first = None
+        batch = []
+        start = perf_counter_ns()
+        records = iter(reader)
+        try:
+            for timestamp, channel, payload in records:
+                if self._stop.is_set():
+                    break
+                if channel not in self.channels:
+                    continue
+
+                if self.speed:
+                    if first is None:
+                        first = timestamp
+                    due = (timestamp - first) / self.speed
+                    ahead = due - (perf_counter_ns() - start)
+                    if ahead > 0:
+                        self._flush(batch, batch_handlers)
+                        sleep(ahead / 1e9)
+                    else:
+                        max_lag = max(max_lag, -ahead)
+
+                msg = bytes(payload)
+                payload = None  # no view left on the mapping when it gets closed
+                if channel == SUB:
+                    msg = msg.decode('utf-8')
+                    try:
+                        conn._process_sub(msg, delimiter, None, msg_handlers, timestamp)
+                        batch.append(msg)
+                    except ValueError:
+                        pass  # malformed message, skipped like in poll_data()
+                    except UnboundLocalError:
+                        pass
+                    if len(batch) >= batch_size:
+                        self._flush(batch, batch_handlers)
+                else:
+                    self._flush(batch, batch_handlers)
+                    conn._process_pull(msg if binary_pull else msg.decode('utf-8'))
+                replayed += 1
+            self._flush(batch, batch_handlers)
+        finally:
+            records.close()
+            reader.close()
+
+        elapsed = (perf_counter_ns() - start) / 1e9
+        return {'messages': replayed, 'seconds': elapsed,
+                'rate': replayed / elapsed if elapsed > 0 else 0.0, 'max_lag_ms': max_lag / 1e6}
+
+    @staticmethod
+    def _flush(batch, handlers):
+        """ Invoke the batch data handlers with the SUB messages replayed since the last flush """
+        if batch:
+            for hnd in handlers:
+                hnd.onSubDataBatch(list(batch))
+            batch.clear()
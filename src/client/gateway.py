@@ -0,0 +1,185 @@
+"""
+Single-threaded gateway to the MetaTrader5 session.
+
+The MetaTrader5 package is not safe to call from several threads, so every call goes
+through one dedicated thread. Callers get a Future back. Calls wait in a priority queue:
+order sends and cancels run first, then info queries, then history downloads. Calls with
+the same priority keep their submission order. Callables given to run() carry their
+priority with call_priority(), e.g. Connector.send_order is always an order call.
+
+Identical read calls (same function and arguments) that are queued or running at the same
+time share one terminal call and its Future, e.g. many traders asking for
+positions_get() at once.
+"""
+
+from concurrent.futures import Future
+from itertools import count
+from queue import PriorityQueue
+from threading import Lock, Thread
+
+
+PRIORITY_ORDER = 0
+PRIORITY_INFO = 1
+PRIORITY_HISTORY = 2
+
+# Calls that change the terminal state, never merged
+WRITE_CALLS = frozenset(('order_send', 'symbol_select', 'initialize', 'login', 'shutdown', 'market_book_add',
+                         'market_book_release'))
+ORDER_CALLS = frozenset(('order_send', 'order_check'))
+HISTORY_CALLS = frozenset(('copy_rates_from', 'copy_rates_from_pos', 'copy_rates_range', 'copy_ticks_from',
+                           'copy_ticks_range', 'history_orders_total', 'history_orders_get',
+                           'history_deals_total', 'history_deals_get'))
+
+_STOP = object()
+
+
+def default_priority(name):
+    """
+    :param name: (str) MetaTrader5 function name
+    :return: (int) PRIORITY_ORDER, PRIORITY_INFO or PRIORITY_HISTORY
+    """
+    if name in ORDER_CALLS:
+        return PRIORITY_ORDER
+    if name in HISTORY_CALLS:
+        return PRIORITY_HISTORY
+    return PRIORITY_INFO
+
+
+def call_priority(priority):
+    """
+    Decorator setting the priority run() gives a callable when none is passed
+    :param priority: (int) PRIORITY_*
+    """
+    def tag(fn):
+        fn.gateway_priority = priority
+        return fn
+    return tag
+
+
+class MT5Gateway:
+
+    def __init__(self, source=None, name='MT5_Gateway'):
+        """
+        :param source: (module) (optional) the MetaTrader5 module (or a stand-in), imported by default
+        :param name: (str) name of the gateway thread
+        """
+        if source is None:
+            import MetaTrader5 as source
+        self.source = source
+
+        self._queue = PriorityQueue()
+        self._seq = count()
+        self._lock = Lock()
+        self._inflight = {}  # {(NAME, ARGS, KWARGS): Future} of mergeable calls not finished yet
+        self._closed = False
+
+        # Metrics
+        self.executed = 0
+        self.coalesced = 0
+
+        self._thread = Thread(name=name, target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """ Number of calls waiting in the queue """
+        return self._queue.qsize()
+
+    def submit(self, name, *args, priority=None, **kwargs):
+        """
+        Queue a call to a MetaTrader5 function
+        :param name: (str) function name, i.e. 'positions_get'
+        :param priority: (int) (optional) PRIORITY_*, default depends on the function (see default_priority())
+        :return: (Future) the function's return value
+        """
+        if priority is None:
+            priority = default_priority(name)
+
+        key = None
+        if name not in WRITE_CALLS:
+            try:
+                key = (name, args, tuple(sorted(kwargs.items())))
+                hash(key)
+            except TypeError:
+                key = None
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('[MT5_GATEWAY] gateway is shut down')
+            if key is not None:
+                future = self._inflight.get(key)
+                if future is not None:
+                    self.coalesced += 1
+                    return future
+
+            future = Future()
+            if key is not None:
+                self._inflight[key] = future
+            self._queue.put((priority, next(self._seq), (getattr(self.source, name), args, kwargs, future, key)))
+        return future
+
+    def run(self, fn, *args, priority=None, **kwargs):
+        """
+        Queue any callable that uses the MetaTrader5 session, i.e. a Connector method
+        :param fn: (callable)
+        :param priority: (int) (optional) PRIORITY_*, default is the one fn was tagged with (see call_priority()),
+                         PRIORITY_INFO for untagged callables
+        :return: (Future) fn's return value
+        """
+        if priority is None:
+            priority = getattr(fn, 'gateway_priority', PRIORITY_INFO)
+
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('[MT5_GATEWAY] gateway is shut down')
+            self._queue.put((priority, next(self._seq), (fn, args, kwargs, future, None)))
+        return future
+
+    def call(self, name, *args, timeout=None, **kwargs):
+        """
+        Blocking submit()
+        :param timeout: (float) (optional) seconds to wait for the result
+        :return: the function's return value
+        """
+        return self.submit(name, *args, **kwargs).result(timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting calls. Calls already queued still run before the thread exits.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # After every queued call, whatever its priority
+            self._queue.put((PRIORITY_HISTORY + 1, next(self._seq), _STOP))
+        if wait:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            _, _, item = self._queue.get()
+            if item is _STOP:
+                break
+
+            fn, args, kwargs, future, key = item
+            if not future.set_running_or_notify_cancel():
+                self._release(key)
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as ex:
+                self._release(key)
+                future.set_exception(ex)
+            else:
+                # Released before the result is set, so later callers never get a finished Future
+                self._release(key)
+                future.set_result(result)
+            self.executed += 1
+
+    def _release(self, key):
+        if key is not None:
+            with self._lock:
+                self._inflight.pop(key, None)
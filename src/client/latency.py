@@ -0,0 +1,102 @@
+"""
+Latency histogram for the EAConnector poll loop.
+"""
+
+from threading import Lock
+
+
+# Each power of two is split in 2 ** _SUB_BITS buckets (~25% relative resolution)
+_SUB_BITS = 2
+_SUB_COUNT = 1 << _SUB_BITS
+_N_BUCKETS = _SUB_COUNT + 64 * _SUB_COUNT
+
+
+def _bucket(value):
+    if value < _SUB_COUNT:
+        return max(value, 0)
+    shift = value.bit_length() - _SUB_BITS - 1
+    return _SUB_COUNT + shift * _SUB_COUNT + ((value >> shift) & (_SUB_COUNT - 1))
+
+
+def _bucket_upper(idx):
+    if idx < _SUB_COUNT:
+        return idx
+    shift, sub = divmod(idx - _SUB_COUNT, _SUB_COUNT)
+    return (((_SUB_COUNT | sub) + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds.
+
+    record() is a couple of integer operations so it can run on the poll thread for every
+    message. Percentiles are reported as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self):
+        self._counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._lock = Lock()  # guards merge()/reset() against readers, record() stays lock-free
+
+    def record(self, value_ns):
+        self._counts[_bucket(value_ns)] += 1
+        self.count += 1
+        self.total += value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+        if self.min is None or value_ns < self.min:
+            self.min = value_ns
+
+    def percentile(self, pct):
+        """
+        :param pct: (float) percentile between 0 and 100
+        :return: (int) latency in ns, 0 if nothing was recorded
+        """
+        if self.count == 0:
+            return 0
+        rank = max(int(round(self.count * pct / 100.0)), 1)
+        seen = 0
+        for idx, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_upper(idx), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: (dict) count, mean, p50, p90, p99, p99.9 and max latency in microseconds
+        """
+        mean = self.total / self.count if self.count else 0
+        return {'count': self.count,
+                'mean_us': mean / 1e3,
+                'p50_us': self.percentile(50) / 1e3,
+                'p90_us': self.percentile(90) / 1e3,
+                'p99_us': self.percentile(99) / 1e3,
+                'p99.9_us': self.percentile(99.9) / 1e3,
+                'max_us': self.max / 1e3}
+
+    def merge(self, other):
+        with self._lock:
+            for idx, n in enumerate(other._counts):
+                self._counts[idx] += n
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+            if other.min is not None and (self.min is None or other.min < self.min):
+                self.min = other.min
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * _N_BUCKETS
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = 0
+
+    def __repr__(self):
+        return 'LatencyHistogram({})'.format(', '.join('{}={:.1f}'.format(k, v) if isinstance(v, float)
+                                                       else '{}={}'.format(k, v)
+                                                       for k, v in self.summary().items()))
@@ -0,0 +1,292 @@
+"""
+Local fan-out of the EA market data feed.
+
+Every EAConnector opens its own SUB connection to the terminal and sends its own
+TRACK_PRICES, and the DWX EA replaces its tracked symbols with those of the last
+request. MarketDataHub holds the only upstream subscription and republishes it to any
+number of local consumers:
+
+    EA PUB --SUB--> MarketDataHub --XPUB (ipc/inproc/tcp)--> EAConnector(hub_address=...), ...
+    EA PULL <--PUSH-- TRACK_PRICES of the union of the consumers' symbols
+
+Downstream messages are two frames, [SYMBOL, "BID;ASK"] (or the 8 rate fields for
+TRACK_RATES instruments). Consumers filter on the first frame like on the EA's topics.
+The payload frame is a slice of the received upstream message, sent without copying.
+
+The XPUB socket reports every new subscription (XPUB_VERBOSE), and unsubscriptions when
+the last consumer of a topic leaves, so the hub adds and drops topics upstream.
+
+Late joiners get the last value of their topics from a separate ROUTER endpoint
+(snapshot_bind), as in the clone pattern: the consumer subscribes first, then sends the
+topic prefixes it wants and receives one reply [TOPIC, PAYLOAD, TOPIC, PAYLOAD, ...]
+([b''] when nothing matches). Snapshots never go through the XPUB socket, since every
+consumer of a topic would receive the old value again as a new tick.
+
+The hub does not connect to the EA's PUSH socket. The EA hands responses to its
+connected PULL sockets in turn, so a hub reading responses would take the trade
+responses of the strategies. TRACK_PRICES is sent without waiting for its answer.
+
+Run as its own process with:
+    python -m src.client.market_hub --bind tcp://127.0.0.1:32790
+(snapshots on tcp://127.0.0.1:32791)
+"""
+
+import argparse
+import re
+from threading import Thread
+from time import perf_counter, sleep
+
+import zmq
+
+
+def snapshot_address(address):
+    """
+    :param address: (str) downstream address of a hub
+    :return: (str) default snapshot address of that hub: the next port for tcp, '<address>_snapshot' otherwise
+    """
+    match = re.match(r'^(tcp://.*:)(\d+)$', address)
+    if match:
+        return match.group(1) + str(int(match.group(2)) + 1)
+    return address + '_snapshot'
+
+
+def request_snapshot(sock, prefixes, timeout=1000):
+    """
+    Consumer side of the snapshot endpoint
+    :param sock: (zmq.Socket) DEALER socket connected to the hub's snapshot address
+    :param prefixes: (list of str) topic prefixes
+    :param timeout: (int) milliseconds to wait for the reply
+    :return: (dict) {TOPIC: PAYLOAD} last values, None if the hub did not answer in time
+    """
+    sock.send_multipart([prefix.encode('utf-8') for prefix in prefixes] or [b''])
+    if not sock.poll(timeout, zmq.POLLIN):
+        return None
+    frames = sock.recv_multipart()
+    return {frames[i].decode('utf-8'): frames[i + 1].decode('utf-8') for i in range(0, len(frames) - 1, 2)}
+
+
+class MarketDataHub:
+
+    def __init__(self, bind='tcp://127.0.0.1:32790', host='localhost', protocol='tcp', push_port=32768,
+                 sub_port=32770, symbols=(), delimiter=';', track_interval=0.1, sndhwm=100000, context=None,
+                 snapshot_bind=None):
+        """
+        :param bind: (str or list of str) downstream address(es), e.g. 'ipc:///tmp/mt5_hub' or 'inproc://mt5_hub'
+        :param host: (str) host of the EA
+        :param push_port: (int) EA port receiving commands (TRACK_PRICES)
+        :param sub_port: (int) EA port publishing market data
+        :param symbols: (list of str) symbols always tracked, subscribed or not
+        :param track_interval: (float) min seconds between two TRACK_PRICES, changes are batched meanwhile
+        :param sndhwm: (int) messages queued per consumer before the slowest ones drop ticks
+        :param context: (zmq.Context) (optional) shared with inproc consumers, default is a new one
+        :param snapshot_bind: (str or list of str) (optional) snapshot address(es), default is snapshot_address() of
+                              each downstream address
+        """
+        self.symbols = list(symbols)
+        self.delimiter = delimiter
+        self.track_interval = track_interval
+
+        self._own_context = context is None
+        self.context = zmq.Context() if context is None else context
+
+        url = '{}://{}:'.format(protocol, host)
+        self._upstream = self.context.socket(zmq.SUB)
+        self._upstream.setsockopt(zmq.RCVHWM, 0)
+        self._upstream.connect(url + str(sub_port))
+        self._commands = self.context.socket(zmq.PUSH)
+        self._commands.setsockopt(zmq.LINGER, 0)
+        self._commands.connect(url + str(push_port))
+
+        self._downstream = self.context.socket(zmq.XPUB)
+        self._downstream.setsockopt(zmq.XPUB_VERBOSE, 1)
+        self._downstream.setsockopt(zmq.SNDHWM, sndhwm)
+        self.addresses = [bind] if isinstance(bind, str) else list(bind)
+        for address in self.addresses:
+            self._downstream.bind(address)
+
+        self._snapshots = self.context.socket(zmq.ROUTER)
+        self._snapshots.setsockopt(zmq.LINGER, 0)
+        if snapshot_bind is None:
+            self.snapshot_addresses = [snapshot_address(address) for address in self.addresses]
+        else:
+            self.snapshot_addresses = [snapshot_bind] if isinstance(snapshot_bind, str) else list(snapshot_bind)
+        for address in self.snapshot_addresses:
+            self._snapshots.bind(address)
+
+        self._control_url = 'inproc://market_hub_control_{}'.format(id(self))
+        self._control = self.context.socket(zmq.PAIR)
+        self._control.bind(self._control_url)
+
+        self._topics = set()  # topics subscribed downstream (bytes)
+        self._last = {}  # {TOPIC: memoryview of the last payload}
+        self._tracked = None  # symbols of the last TRACK_PRICES sent
+        self._track_due = 0.0
+
+        for symbol in self.symbols:
+            self._upstream.setsockopt(zmq.SUBSCRIBE, symbol.encode('utf-8'))
+
+        # Metrics
+        self.received = 0
+        self.published = 0
+        self.snapshots = 0
+        self.track_requests = 0
+
+        self._thread = None
+
+    @property
+    def topics(self):
+        """ (list of str) topics consumers are subscribed to """
+        return sorted(topic.decode('utf-8') for topic in self._topics)
+
+    def tracked_symbols(self):
+        """ :return: (list of str) symbols TRACK_PRICES should cover: the fixed ones and every subscribed symbol """
+        symbols = set(self.symbols)
+        for topic in self._topics:
+            topic = topic.decode('utf-8')
+            # 'SYMBOL_TF' topics are TRACK_RATES instruments, '' is every topic
+            if topic and not topic.rpartition('_')[2].isdigit():
+                symbols.add(topic)
+        return sorted(symbols)
+
+    def start(self):
+        """ Run the hub on a daemon thread """
+        self._thread = Thread(name='Market_Data_Hub', target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            control = self.context.socket(zmq.PAIR)
+            control.connect(self._control_url)
+            control.send(b'')
+            self._thread.join()
+            control.close()
+            self._thread = None
+        for sock in (self._upstream, self._commands, self._downstream, self._snapshots, self._control):
+            sock.close(0)
+        self._last.clear()
+        if self._own_context:
+            self.context.term()
+        print('[MARKET_HUB] Stopped, {} messages received, {} published, {} snapshot messages'.format(
+            self.received, self.published, self.snapshots))
+
+    def run(self):
+        """ Forward upstream messages until stop() """
+        poller = zmq.Poller()
+        poller.register(self._upstream, zmq.POLLIN)
+        poller.register(self._downstream, zmq.POLLIN)
+        poller.register(self._snapshots, zmq.POLLIN)
+        poller.register(self._control, zmq.POLLIN)
+        self._track(force=bool(self.symbols))
+
+        while True:
+            timeout = None if self._tracked == self.tracked_symbols() else max(
+                self._track_due - perf_counter(), 0.0) * 1000
+            sockets = dict(poller.poll(timeout))
+
+            if self._control in sockets:
+                self._control.recv()
+                return
+            if self._downstream in sockets:
+                self._subscriptions()
+            if self._snapshots in sockets:
+                self._serve_snapshots()
+            if self._upstream in sockets:
+                self._forward()
+            self._track()
+
+    def _forward(self, batch=1000):
+        upstream, downstream, last = self._upstream, self._downstream, self._last
+        for _ in range(batch):
+            try:
+                frame = upstream.recv(zmq.DONTWAIT, copy=False)
+            except zmq.Again:
+                return
+            self.received += 1
+            buf = frame.buffer
+            split = bytes(buf[:64]).find(b' ')
+            if split < 0:
+                continue
+            topic = bytes(buf[:split])
+            payload = buf[split + 1:]
+            last[topic] = payload
+            downstream.send_multipart((topic, payload), copy=False)
+            self.published += 1
+
+    def _subscriptions(self):
+        while True:
+            try:
+                msg = self._downstream.recv(zmq.DONTWAIT)
+            except zmq.Again:
+                return
+            if not msg:
+                continue
+            topic = msg[1:]
+            if msg[0] == 1:
+                if topic not in self._topics:
+                    self._topics.add(topic)
+                    self._upstream.setsockopt(zmq.SUBSCRIBE, topic)
+            elif msg[0] == 0 and topic in self._topics:
+                self._topics.discard(topic)
+                if topic.decode('utf-8') not in self.symbols:
+                    self._upstream.setsockopt(zmq.UNSUBSCRIBE, topic)
+
+    def _serve_snapshots(self):
+        """ Answer each [IDENTITY, PREFIX, ...] request with the last value of every matching topic """
+        while True:
+            try:
+                request = self._snapshots.recv_multipart(zmq.DONTWAIT)
+            except zmq.Again:
+                return
+            identity, prefixes = request[0], request[1:]
+            reply = [identity]
+            for topic, payload in self._last.items():
+                if any(topic.startswith(prefix) for prefix in prefixes):
+                    reply.append(topic)
+                    reply.append(payload)
+                    self.snapshots += 1
+            if len(reply) == 1:
+                reply.append(b'')
+            self._snapshots.send_multipart(reply, copy=False)
+
+    def _track(self, force=False):
+        """ Send TRACK_PRICES for the union of the consumers' symbols, at most once per track_interval """
+        symbols = self.tracked_symbols()
+        if not force and symbols == self._tracked:
+            return
+        now = perf_counter()
+        if now < self._track_due:
+            return
+        if symbols:
+            self._commands.send_string(self.delimiter.join(['TRACK_PRICES'] + symbols), zmq.DONTWAIT)
+            self.track_requests += 1
+        self._tracked = symbols
+        self._track_due = now + self.track_interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fan out the EA market data feed to local consumers')
+    parser.add_argument('--bind', action='append', help='downstream address, repeatable (default '
+                                                        'tcp://127.0.0.1:32790)')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--push-port', type=int, default=32768)
+    parser.add_argument('--sub-port', type=int, default=32770)
+    parser.add_argument('--symbols', nargs='*', default=[], help='symbols always tracked')
+    parser.add_argument('--snapshot-bind', action='append', help='snapshot address, repeatable (default: next '
+                                                                 'port of each tcp --bind)')
+    args = parser.parse_args()
+
+    hub = MarketDataHub(args.bind or 'tcp://127.0.0.1:32790', args.host, push_port=args.push_port,
+                        sub_port=args.sub_port, symbols=args.symbols, snapshot_bind=args.snapshot_bind).start()
+    print('[MARKET_HUB] Publishing on {}, snapshots on {}, ctrl-c to stop'.format(
+        ', '.join(hub.addresses), ', '.join(hub.snapshot_addresses)))
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        hub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Precompiled order requests.
+
+An OrderTemplate holds everything about an order that does not change between two sends:
+symbol, action, type, filling, magic, comment and the SL/TP distances, already converted
+to price units. build() copies the prepared request dict and only fills in price, volume,
+SL and TP, so no symbol lookups happen at send time.
+"""
+
+
+class OrderTemplate:
+
+    def __init__(self, symbol, point, digits, action, type, volume=0.01, sl_points=100, tp_points=100,
+                 deviation=10, magic=123456, comment='MT5 Python', type_time=0, type_filling=0, market=False):
+        """
+        :param symbol: (str) symbol
+        :param point: (float) the symbol's point size
+        :param digits: (int) number of decimals of the symbol's prices
+        :param action: (int) trade action. example: mt5.TRADE_ACTION_DEAL
+        :param type: (int) order type. example: mt5.ORDER_TYPE_BUY
+        :param volume: (float) default trade volume
+        :param sl_points: (int) n# of points between price and SL, None or 0 for no SL
+        :param tp_points: (int) n# of points between price and TP, None or 0 for no TP
+        :param deviation: (int) max price deviation in points
+        :param magic: (int) the magic number
+        :param comment: (str) comment
+        :param type_time: (int) order expiration type. example: mt5.ORDER_TIME_GTC
+        :param type_filling: (int) order filling type. example: mt5.ORDER_FILLING_FOK
+        :param market: (bool) True to send price 0.0 (market execution)
+        """
+        self.symbol = symbol
+        self.digits = digits
+        self.market = market
+        # ORDER_TYPE_SELL, _SELL_LIMIT, _SELL_STOP and _SELL_STOP_LIMIT are the odd order types
+        self.is_sell = type % 2 == 1
+
+        sign = -1.0 if self.is_sell else 1.0
+        self._sl_offset = -sign * sl_points * point if sl_points else None
+        self._tp_offset = sign * tp_points * point if tp_points else None
+
+        self._base = {
+            "action": action,
+            "symbol": symbol,
+            "volume": volume,
+            "type": type,
+            "price": 0.0,
+            "sl": 0.0,
+            "tp": 0.0,
+            "deviation": deviation,
+            "magic": magic,
+            "comment": comment,
+            "type_time": type_time,
+            "type_filling": type_filling,
+        }
+
+    def build(self, bid, ask, volume=None):
+        """
+        :param bid: (float) current bid
+        :param ask: (float) current ask
+        :param volume: (float) (optional) trade volume, default is the template's
+        :return: (dict) a trade request for mt5.order_send()
+        """
+        price = bid if self.is_sell else ask
+        request = self._base.copy()
+        if volume is not None:
+            request['volume'] = volume
+        if not self.market:
+            request['price'] = price
+        if self._sl_offset is not None:
+            request['sl'] = round(price + self._sl_offset, self.digits)
+        if self._tp_offset is not None:
+            request['tp'] = round(price + self._tp_offset, self.digits)
+        return request
+
+    def build_from_tick(self, tick, volume=None):
+        """
+        :param tick: (obj) mt5.symbol_info_tick() result
+        """
+        return self.build(tick.bid, tick.ask, volume)
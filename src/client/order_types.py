@@ -0,0 +1,24 @@
+"""
+Order structures shaped like those of the MetaTrader5 package.
+
+Code building order results without a terminal (the backtester, the simulated
+terminal in src.sim.fake_mt5) shares these, so _save_order() and the order journal
+read the same fields as from mt5.order_send().
+"""
+
+from collections import namedtuple
+
+
+# Trade server return codes used without a terminal (values of the MetaTrader5 package, see retcodes.py)
+TRADE_RETCODE_DONE, TRADE_RETCODE_INVALID, TRADE_RETCODE_INVALID_STOPS = 10009, 10013, 10016
+TRADE_RETCODE_MARKET_CLOSED = 10018
+
+TradeRequest = namedtuple('TradeRequest', ['action', 'magic', 'order', 'symbol', 'volume', 'price', 'stoplimit',
+                                           'sl', 'tp', 'deviation', 'type', 'type_filling', 'type_time',
+                                           'expiration', 'comment', 'position', 'position_by'])
+OrderSendResult = namedtuple('OrderSendResult', ['retcode', 'deal', 'order', 'volume', 'price', 'bid', 'ask',
+                                                 'comment', 'request_id', 'retcode_external', 'request'])
+OrderCheckResult = namedtuple('OrderCheckResult', ['retcode', 'balance', 'equity', 'profit', 'margin',
+                                                   'margin_free', 'margin_level', 'comment', 'request'])
+TradePosition = namedtuple('TradePosition', ['ticket', 'time', 'type', 'magic', 'identifier', 'volume',
+                                             'price_open', 'sl', 'tp', 'price_current', 'symbol', 'comment'])
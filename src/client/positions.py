@@ -0,0 +1,472 @@
+"""
+Columnar book of open positions with live exposure and P&L.
+
+PositionBook keeps the open positions in preallocated NumPy columns, one row per
+position and a {TICKET: row} index. Closed rows are filled with the last row, so the open
+positions are always rows 0..n-1 and reprice() marks all of them in one vectorized pass.
+
+Per symbol, and per (magic, symbol), it also keeps four running sums updated when a
+position is opened, reduced or closed:
+
+    long units, long cost (units * open price), short units, short cost
+
+so the unrealized P&L of any group is long_units * bid - long_cost + short_cost -
+short_units * ask. Longs are marked at the bid, shorts at the ask, like the terminal
+marks them. A tick only stores the symbol's bid/ask (onTick(), O(1), no terminal call),
+and a risk check reads exposure() or unrealized() in a few microseconds whatever the
+number of positions. Strategies are groups of magic numbers (set_strategy()).
+
+P&L is in each symbol's profit currency. Totals over several symbols add them as they
+are.
+
+Positions come from order results (open(), close()) and are reconciled with the
+terminal with sync(mt5.positions_get()), e.g. on start and on a slow timer.
+
+The book never calls the terminal. Symbols and their contract sizes are registered
+up front with register(), e.g. by Connector.position_book() on the MT5 gateway thread,
+and ticks of unregistered symbols are ignored. Every method takes the book's lock, so
+ticks from the EA poll thread and orders from trading threads can update it together.
+"""
+
+from threading import RLock
+
+import numpy as np
+import pandas as pd
+
+from src.client.dispatch import TICK
+
+
+LONG_UNITS, LONG_COST, SHORT_UNITS, SHORT_COST = range(4)
+
+POSITION_FIELDS = ('ticket', 'symbol', 'magic', 'strategy', 'side', 'volume', 'price_open', 'sl', 'tp', 'time',
+                   'price_current', 'profit')
+
+
+class PositionBook:
+
+    def __init__(self, contract_sizes=None, default_contract_size=100000.0, capacity=1024):
+        """
+        :param contract_sizes: (dict) (optional) {SYMBOL: units per lot}, the symbols are registered
+        :param default_contract_size: (float) units per lot of symbols opened without being registered
+        :param capacity: (int) initial number of position rows, grown as needed
+        """
+        self.contract_sizes = {}
+        self.default_contract_size = default_contract_size
+
+        self._lock = RLock()  # held by every method, the storage arrays are swapped when they grow
+        self._n = 0
+        self._rows = {}  # {TICKET: row}
+        self._symbols = {}  # {SYMBOL: index}
+        self._magics = {}  # {MAGIC: index}
+        self._strategies = {'': 0}  # {STRATEGY: index}, '' for magics without strategy
+
+        self._allocate_rows(capacity)
+        self._allocate_groups(16, 16)
+        if contract_sizes:
+            self.register(contract_sizes)
+
+        # Metrics
+        self.opened = 0
+        self.closed = 0
+
+    # Storage
+    def _allocate_rows(self, capacity):
+        def grow(name, fill, dtype):
+            new = np.full(capacity, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[:len(old)] = old
+            setattr(self, name, new)
+
+        grow('_ticket', 0, np.int64)
+        grow('_symbol', 0, np.int32)  # symbol index
+        grow('_magic', 0, np.int32)  # magic index
+        grow('_side', 0, np.int8)  # 1 long, -1 short
+        grow('_volume', 0.0, np.float64)  # lots
+        grow('_units', 0.0, np.float64)  # volume * contract size
+        grow('_price_open', np.nan, np.float64)
+        grow('_sl', 0.0, np.float64)
+        grow('_tp', 0.0, np.float64)
+        grow('_time', 0, np.int64)
+        grow('_price_current', np.nan, np.float64)
+        grow('_profit', np.nan, np.float64)
+
+    def _allocate_groups(self, magics, symbols):
+        def grow(name, shape, fill, dtype=np.float64):
+            new = np.full(shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[tuple(slice(0, n) for n in old.shape)] = old
+            setattr(self, name, new)
+
+        # Per symbol
+        grow('_bid', (symbols,), np.nan)
+        grow('_ask', (symbols,), np.nan)
+        grow('_tick_time', (symbols,), 0, np.int64)
+        grow('_contract', (symbols,), self.default_contract_size)
+        grow('_sym_sums', (4, symbols), 0.0)
+        grow('_sym_count', (symbols,), 0, np.int64)
+        grow('_sym_realized', (symbols,), 0.0)
+        # Per magic and symbol
+        grow('_sums', (4, magics, symbols), 0.0)
+        grow('_count', (magics, symbols), 0, np.int64)
+        grow('_realized', (magics, symbols), 0.0)
+        # Per magic
+        grow('_magic_strategy', (magics,), 0, np.int32)
+
+    def _symbol_index(self, symbol):
+        s = self._symbols.get(symbol)
+        if s is None:
+            s = self._symbols[symbol] = len(self._symbols)
+            if s == len(self._bid):
+                self._allocate_groups(self._sums.shape[1], 2 * s)
+            if symbol not in self.contract_sizes:
+                print('[POSITION_BOOK] {} is not registered, using a contract size of {}'.format(
+                    symbol, self.default_contract_size))
+            self._contract[s] = float(self.contract_sizes.get(symbol, self.default_contract_size))
+        return s
+
+    def _magic_index(self, magic):
+        m = self._magics.get(magic)
+        if m is None:
+            m = self._magics[magic] = len(self._magics)
+            if m == self._sums.shape[1]:
+                self._allocate_groups(2 * m, len(self._bid))
+        return m
+
+    def register(self, contract_sizes):
+        """
+        Add symbols to the book, or update their contract size
+        :param contract_sizes: (dict) {SYMBOL: units per lot}, see Connector.position_book()
+        """
+        with self._lock:
+            for symbol, size in contract_sizes.items():
+                self.contract_sizes[symbol] = float(size)
+                s = self._symbol_index(symbol)
+                if not self._sym_count[s]:
+                    self._contract[s] = float(size)
+
+    def set_strategy(self, magic, strategy):
+        """
+        :param magic: (int) magic number of the strategy's orders
+        :param strategy: (str) strategy name, several magics can share one
+        """
+        with self._lock:
+            k = self._strategies.get(strategy)
+            if k is None:
+                k = self._strategies[strategy] = len(self._strategies)
+            self._magic_strategy[self._magic_index(magic)] = k
+
+    # Prices: EAConnector subscriber interface
+    def attach(self, conn, symbols=None):
+        """
+        Mark positions with conn's parsed ticks
+        :param conn: (EAConnector)
+        :param symbols: (list of str) (optional) symbols to follow, default is every symbol
+        """
+        conn.add_subscriber(self, symbols, kinds=(TICK,))
+
+    def onTick(self, symbol, time_ns, bid, ask):
+        """ Store the symbol's last prices, ticks of unregistered symbols are ignored """
+        with self._lock:
+            s = self._symbols.get(symbol)
+            if s is None:
+                return
+            self._bid[s] = bid
+            self._ask[s] = ask
+            self._tick_time[s] = time_ns
+
+    def update_prices(self, source):
+        """
+        Store the last prices of every symbol of the book
+        :param source: (TickStore) e.g. EAConnector.tick_store, or (dict) Connector.snapshot() result
+        """
+        with self._lock:
+            if isinstance(source, dict):
+                for symbol, t, bid, ask in zip(source['symbol'], source['time_msc'], source['bid'], source['ask']):
+                    if t:
+                        self.onTick(symbol, int(t) * 1000000, bid, ask)
+                return
+            for symbol in list(self._symbols):
+                tick = source.last_tick(symbol)
+                if tick is not None:
+                    self.onTick(symbol, *tick)
+
+    # Positions
+    def open(self, ticket, symbol, type, volume, price_open, magic=0, strategy=None, sl=0.0, tp=0.0, time=0):
+        """
+        Add a position (an existing ticket is replaced)
+        :param type: (int) POSITION_TYPE_BUY / ORDER_TYPE_BUY (0) or POSITION_TYPE_SELL / ORDER_TYPE_SELL (1)
+        :param volume: (float) lots
+        :param strategy: (str) (optional) strategy of the magic number, see set_strategy()
+        """
+        with self._lock:
+            if ticket in self._rows:
+                self.close(ticket)
+                self.closed -= 1
+
+            s = self._symbol_index(symbol)
+            m = self._magic_index(magic)
+            if strategy is not None:
+                self.set_strategy(magic, strategy)
+
+            r = self._n
+            if r == len(self._ticket):
+                self._allocate_rows(2 * r)
+            side = 1 if int(type) % 2 == 0 else -1
+            units = float(volume) * self._contract[s]
+            self._ticket[r], self._symbol[r], self._magic[r], self._side[r] = ticket, s, m, side
+            self._volume[r], self._units[r], self._price_open[r] = volume, units, price_open
+            self._sl[r], self._tp[r], self._time[r] = sl, tp, time
+            self._rows[ticket] = r
+            self._n = r + 1
+
+            self._add(s, m, side, units, units * price_open, 1)
+            self.opened += 1
+
+    def close(self, ticket, volume=None, price=None):
+        """
+        Close a position, or part of it
+        :param volume: (float) (optional) lots closed, default is the whole position
+        :param price: (float) (optional) close price, to book the realized P&L
+        :return: (float) realized P&L, NaN without price, None for an unknown ticket
+        """
+        with self._lock:
+            r = self._rows.get(ticket)
+            if r is None:
+                return None
+            s, m, side = int(self._symbol[r]), int(self._magic[r]), int(self._side[r])
+            if volume is None or volume >= self._volume[r] - 1e-12:
+                volume = self._volume[r]
+            units = float(volume) * self._contract[s]
+            open_price = float(self._price_open[r])
+
+            realized = np.nan if price is None else side * (price - open_price) * units
+            if price is not None:
+                self._realized[m, s] += realized
+                self._sym_realized[s] += realized
+
+            if volume >= self._volume[r]:
+                self._add(s, m, side, -units, -units * open_price, -1)
+                self._remove(r)
+                self.closed += 1
+            else:
+                self._add(s, m, side, -units, -units * open_price, 0)
+                self._volume[r] -= volume
+                self._units[r] -= units
+            return realized
+
+    def modify(self, ticket, sl=None, tp=None):
+        with self._lock:
+            r = self._rows.get(ticket)
+            if r is None:
+                return False
+            if sl is not None:
+                self._sl[r] = sl
+            if tp is not None:
+                self._tp[r] = tp
+            return True
+
+    def sync(self, positions):
+        """
+        Replace the book's positions with the terminal's
+        :param positions: (iterable) mt5.positions_get() result (TradePosition tuples), None counts as no position
+        """
+        with self._lock:
+            self.clear()
+            for p in positions or ():
+                self.open(p.ticket, p.symbol, p.type, p.volume, p.price_open, p.magic, sl=p.sl, tp=p.tp, time=p.time)
+                s = self._symbols[p.symbol]
+                # No tick yet: start from the terminal's mark
+                if np.isnan(self._bid[s]) and p.type % 2 == 0:
+                    self._bid[s] = p.price_current
+                elif np.isnan(self._ask[s]) and p.type % 2 == 1:
+                    self._ask[s] = p.price_current
+
+    def clear(self):
+        """ Forget every position, realized P&L and prices are kept """
+        with self._lock:
+            self._rows.clear()
+            self._n = 0
+            self._sums[:] = 0.0
+            self._count[:] = 0
+            self._sym_sums[:] = 0.0
+            self._sym_count[:] = 0
+
+    def _add(self, s, m, side, units, cost, count):
+        k = LONG_UNITS if side > 0 else SHORT_UNITS
+        sums, sym_sums = self._sums, self._sym_sums
+        sums[k, m, s] += units
+        sums[k + 1, m, s] += cost
+        sym_sums[k, s] += units
+        sym_sums[k + 1, s] += cost
+        if count:
+            self._count[m, s] += count
+            self._sym_count[s] += count
+            # Reset the running sums of emptied groups, no rounding residue
+            if self._count[m, s] == 0:
+                sums[:, m, s] = 0.0
+            if self._sym_count[s] == 0:
+                sym_sums[:, s] = 0.0
+
+    def _remove(self, r):
+        """ Fill row r with the last row """
+        last = self._n - 1
+        del self._rows[int(self._ticket[r])]
+        if r != last:
+            for col in (self._ticket, self._symbol, self._magic, self._side, self._volume, self._units,
+                        self._price_open, self._sl, self._tp, self._time, self._price_current, self._profit):
+                col[r] = col[last]
+            self._rows[int(self._ticket[r])] = r
+        self._n = last
+
+    # Views
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, ticket):
+        return ticket in self._rows
+
+    def tickets(self):
+        """ :return: (ndarray) open tickets (view) """
+        return self._ticket[:self._n]
+
+    def reprice(self):
+        """
+        Mark every open position at the last prices in one pass
+        :return: (dict) {FIELD: ndarray} views of the position columns with price_current and profit updated
+        """
+        with self._lock:
+            n = self._n
+            s, side = self._symbol[:n], self._side[:n]
+            mark = np.where(side > 0, self._bid[s], self._ask[s])
+            self._price_current[:n] = mark
+            self._profit[:n] = side * (mark - self._price_open[:n]) * self._units[:n]
+            return {'ticket': self._ticket[:n], 'symbol': s, 'magic': self._magic[:n], 'side': side,
+                    'volume': self._volume[:n], 'price_open': self._price_open[:n], 'sl': self._sl[:n],
+                    'tp': self._tp[:n], 'time': self._time[:n], 'price_current': self._price_current[:n],
+                    'profit': self._profit[:n]}
+
+    def exposure(self, symbol):
+        """ :return: (float) net units of the symbol's base (long - short), 0.0 for an unknown symbol """
+        with self._lock:
+            s = self._symbols.get(symbol)
+            if s is None:
+                return 0.0
+            return float(self._sym_sums[LONG_UNITS, s] - self._sym_sums[SHORT_UNITS, s])
+
+    def net_volume(self, symbol):
+        """ :return: (float) net lots of the symbol (long - short) """
+        with self._lock:
+            s = self._symbols.get(symbol)
+            return 0.0 if s is None else self.exposure(symbol) / self._contract[s]
+
+    def unrealized(self, symbol=None, magic=None, strategy=None):
+        """
+        Unrealized P&L at the last prices, from the running sums
+        :param symbol: (str) (optional) restrict to a symbol
+        :param magic: (int) (optional) restrict to a magic number
+        :param strategy: (str) (optional) restrict to a strategy's magic numbers
+        :return: (float) NaN when a position's symbol has no price yet
+        """
+        with self._lock:
+            if magic is None and strategy is None:
+                if symbol is None:
+                    ns = len(self._symbols)
+                    return float(self._pnl(self._sym_sums[:, :ns], self._bid[:ns], self._ask[:ns],
+                                           self._sym_count[:ns]).sum())
+                s = self._symbols.get(symbol)
+                if s is None or not self._sym_count[s]:
+                    return 0.0
+                sums = self._sym_sums[:, s]
+                return float(sums[LONG_UNITS] * self._bid[s] - sums[LONG_COST] + sums[SHORT_COST]
+                             - sums[SHORT_UNITS] * self._ask[s])
+
+            rows = self._group_rows(magic, strategy)
+            if symbol is not None:
+                s = self._symbols.get(symbol)
+                if s is None or (isinstance(rows, list) and not rows):
+                    return 0.0
+                return float(self._pnl(self._sums[:, rows, s], self._bid[s], self._ask[s], self._count[rows, s]).sum())
+            return float(self._group_pnl(rows).sum())
+
+    def realized(self, symbol=None, magic=None):
+        """ :return: (float) P&L booked by close(..., price=...) """
+        with self._lock:
+            s = slice(None) if symbol is None else self._symbols.get(symbol)
+            if s is None:
+                return 0.0
+            if magic is None:
+                return float(self._sym_realized[s].sum())
+            m = self._magics.get(magic)
+            return 0.0 if m is None else float(self._realized[m, s].sum())
+
+    @staticmethod
+    def _pnl(sums, bid, ask, count):
+        pnl = sums[LONG_UNITS] * bid - sums[LONG_COST] + sums[SHORT_COST] - sums[SHORT_UNITS] * ask
+        # Groups without positions are 0 even when the symbol has no price
+        return np.where(count > 0, pnl, 0.0)
+
+    def _group_pnl(self, rows=None):
+        """
+        :param rows: (list or ndarray) (optional) magic indexes, default is every magic
+        :return: (ndarray) [magic, symbol] unrealized P&L
+        """
+        ns = len(self._symbols)
+        rows = slice(0, len(self._magics)) if rows is None else rows
+        return self._pnl(self._sums[:, rows, :ns], self._bid[:ns], self._ask[:ns], self._count[rows, :ns])
+
+    def _group_rows(self, magic, strategy):
+        if magic is not None:
+            m = self._magics.get(magic)
+            return [] if m is None else slice(m, m + 1)
+        k = self._strategies.get(strategy)
+        if k is None:
+            return []
+        return np.flatnonzero(self._magic_strategy[:len(self._magics)] == k)
+
+    def by_symbol(self):
+        """ :return: (DataFrame) positions, long/short/net lots, exposure, unrealized and realized P&L by symbol """
+        with self._lock:
+            ns = len(self._symbols)
+            sums, contract = self._sym_sums[:, :ns], self._contract[:ns]
+            return pd.DataFrame({'positions': self._sym_count[:ns],
+                                 'long_lots': sums[LONG_UNITS] / contract,
+                                 'short_lots': sums[SHORT_UNITS] / contract,
+                                 'net_lots': (sums[LONG_UNITS] - sums[SHORT_UNITS]) / contract,
+                                 'exposure': sums[LONG_UNITS] - sums[SHORT_UNITS],
+                                 'bid': self._bid[:ns], 'ask': self._ask[:ns],
+                                 'unrealized': self._pnl(sums, self._bid[:ns], self._ask[:ns], self._sym_count[:ns]),
+                                 'realized': self._sym_realized[:ns]},
+                                index=pd.Index(list(self._symbols), name='symbol'))
+
+    def by_magic(self):
+        """ :return: (DataFrame) positions, long/short lots, unrealized and realized P&L by magic number """
+        with self._lock:
+            nm, ns = len(self._magics), len(self._symbols)
+            sums, contract = self._sums[:, :nm, :ns], self._contract[:ns]
+            strategies = np.array(list(self._strategies), dtype=object)
+            return pd.DataFrame({'strategy': strategies[self._magic_strategy[:nm]],
+                                 'positions': self._count[:nm, :ns].sum(axis=1),
+                                 'long_lots': (sums[LONG_UNITS] / contract).sum(axis=1),
+                                 'short_lots': (sums[SHORT_UNITS] / contract).sum(axis=1),
+                                 'unrealized': self._group_pnl().sum(axis=1),
+                                 'realized': self._realized[:nm, :ns].sum(axis=1)},
+                                index=pd.Index(list(self._magics), name='magic'))
+
+    def by_strategy(self):
+        """ :return: (DataFrame) by_magic() summed by strategy ('' for magics without strategy) """
+        return self.by_magic().groupby('strategy').sum(numeric_only=True)
+
+    def to_frame(self):
+        """ :return: (DataFrame) one row per open position, repriced, indexed by ticket """
+        with self._lock:
+            cols = self.reprice()
+            symbols = np.array(list(self._symbols), dtype=object)
+            magics = np.array(list(self._magics), dtype=np.int64)
+            strategies = np.array(list(self._strategies), dtype=object)
+            df = pd.DataFrame({name: cols[name] for name in POSITION_FIELDS if name in cols})
+            df['symbol'] = symbols[cols['symbol']] if len(df) else []
+            df['magic'] = magics[cols['magic']] if len(df) else []
+            df['strategy'] = strategies[self._magic_strategy[cols['magic']]] if len(df) else []
+            return df.set_index('ticket')[list(POSITION_FIELDS[1:])]
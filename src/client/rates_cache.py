@@ -0,0 +1,245 @@
+"""
+Local OHLC cache for Connector.get_rates().
+
+Bars are kept per (symbol, timeframe) in a raw file of MetaTrader's rates dtype and
+opened memory-mapped, so reads cost no parsing and no copy. On every request only the
+bars missing before the head or after the tail of the cached range are downloaded from
+the terminal and merged in. New bars at the tail are written in place from the first bar
+that changed (the last cached bar may have been incomplete), and nothing is written when
+no bar changed. Bars added before the head are written to a new file version, since
+readers may still map the current one.
+
+A small JSON sidecar records the file version and the time range already requested, so
+ranges where the broker simply has no bars are not downloaded over and over.
+"""
+
+import json
+import os
+from threading import Lock
+from time import time
+
+import numpy as np
+
+
+# Layout of the arrays returned by MetaTrader5.copy_rates_*()
+RATES_DTYPE = np.dtype([('time', '<i8'),
+                        ('open', '<f8'),
+                        ('high', '<f8'),
+                        ('low', '<f8'),
+                        ('close', '<f8'),
+                        ('tick_volume', '<u8'),
+                        ('spread', '<i4'),
+                        ('real_volume', '<u8')])
+
+
+def timeframe_seconds(timeframe):
+    """
+    :param timeframe: (int) MetaTrader5 TIMEFRAME_* constant
+    :return: (int) bar duration in seconds (months are counted as 31 days)
+    """
+    if timeframe & 0xC000 == 0xC000:
+        return 31 * 86400 * (timeframe & 0x3FFF)
+    if timeframe & 0x8000:
+        return 7 * 86400 * (timeframe & 0x3FFF)
+    if timeframe & 0x4000:
+        return 3600 * (timeframe & 0x3FFF)
+    return 60 * timeframe
+
+
+class RatesCache:
+    """
+    Memory-mapped bar cache keyed by symbol and timeframe.
+    """
+
+    def __init__(self, source, root='data/rates'):
+        """
+        :param source: (module) object exposing copy_rates_range() and copy_rates_from_pos(), i.e. MetaTrader5
+        :param root: (str) directory holding the cache files
+        """
+        self.source = source
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = Lock()
+        self._open = {}  # {(SYMBOL, TIMEFRAME): memmap}
+
+    def _meta_path(self, symbol, timeframe):
+        return os.path.join(self.root, '{}_{}.json'.format(symbol, timeframe))
+
+    def _read_meta(self, symbol, timeframe):
+        try:
+            with open(self._meta_path(symbol, timeframe)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, symbol, timeframe):
+        """
+        :return: (ndarray) read-only memory-mapped bars of RATES_DTYPE (empty if nothing is cached)
+        """
+        key = (symbol, timeframe)
+        bars = self._open.get(key)
+        if bars is None:
+            meta = self._read_meta(symbol, timeframe)
+            if meta is None or not meta['bars']:
+                return np.empty(0, dtype=RATES_DTYPE)
+            path = os.path.join(self.root, meta['file'])
+            bars = np.memmap(path, dtype=RATES_DTYPE, mode='r', shape=(meta['bars'],))
+            self._open[key] = bars
+        return bars
+
+    def _store(self, symbol, timeframe, bars, covered_from):
+        """
+        Save bars, the merge of the cached bars with the downloaded ones. The covered range starts at covered_from
+        and ends at the last bar, so bars after it (still open or not there yet) are downloaded again on the next
+        request.
+        """
+        covered_to = int(bars['time'][-1]) if len(bars) else int(covered_from) - 1
+        meta = self._read_meta(symbol, timeframe)
+        cached = np.asarray(self.load(symbol, timeframe))
+
+        n = len(cached)
+        if meta is not None and meta['file'].endswith('.bin') and n and len(bars) >= n \
+                and bars['time'][0] == cached['time'][0]:
+            # Same head: write from the first bar that changed on
+            changed = np.flatnonzero(bars[:n] != cached)
+            start = int(changed[0]) if len(changed) else n
+            if start < len(bars):
+                with open(os.path.join(self.root, meta['file']), 'r+b') as f:
+                    f.seek(start * RATES_DTYPE.itemsize)
+                    f.write(np.ascontiguousarray(bars[start:]).tobytes())
+            elif meta['from'] == int(covered_from) and meta['to'] == covered_to:
+                return
+            self._write_meta(symbol, timeframe, meta['version'], meta['file'], covered_from, covered_to, len(bars))
+            self._open.pop((symbol, timeframe), None)
+            return
+
+        version = 0 if meta is None else meta['version'] + 1
+        filename = '{}_{}.{}.bin'.format(symbol, timeframe, version)
+        path = os.path.join(self.root, filename)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(np.ascontiguousarray(bars, dtype=RATES_DTYPE).tobytes())
+        os.replace(path + '.tmp', path)
+        self._write_meta(symbol, timeframe, version, filename, covered_from, covered_to, len(bars))
+
+        # Previous versions may still be mapped by readers (Windows refuses to delete those), retry next time
+        self._open.pop((symbol, timeframe), None)
+        prefix = '{}_{}.'.format(symbol, timeframe)
+        for name in os.listdir(self.root):
+            if name.startswith(prefix) and name.endswith('.bin') and name != filename:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    pass
+
+    def _write_meta(self, symbol, timeframe, version, filename, covered_from, covered_to, n):
+        tmp_meta = self._meta_path(symbol, timeframe) + '.tmp'
+        with open(tmp_meta, 'w') as f:
+            json.dump({'version': version, 'file': filename, 'from': int(covered_from), 'to': int(covered_to),
+                       'bars': int(n)}, f)
+        os.replace(tmp_meta, self._meta_path(symbol, timeframe))
+
+    def _fetch_range(self, symbol, timeframe, date_from, date_to):
+        rates = self.source.copy_rates_range(symbol, timeframe, int(date_from), int(date_to))
+        if rates is None or len(rates) == 0:
+            return np.empty(0, dtype=RATES_DTYPE)
+        return np.asarray(rates).astype(RATES_DTYPE)
+
+    def _fetch_pos(self, symbol, timeframe, start_pos, count):
+        rates = self.source.copy_rates_from_pos(symbol, timeframe, int(start_pos), int(count))
+        if rates is None or len(rates) == 0:
+            return np.empty(0, dtype=RATES_DTYPE)
+        return np.asarray(rates).astype(RATES_DTYPE)
+
+    @staticmethod
+    def _merge(head, cached, tail):
+        """
+        Concatenate bars, tail bars replacing cached ones with the same time (the last cached bar may have been
+        incomplete)
+        """
+        if len(tail):
+            cached = cached[cached['time'] < tail['time'][0]]
+        if len(head) and len(cached):
+            head = head[head['time'] < cached['time'][0]]
+        return np.concatenate([head, cached, tail])
+
+    def get_range(self, symbol, timeframe, date_from, date_to):
+        """
+        :param date_from: (int) first bar time (s since epoch)
+        :param date_to: (int) last bar time (s since epoch)
+        :return: (ndarray) read-only view of the cached bars with date_from <= time <= date_to
+        """
+        date_from, date_to = int(date_from), int(date_to)
+        with self._lock:
+            cached = np.asarray(self.load(symbol, timeframe))
+            meta = self._read_meta(symbol, timeframe)
+
+            if meta is None:
+                self._store(symbol, timeframe, self._fetch_range(symbol, timeframe, date_from, date_to), date_from)
+            else:
+                covered_from, covered_to = meta['from'], meta['to']
+                head = tail = np.empty(0, dtype=RATES_DTYPE)
+                if date_from < covered_from:
+                    head = self._fetch_range(symbol, timeframe, date_from, covered_from - 1)
+                if date_to > covered_to:
+                    # From the last cached bar on, it may have been incomplete when downloaded
+                    tail = self._fetch_range(symbol, timeframe, max(covered_to, covered_from), date_to)
+
+                if date_from < covered_from or len(tail):
+                    self._store(symbol, timeframe, self._merge(head, cached, tail), min(date_from, covered_from))
+
+            bars = self.load(symbol, timeframe)
+
+        lo = np.searchsorted(bars['time'], date_from, side='left')
+        hi = np.searchsorted(bars['time'], date_to, side='right')
+        return bars[lo:hi]
+
+    def get_latest(self, symbol, timeframe, start_pos=0, count=270):
+        """
+        Same bars as copy_rates_from_pos(symbol, timeframe, start_pos, count), position 0 being the current bar.
+        :return: (ndarray) read-only view of the cached bars
+        """
+        needed = int(start_pos) + int(count)
+        with self._lock:
+            cached = np.asarray(self.load(symbol, timeframe))
+            meta = self._read_meta(symbol, timeframe)
+
+            if meta is None or len(cached) == 0:
+                bars = self._fetch_pos(symbol, timeframe, 0, needed)
+            else:
+                # Download the newest bars until they overlap the cached tail
+                n = max(int((time() - cached['time'][-1]) // timeframe_seconds(timeframe)) + 2, 2)
+                while True:
+                    tail = self._fetch_pos(symbol, timeframe, 0, n)
+                    if len(tail) < n or tail['time'][0] <= cached['time'][-1]:
+                        break
+                    n *= 2
+                bars = self._merge(np.empty(0, dtype=RATES_DTYPE), cached, tail)
+
+                # Then the oldest bars the request reaches beyond the cache
+                if len(bars) < needed:
+                    head = self._fetch_pos(symbol, timeframe, len(bars), needed - len(bars))
+                    bars = self._merge(head, bars, np.empty(0, dtype=RATES_DTYPE))
+
+            if len(bars):
+                covered_from = bars['time'][0] if meta is None else min(meta['from'], bars['time'][0])
+                self._store(symbol, timeframe, bars, covered_from)
+            bars = self.load(symbol, timeframe)
+
+        end = max(len(bars) - int(start_pos), 0)
+        return bars[max(end - int(count), 0):end]
+
+    def clear(self, symbol=None, timeframe=None):
+        """
+        Delete cached bars of one symbol/timeframe, or everything if None
+        """
+        with self._lock:
+            for name in os.listdir(self.root):
+                _symbol, _, rest = name.rpartition('_')
+                _timeframe = rest.split('.')[0]
+                if (symbol is None or _symbol == symbol) and (timeframe is None or _timeframe == str(timeframe)):
+                    self._open.pop((_symbol, int(_timeframe) if _timeframe.isdigit() else _timeframe), None)
+                    try:
+                        os.remove(os.path.join(self.root, name))
+                    except OSError:
+                        pass
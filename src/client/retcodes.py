@@ -0,0 +1,145 @@
+"""
+Trade server return code registry.
+
+The descriptions live in the mt5_return_codes table. They are loaded once per process
+and written to a JSON snapshot, so later processes start without touching the DB.
+Without a DB or snapshot, the built-in table of MT5 trade return codes is used.
+"""
+
+import json
+import os
+from threading import Lock
+
+
+# https://www.mql5.com/en/docs/constants/errorswarnings/enum_trade_return_codes
+TRADE_RETCODES = {
+    10004: ('TRADE_RETCODE_REQUOTE', 'Requote'),
+    10006: ('TRADE_RETCODE_REJECT', 'Request rejected'),
+    10007: ('TRADE_RETCODE_CANCEL', 'Request canceled by trader'),
+    10008: ('TRADE_RETCODE_PLACED', 'Order placed'),
+    10009: ('TRADE_RETCODE_DONE', 'Request completed'),
+    10010: ('TRADE_RETCODE_DONE_PARTIAL', 'Only part of the request was completed'),
+    10011: ('TRADE_RETCODE_ERROR', 'Request processing error'),
+    10012: ('TRADE_RETCODE_TIMEOUT', 'Request canceled by timeout'),
+    10013: ('TRADE_RETCODE_INVALID', 'Invalid request'),
+    10014: ('TRADE_RETCODE_INVALID_VOLUME', 'Invalid volume in the request'),
+    10015: ('TRADE_RETCODE_INVALID_PRICE', 'Invalid price in the request'),
+    10016: ('TRADE_RETCODE_INVALID_STOPS', 'Invalid stops in the request'),
+    10017: ('TRADE_RETCODE_TRADE_DISABLED', 'Trade is disabled'),
+    10018: ('TRADE_RETCODE_MARKET_CLOSED', 'Market is closed'),
+    10019: ('TRADE_RETCODE_NO_MONEY', 'There is not enough money to complete the request'),
+    10020: ('TRADE_RETCODE_PRICE_CHANGED', 'Prices changed'),
+    10021: ('TRADE_RETCODE_PRICE_OFF', 'There are no quotes to process the request'),
+    10022: ('TRADE_RETCODE_INVALID_EXPIRATION', 'Invalid order expiration date in the request'),
+    10023: ('TRADE_RETCODE_ORDER_CHANGED', 'Order state changed'),
+    10024: ('TRADE_RETCODE_TOO_MANY_REQUESTS', 'Too frequent requests'),
+    10025: ('TRADE_RETCODE_NO_CHANGES', 'No changes in request'),
+    10026: ('TRADE_RETCODE_SERVER_DISABLES_AT', 'Autotrading disabled by server'),
+    10027: ('TRADE_RETCODE_CLIENT_DISABLES_AT', 'Autotrading disabled by client terminal'),
+    10028: ('TRADE_RETCODE_LOCKED', 'Request locked for processing'),
+    10029: ('TRADE_RETCODE_FROZEN', 'Order or position frozen'),
+    10030: ('TRADE_RETCODE_INVALID_FILL', 'Invalid order filling type'),
+    10031: ('TRADE_RETCODE_CONNECTION', 'No connection with the trade server'),
+    10032: ('TRADE_RETCODE_ONLY_REAL', 'Operation is allowed only for live accounts'),
+    10033: ('TRADE_RETCODE_LIMIT_ORDERS', 'The number of pending orders has reached the limit'),
+    10034: ('TRADE_RETCODE_LIMIT_VOLUME', 'The volume of orders and positions for the symbol has reached the limit'),
+    10035: ('TRADE_RETCODE_INVALID_ORDER', 'Incorrect or prohibited order type'),
+    10036: ('TRADE_RETCODE_POSITION_CLOSED', 'Position with the specified POSITION_IDENTIFIER has already been closed'),
+    10038: ('TRADE_RETCODE_INVALID_CLOSE_VOLUME', 'A close volume exceeds the current position volume'),
+    10039: ('TRADE_RETCODE_CLOSE_ORDER_EXIST', 'A close order already exists for a specified position'),
+    10040: ('TRADE_RETCODE_LIMIT_POSITIONS', 'The number of open positions has reached the limit'),
+    10041: ('TRADE_RETCODE_REJECT_CANCEL', 'The pending order activation request is rejected, the order is canceled'),
+    10042: ('TRADE_RETCODE_LONG_ONLY', 'Only long positions are allowed for the symbol'),
+    10043: ('TRADE_RETCODE_SHORT_ONLY', 'Only short positions are allowed for the symbol'),
+    10044: ('TRADE_RETCODE_CLOSE_ONLY', 'Only position closing is allowed for the symbol'),
+    10045: ('TRADE_RETCODE_FIFO_CLOSE', 'Position closing is allowed only by FIFO rule'),
+    10046: ('TRADE_RETCODE_HEDGE_PROHIBITED', 'Opposite positions on a single symbol are disabled'),
+}
+
+
+def _load_from_db():
+    # Imported here so DB-less processes never need sqlalchemy/psycopg2
+    from src.db.db_connection import DBConnector
+
+    df = DBConnector().get_df_from_query("SELECT * FROM mt5_return_codes")
+    return {int(code): (constant, description)
+            for code, constant, description in zip(df['id'], df['Constant'], df['Description'])}
+
+
+class ReturnCodeRegistry:
+    """
+    {RETCODE: (CONSTANT, DESCRIPTION)} loaded once, looked up in O(1).
+    """
+
+    def __init__(self, snapshot='src/db/mt5_return_codes.json', loader=_load_from_db):
+        """
+        :param snapshot: (str) (optional) JSON snapshot used instead of the DB when present, None to disable
+        :param loader: (callable) returns {RETCODE: (CONSTANT, DESCRIPTION)}, default reads mt5_return_codes
+        """
+        self.snapshot = snapshot
+        self.loader = loader
+
+        self._codes = None
+        self._lock = Lock()
+
+    def _load(self):
+        if self.snapshot is not None and os.path.exists(self.snapshot):
+            try:
+                with open(self.snapshot) as f:
+                    return {int(code): tuple(value) for code, value in json.load(f).items()}
+            except (OSError, ValueError) as ex:
+                print('[RETCODES] Unable to read snapshot {}: {}'.format(self.snapshot, ex))
+
+        try:
+            codes = self.loader()
+        except Exception as ex:
+            print('[RETCODES] Unable to load return codes from DB ({}), using built-in table'.format(ex))
+            return dict(TRADE_RETCODES)
+
+        if self.snapshot is not None:
+            self.save_snapshot(codes)
+        return codes
+
+    def save_snapshot(self, codes=None):
+        """
+        Write the registry (or codes) to the snapshot file
+        """
+        codes = self.codes if codes is None else codes
+        try:
+            tmp = self.snapshot + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({str(code): list(value) for code, value in codes.items()}, f, indent=1)
+            os.replace(tmp, self.snapshot)
+        except OSError as ex:
+            print('[RETCODES] Unable to write snapshot {}: {}'.format(self.snapshot, ex))
+
+    @property
+    def codes(self):
+        """ (dict) {RETCODE: (CONSTANT, DESCRIPTION)}, loaded on first use """
+        codes = self._codes
+        if codes is None:
+            with self._lock:
+                if self._codes is None:
+                    self._codes = self._load()
+                codes = self._codes
+        return codes
+
+    def lookup(self, ret_code):
+        """
+        :param ret_code: (int) trade server return code
+        :return: (tuple) (CONSTANT, DESCRIPTION), CONSTANT is None for unknown codes
+        """
+        try:
+            return self.codes[int(ret_code)]
+        except (KeyError, TypeError, ValueError):
+            return TRADE_RETCODES.get(ret_code, (None, 'Unknown return code {}'.format(ret_code)))
+
+    def refresh(self):
+        """
+        Reload the codes from the DB and rewrite the snapshot
+        """
+        codes = self.loader()
+        with self._lock:
+            self._codes = codes
+        if self.snapshot is not None:
+            self.save_snapshot(codes)
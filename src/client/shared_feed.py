@@ -0,0 +1,211 @@
+"""
+Live tick and bar state in shared memory, for strategy worker processes.
+
+SharedTickFeed lays out one multiprocessing.shared_memory block per feed:
+
+    counts     int64[n]                    ticks written per symbol (monotonic sequence number)
+    bar_seq    int64[n]                    seqlock of each symbol's last bar
+    bars       BAR_FIELDS[n]               last completed bar of each symbol
+    ticks      TICK_FIELDS[n, 2*capacity]  per-symbol tick rings, mirrored like RingBuffer
+
+One process writes (the one owning the market data connection, see onTick()/onBar()),
+any number of processes read after attach(spec). Nothing is pickled or copied on the
+write side.
+
+Ticks: the writer stores the row, then increments the symbol's count. A reader copies
+the rows it wants and reads the count again; rows the writer may have started to
+overwrite in the meantime are discarded and reported as lost. The ring therefore holds
+capacity - 1 rows that are always safe to read.
+
+Bars: the writer makes bar_seq odd, writes the bar, makes it even again. A reader retries
+while the sequence is odd or changed during its copy.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.client.bar_aggregator import BAR_FIELDS
+from src.client.dispatch import TICK
+from src.client.tick_store import TICK_FIELDS
+
+
+TICK_DTYPE = np.dtype(list(TICK_FIELDS))
+BAR_DTYPE = np.dtype(list(BAR_FIELDS))
+_ALIGN = 64
+
+
+def _layout(n, capacity):
+    """ :return: (list) [(name, dtype, shape, offset)], total size in bytes """
+    arrays = (('counts', np.dtype(np.int64), (n,)),
+              ('bar_seq', np.dtype(np.int64), (n,)),
+              ('bars', BAR_DTYPE, (n,)),
+              ('ticks', TICK_DTYPE, (n, 2 * capacity)))
+    layout = []
+    offset = 0
+    for name, dtype, shape in arrays:
+        layout.append((name, dtype, shape, offset))
+        offset += -(-dtype.itemsize * int(np.prod(shape)) // _ALIGN) * _ALIGN
+    return layout, max(offset, 1)
+
+
+class SharedTickFeed:
+
+    def __init__(self, symbols, capacity=4096, bar_spec='M1', name=None, _create=True):
+        """
+        Create a feed (use attach() in worker processes)
+        :param symbols: (list of str) symbols published, fixed for the feed's lifetime
+        :param capacity: (int) ticks kept per symbol
+        :param bar_spec: (str) bar spec stored by onBar() (see BarAggregator), other specs are ignored
+        :param name: (str) (optional) shared memory block name, default is a generated one
+        """
+        if capacity < 2:
+            raise ValueError('SharedTickFeed capacity must be >= 2, got {}'.format(capacity))
+
+        self.symbols = list(symbols)
+        self.capacity = int(capacity)
+        self.bar_spec = bar_spec
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._owner = _create
+
+        layout, size = _layout(len(self.symbols), self.capacity)
+        self._shm = shared_memory.SharedMemory(name=name, create=_create, size=size if _create else 0)
+        for array_name, dtype, shape, offset in layout:
+            setattr(self, '_' + array_name, np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset))
+        if _create:
+            self._counts[:] = 0
+            self._bar_seq[:] = 0
+
+    @property
+    def spec(self):
+        """ (tuple) picklable description of the feed, pass it to attach() in another process """
+        return self._shm.name, self.symbols, self.capacity, self.bar_spec
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        :param spec: (tuple) SharedTickFeed.spec of the feed created by the writer process
+        :return: (SharedTickFeed) reader of the feed
+        """
+        name, symbols, capacity, bar_spec = spec
+        return cls(symbols, capacity, bar_spec, name=name, _create=False)
+
+    def index(self, symbol):
+        """ :return: (int) row of the symbol in the shared arrays """
+        return self._index[symbol]
+
+    # Writer side: EAConnector subscriber / BarAggregator handler interface
+    def attach_connector(self, conn):
+        """
+        Publish conn's parsed ticks
+        :param conn: (EAConnector)
+        """
+        conn.add_subscriber(self, self.symbols, kinds=(TICK,))
+
+    def onTick(self, symbol, time_ns, bid, ask):
+        i = self._index.get(symbol)
+        if i is None:
+            return
+        count = int(self._counts[i])
+        idx = count % self.capacity
+        row = self._ticks[i]
+        row[idx] = row[idx + self.capacity] = (time_ns, bid, ask)
+        # Publish the row only once it is written
+        self._counts[i] = count + 1
+
+    def onBar(self, symbol, spec, bar):
+        i = self._index.get(symbol)
+        if i is None or spec != self.bar_spec:
+            return
+        self._bar_seq[i] += 1
+        self._bars[i] = bar
+        self._bar_seq[i] += 1
+
+    def publish_snapshot(self, snapshot, last_time_msc=None):
+        """
+        Publish the ticks of Connector.snapshot() that are new
+        :param snapshot: (dict) Connector.snapshot(symbols) of this feed's symbols, in the same order
+        :param last_time_msc: (ndarray) (optional) time_msc of the previous snapshot
+        :return: (ndarray) mask of the symbols published
+        """
+        time_msc = snapshot['time_msc']
+        new = time_msc > 0 if last_time_msc is None else time_msc > last_time_msc
+        for i in np.flatnonzero(new):
+            self.onTick(self.symbols[i], int(time_msc[i]) * 1000000, snapshot['bid'][i], snapshot['ask'][i])
+        return new
+
+    # Reader side
+    def tick_count(self, symbol):
+        """ :return: (int) ticks published for the symbol, use it as the seq of ticks_since() """
+        return int(self._counts[self._index[symbol]])
+
+    def ticks_since(self, symbol, seq):
+        """
+        :param seq: (int) value of tick_count() or of a previous call's new sequence number
+        :return: (tuple) ({FIELD: ndarray} copies of the rows published after seq, new sequence number,
+                 n# of rows lost because they were overwritten before being read)
+        """
+        i = self._index[symbol]
+        count = int(self._counts[i])
+        first = max(seq, count - self.capacity + 1)
+        start = first % self.capacity
+        rows = self._ticks[i, start:start + count - first].copy()
+
+        # Rows the writer may have been overwriting during the copy
+        safe = int(self._counts[i]) - self.capacity + 1
+        if safe > first:
+            rows = rows[safe - first:]
+            first = safe
+        return {name: rows[name] for name in TICK_DTYPE.names}, count, first - seq
+
+    def last_tick(self, symbol):
+        """ :return: (tuple) (time_ns, bid, ask) of the latest tick, None before the first one """
+        i = self._index[symbol]
+        while True:
+            count = int(self._counts[i])
+            if count == 0:
+                return None
+            row = self._ticks[i, (count - 1) % self.capacity].copy()
+            if int(self._counts[i]) < count + self.capacity - 1:
+                return int(row['time']), float(row['bid']), float(row['ask'])
+
+    def last_ticks(self):
+        """
+        Latest tick of every symbol at once
+        :return: (dict) {FIELD: ndarray} in symbol order plus 'count', symbols without a tick have count 0
+        """
+        rows = np.arange(len(self.symbols))
+        while True:
+            counts = self._counts.copy()
+            ticks = self._ticks[rows, (counts - 1) % self.capacity]
+            if np.all(self._counts < counts + self.capacity - 1):
+                break
+        ticks[counts == 0] = (0, np.nan, np.nan)
+        out = {name: ticks[name] for name in TICK_DTYPE.names}
+        out['count'] = counts
+        return out
+
+    def last_bar(self, symbol):
+        """ :return: (tuple) last completed bar in BAR_FIELDS order, None before the first one """
+        i = self._index[symbol]
+        while True:
+            seq = int(self._bar_seq[i])
+            if seq == 0:
+                return None
+            if seq % 2:
+                continue
+            bar = self._bars[i].copy()
+            if int(self._bar_seq[i]) == seq:
+                return bar.item()
+
+    def bar_count(self, symbol):
+        """ :return: (int) bars published for the symbol """
+        return int(self._bar_seq[self._index[symbol]]) // 2
+
+    def close(self):
+        """ Release this process' mapping, and the shared block itself in the creating process """
+        for array_name in ('counts', 'bar_seq', 'bars', 'ticks'):
+            setattr(self, '_' + array_name, None)
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
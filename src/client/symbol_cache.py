@@ -0,0 +1,93 @@
+"""
+Per-process cache of the static part of MetaTrader5.symbol_info().
+
+Point, digits, contract size, volume limits and the like only change when the broker
+edits the symbol, so they are read once per symbol and reused until ttl seconds pass or
+invalidate() is called. The symbol is also added to the MarketWatch on its first lookup,
+so no order has to check its visibility again.
+"""
+
+from threading import Lock
+from time import monotonic
+
+
+# symbol_info() fields kept by the cache
+STATIC_FIELDS = ('name', 'point', 'digits', 'trade_tick_size', 'trade_tick_value', 'trade_contract_size',
+                 'volume_min', 'volume_max', 'volume_step', 'trade_stops_level', 'trade_freeze_level',
+                 'filling_mode', 'trade_mode', 'currency_base', 'currency_profit', 'visible')
+
+
+class SymbolCache:
+    """
+    {SYMBOL: {FIELD: VALUE}} of static symbol properties with a time to live.
+    """
+
+    def __init__(self, source, ttl=3600.0, fields=STATIC_FIELDS):
+        """
+        :param source: (module) object exposing symbol_info() and symbol_select(), i.e. MetaTrader5
+        :param ttl: (float) seconds an entry is trusted, None to keep entries until invalidate()
+        :param fields: (tuple of str) symbol_info() fields to keep
+        """
+        self.source = source
+        self.ttl = ttl
+        self.fields = tuple(fields)
+
+        self._lock = Lock()
+        self._entries = {}  # {SYMBOL: (EXPIRES, {FIELD: VALUE})}
+
+    def _fetch(self, symbol):
+        info = self.source.symbol_info(symbol)
+        if info is None:
+            return None
+
+        # if the symbol is unavailable in MarketWatch, add it
+        if not info.visible:
+            print('[SYMBOL_CACHE] {} is not visible, trying to switch on'.format(symbol))
+            if self.source.symbol_select(symbol, True):
+                info = self.source.symbol_info(symbol)
+            else:
+                print('[SYMBOL_CACHE] symbol_select({}) failed'.format(symbol))
+
+        info = info._asdict()
+        return {field: info.get(field) for field in self.fields}
+
+    def get(self, symbol):
+        """
+        :param symbol: (str)
+        :return: (dict) {FIELD: VALUE} static properties, None if the terminal does not know the symbol
+        """
+        entry = self._entries.get(symbol)
+        if entry is not None and (entry[0] is None or entry[0] > monotonic()):
+            return entry[1]
+
+        with self._lock:
+            props = self._fetch(symbol)
+            if props is None:
+                print('[SYMBOL_CACHE] {} not found'.format(symbol))
+                self._entries.pop(symbol, None)
+                return None
+            expires = None if self.ttl is None else monotonic() + self.ttl
+            self._entries[symbol] = (expires, props)
+        return props
+
+    def point(self, symbol):
+        """ :return: (float) the symbol's point size """
+        return self.get(symbol)['point']
+
+    def digits(self, symbol):
+        """ :return: (int) number of decimals of the symbol's prices """
+        return self.get(symbol)['digits']
+
+    def invalidate(self, symbol=None):
+        """
+        Drop one symbol, or every symbol if None, so it is read from the terminal again
+        """
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
+
+    def symbols(self):
+        """ :return: (list of str) cached symbols """
+        return list(self._entries)
@@ -0,0 +1,255 @@
+"""
+Preallocated columnar storage for the live market feed.
+
+Every symbol gets two fixed-capacity ring buffers (one for BID/ASK ticks, one for
+TRACK_RATES updates) made of plain NumPy column arrays. Appends are O(1) and never
+allocate, and readers get zero-copy views of the most recent rows.
+
+The buffers are single-writer (the EAConnector poll thread). Views handed to readers
+alias the live arrays, so a reader that needs the rows to stay stable after the writer
+moves on must copy them.
+"""
+
+import numpy as np
+
+
+# Column layout of BID/ASK tick messages: "SYMBOL BID;ASK"
+TICK_FIELDS = (('time', np.int64),  # receive time (ns since epoch, UTC)
+               ('bid', np.float64),
+               ('ask', np.float64))
+
+# Column layout of TRACK_RATES messages: "SYMBOL TIME;OPEN;HIGH;LOW;CLOSE;TICKVOL;SPREAD;VOLUME"
+RATE_FIELDS = (('time', np.int64),  # receive time (ns since epoch, UTC)
+               ('bar_time', np.int64),  # bar open time as sent by MetaTrader (s)
+               ('open', np.float64),
+               ('high', np.float64),
+               ('low', np.float64),
+               ('close', np.float64),
+               ('tick_volume', np.int64),
+               ('spread', np.int64),
+               ('real_volume', np.int64))
+
+
+class RingBuffer:
+    """
+    Fixed-capacity columnar ring buffer.
+
+    Each column is backed by an array of twice the capacity and every value is written
+    to both halves, so the latest ``capacity`` rows are always contiguous in memory and
+    can be returned as views instead of copies.
+    """
+
+    def __init__(self, fields, capacity=100000):
+        """
+        :param fields: (tuple of (str, dtype)) column names and dtypes
+        :param capacity: (int) number of rows kept before the oldest get overwritten
+        """
+        if capacity < 1:
+            raise ValueError('RingBuffer capacity must be >= 1, got {}'.format(capacity))
+
+        self.capacity = int(capacity)
+        self.fields = tuple(name for name, _ in fields)
+        self._columns = tuple(np.zeros(2 * self.capacity, dtype=dtype) for _, dtype in fields)
+
+        # Total number of rows ever appended (monotonic, doubles as a sequence number)
+        self._count = 0
+        # Sequence number of the first row still considered stored (moved by clear())
+        self._floor = 0
+
+    def __len__(self):
+        return min(self._count - self._floor, self.capacity)
+
+    @property
+    def total(self):
+        """ Total number of rows appended since creation, including overwritten ones """
+        return self._count
+
+    def append(self, *values):
+        """
+        Append one row. Values must be given in the order of ``fields``.
+        """
+        idx = self._count % self.capacity
+        mirror = idx + self.capacity
+        for col, value in zip(self._columns, values):
+            col[idx] = value
+            col[mirror] = value
+
+        # Publish the row only once every column is written
+        self._count += 1
+
+    def view(self, n=None):
+        """
+        :param n: (int) (optional) number of most recent rows, default is every retained row
+        :return: (dict) {FIELD: ndarray} zero-copy views, oldest row first
+        """
+        count = self._count
+        size = min(count - self._floor, self.capacity)
+        if n is not None:
+            size = min(size, max(int(n), 0))
+
+        start = (count - size) % self.capacity
+        return {name: col[start:start + size] for name, col in zip(self.fields, self._columns)}
+
+    def since(self, seq):
+        """
+        Rows appended after sequence number ``seq`` (i.e. a previous value of ``total``).
+
+        :param seq: (int) sequence number returned by an earlier call
+        :return: (tuple) ({FIELD: ndarray} zero-copy views, new sequence number, n# of rows lost
+                 because they were overwritten or cleared before being read)
+        """
+        count = self._count
+        first = max(seq, count - self.capacity, self._floor)
+        lost = first - seq if seq < first else 0
+        return self.view(count - first), count, lost
+
+    def last(self):
+        """
+        :return: (tuple) the most recent row, or None if the buffer is empty
+        """
+        if self._count == self._floor:
+            return None
+        idx = (self._count - 1) % self.capacity
+        return tuple(col[idx] for col in self._columns)
+
+    def clear(self):
+        """ Forget every stored row. The sequence number keeps counting. """
+        self._floor = self._count
+
+
+class TickStore:
+    """
+    Per-symbol tick and rate ring buffers.
+    {SYMBOL: RingBuffer(TICK_FIELDS)} and {SYMBOL: RingBuffer(RATE_FIELDS)}
+    """
+
+    def __init__(self, capacity=100000, rate_capacity=None):
+        """
+        :param capacity: (int) rows kept per symbol for BID/ASK ticks
+        :param rate_capacity: (int) (optional) rows kept per symbol for rates, defaults to capacity
+        """
+        self.capacity = capacity
+        self.rate_capacity = capacity if rate_capacity is None else rate_capacity
+
+        self._ticks = {}
+        self._rates = {}
+
+    def append_tick(self, symbol, time_ns, bid, ask):
+        buf = self._ticks.get(symbol)
+        if buf is None:
+            buf = self._ticks[symbol] = RingBuffer(TICK_FIELDS, self.capacity)
+        buf.append(time_ns, bid, ask)
+
+    def append_rate(self, symbol, time_ns, bar_time, _open, high, low, close, tick_volume, spread, real_volume):
+        buf = self._rates.get(symbol)
+        if buf is None:
+            buf = self._rates[symbol] = RingBuffer(RATE_FIELDS, self.rate_capacity)
+        buf.append(time_ns, bar_time, _open, high, low, close, tick_volume, spread, real_volume)
+
+    def tick_buffer(self, symbol):
+        """ :return: (RingBuffer) the symbol's tick buffer or None """
+        return self._ticks.get(symbol)
+
+    def rate_buffer(self, symbol):
+        """ :return: (RingBuffer) the symbol's rate buffer or None """
+        return self._rates.get(symbol)
+
+    def ticks(self, symbol, n=None):
+        """ :return: (dict) zero-copy views of the symbol's latest ticks ({} if never seen) """
+        buf = self._ticks.get(symbol)
+        return {} if buf is None else buf.view(n)
+
+    def rates(self, symbol, n=None):
+        """ :return: (dict) zero-copy views of the symbol's latest rate updates ({} if never seen) """
+        buf = self._rates.get(symbol)
+        return {} if buf is None else buf.view(n)
+
+    def last_tick(self, symbol):
+        """ :return: (tuple) (time_ns, bid, ask) of the latest tick or None """
+        buf = self._ticks.get(symbol)
+        return None if buf is None else buf.last()
+
+    def symbols(self):
+        """ :return: (list of str) every symbol that received ticks or rates """
+        return list(dict.fromkeys(list(self._ticks) + list(self._rates)))
+
+    def clear(self, symbol=None):
+        """
+        Drop stored rows for one symbol, or for every symbol if None. Buffers stay allocated.
+        """
+        for store in (self._ticks, self._rates):
+            for _symbol, buf in list(store.items()):
+                if symbol is None or _symbol == symbol:
+                    buf.clear()
+
+
+class ChunkedColumns:
+    """
+    Append-only column store for consumers that materialize the feed incrementally.
+
+    New rows are kept as small chunks and only copied into the consolidated arrays when
+    they are read. The consolidated arrays grow by doubling, so the total cost is
+    proportional to the number of rows appended and reads return slices, not copies.
+    """
+
+    def __init__(self, fields, initial_capacity=1024):
+        """
+        :param fields: (tuple of (str, dtype)) column names and dtypes
+        :param initial_capacity: (int) rows allocated on the first consolidation
+        """
+        self.fields = tuple(name for name, _ in fields)
+        self._dtypes = tuple(dtype for _, dtype in fields)
+        self._initial_capacity = max(int(initial_capacity), 1)
+
+        self._columns = None
+        self._size = 0
+        self._pending = []
+        self._pending_rows = 0
+
+    def __len__(self):
+        return self._size + self._pending_rows
+
+    @property
+    def pending(self):
+        """ Number of rows appended but not consolidated yet """
+        return self._pending_rows
+
+    def append(self, columns):
+        """
+        :param columns: (dict) {FIELD: ndarray} rows to append. The arrays are copied, so ring
+                        buffer views can be passed in directly.
+        """
+        n = len(columns[self.fields[0]])
+        if n == 0:
+            return
+        self._pending.append(tuple(np.array(columns[name], copy=True) for name in self.fields))
+        self._pending_rows += n
+
+    def consolidate(self):
+        """
+        :return: (dict) {FIELD: ndarray} views of every row appended so far
+        """
+        if self._pending:
+            needed = self._size + self._pending_rows
+            if self._columns is None or needed > len(self._columns[0]):
+                capacity = self._initial_capacity if self._columns is None else len(self._columns[0])
+                while capacity < needed:
+                    capacity *= 2
+                grown = tuple(np.empty(capacity, dtype=dtype) for dtype in self._dtypes)
+                if self._columns is not None:
+                    for new, old in zip(grown, self._columns):
+                        new[:self._size] = old[:self._size]
+                self._columns = grown
+
+            for chunk in self._pending:
+                n = len(chunk[0])
+                for col, values in zip(self._columns, chunk):
+                    col[self._size:self._size + n] = values
+                self._size += n
+
+            self._pending = []
+            self._pending_rows = 0
+
+        if self._columns is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in zip(self.fields, self._dtypes)}
+        return {name: col[:self._size] for name, col in zip(self.fields, self._columns)}
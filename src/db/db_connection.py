@@ -1,10 +1,18 @@
+import csv
+import io
 from configparser import ConfigParser
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 
+import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency, only needed for arrow=True streaming
+    pa = None
+
 # Declarative base class for mapping
 Base = declarative_base()
 
@@ -36,11 +44,77 @@ class DBConnector:
         with self.engine.connect() as conn:
             return pd.read_sql_query(query, conn, **kwargs)
 
+    def iter_table(self, table_name, chunksize=100000, columns=None, dtype=None, arrow=False):
+        """
+        Yield a DB table in chunks, see iter_query()
+        :param columns: (list of str) (optional) columns to read, default is every column
+        """
+        query = "SELECT {} FROM {}".format(', '.join(columns) if columns else '*', table_name)
+        return self.iter_query(query, chunksize=chunksize, dtype=dtype, arrow=arrow)
+
+    def iter_query(self, query, chunksize=100000, dtype=None, arrow=False):
+        """
+        Yield the result of a query in chunks of chunksize rows, read through a server-side cursor so that only
+        one chunk is held in memory at a time
+        :param dtype: (dict) {COLUMN: dtype} applied while building each chunk, skips object column inference
+        :param arrow: (bool) yield pyarrow RecordBatches instead of DataFrames
+        """
+        if arrow and pa is None:
+            raise ImportError('arrow=True requires the pyarrow package (pip install pyarrow)')
+        dtype = dtype or {}
+
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            result = conn.execute(text(query) if isinstance(query, str) else query)
+            columns = list(result.keys())
+
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+
+                data = {name: np.array(values, dtype=dtype[name]) if name in dtype else values
+                        for name, values in zip(columns, zip(*rows))}
+                df = pd.DataFrame(data, columns=columns)
+                yield pa.RecordBatch.from_pandas(df, preserve_index=False) if arrow else df
+
     def execute_query(self, query):
         """ Send and executes query to DB"""
         with self.engine.connect() as conn:
             conn.execute(query)
 
+    def execute_many(self, query, rows):
+        """
+        Executes a parametrized query (psycopg2 %s placeholders) for every row in one transaction
+        :param rows: (list of tuple) query parameters
+        """
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.executemany(query, rows)
+            cur.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+    def copy_records(self, table_name, columns, rows):
+        """
+        Bulk loads rows into a table with COPY ... FROM STDIN
+        :param columns: (list of str) target columns
+        :param rows: (list of tuple) values in the order of columns, None is loaded as NULL
+        """
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table_name, ', '.join(columns)), buf)
+            cur.close()
+            conn.commit()
+        finally:
+            conn.close()
+
     @staticmethod
     def config(filename='src/db/database.ini', section='postgresql'):
         # create parser
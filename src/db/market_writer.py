@@ -0,0 +1,255 @@
+"""
+Micro-batched persistence of the live SUB feed.
+
+MarketDataWriter is an EAConnector subscriber (see EAConnector.add_subscriber()). On the
+poll thread it only appends the parsed tick or rate to a per-symbol buffer. A writer
+thread swaps the buffers every flush_interval seconds and bulk loads them with COPY.
+
+When the DB falls behind, the buffers stop growing at max_buffered rows and new rows are
+counted as dropped. A failed write marks the DB down, the writer then waits with an
+exponential backoff (up to max_backoff seconds) before trying it again, rows received
+meanwhile stay buffered. With policy='spill', those rows go to CSV files in spill_dir
+instead, as do batches above spill_threshold rows that the DB would take longer than
+flush_interval to write at its measured speed. Spill files are loaded back once the DB
+keeps up again.
+"""
+
+import csv
+import os
+from threading import Event, Lock, Thread
+from time import monotonic, time_ns
+
+import numpy as np
+
+
+TICK_COLUMNS = ('symbol', 'time', 'bid', 'ask')
+RATE_COLUMNS = ('symbol', 'time', 'bar_time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume')
+
+
+def _timestamps(values, unit):
+    """ epoch ints -> ISO strings Postgres parses as timestamp """
+    return np.datetime_as_string(np.array(values, dtype='datetime64[{}]'.format(unit)), unit='us')
+
+
+class MarketDataWriter:
+
+    def __init__(self, dbconn, tick_table='market_ticks', rate_table='market_rates', flush_interval=1.0,
+                 max_buffered=1000000, policy='drop', spill_threshold=200000, spill_dir='market_spill',
+                 max_backoff=60.0):
+        """
+        :param dbconn: (DBConnector) connection used by the writer thread
+        :param tick_table: (str) table receiving BID/ASK ticks (symbol, time, bid, ask)
+        :param rate_table: (str) table receiving rates (symbol, time, bar_time, open, ..., real_volume)
+        :param flush_interval: (float) seconds between two bulk loads
+        :param max_buffered: (int) rows held in memory, rows received above it are dropped
+        :param policy: (str) 'drop' to only drop above max_buffered, 'spill' to also write the backlog to disk
+        :param spill_threshold: (int) batches above this size are spilled when the DB could not write them within
+                                flush_interval (policy='spill')
+        :param spill_dir: (str) directory of the spill files
+        :param max_backoff: (float) max seconds between two attempts while the DB is down
+        """
+        if policy not in ('drop', 'spill'):
+            raise ValueError("policy must be 'drop' or 'spill', got {}".format(policy))
+
+        self.dbconn = dbconn
+        self.tick_table = tick_table
+        self.rate_table = rate_table
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.policy = policy
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.max_backoff = max_backoff
+
+        self._lock = Lock()
+        self._ticks = {}  # {SYMBOL: [(TIME_NS, BID, ASK), ...]}
+        self._rates = {}  # {SYMBOL: [(TIME_NS, BAR_TIME, OPEN, HIGH, LOW, CLOSE, TICKVOL, SPREAD, VOLUME), ...]}
+        self._buffered = 0
+        self._oldest = None  # receive time (ns) of the oldest buffered row
+
+        # DB health, kept across flushes
+        self._retry_at = 0.0  # monotonic time before which the DB is considered down
+        self._backoff = 0.0
+        self._row_cost = None  # seconds per row of the last bulk loads (moving average)
+
+        # Metrics
+        self.written_ticks = 0
+        self.written_rates = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+        self._stop = Event()
+        self._writer = Thread(name='Market_Data_Writer', target=self._run)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def attach(self, conn, symbols=None):
+        """
+        Subscribe to conn's parsed ticks and rates
+        :param conn: (EAConnector)
+        :param symbols: (list of str) (optional) symbols to persist, default is every symbol
+        """
+        conn.add_subscriber(self, symbols)
+
+    # Called on the EAConnector poll thread, keep these cheap
+    def onTick(self, symbol, time_ns, bid, ask):
+        with self._lock:
+            if self._buffered >= self.max_buffered:
+                self.dropped += 1
+                return
+            self._ticks.setdefault(symbol, []).append((time_ns, bid, ask))
+            self._buffered += 1
+            if self._oldest is None:
+                self._oldest = time_ns
+
+    def onRate(self, symbol, time_ns, *rate):
+        with self._lock:
+            if self._buffered >= self.max_buffered:
+                self.dropped += 1
+                return
+            self._rates.setdefault(symbol, []).append((time_ns,) + rate)
+            self._buffered += 1
+            if self._oldest is None:
+                self._oldest = time_ns
+
+    def metrics(self):
+        """
+        :return: (dict) buffered rows, lag (s) of the oldest buffered row and the writer's counters
+        """
+        oldest = self._oldest
+        return {'buffered': self._buffered,
+                'lag_s': 0.0 if oldest is None else (time_ns() - oldest) / 1e9,
+                'written_ticks': self.written_ticks,
+                'written_rates': self.written_rates,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'spill_files': len(self._spill_files()),
+                'failed_flushes': self.failed_flushes,
+                'db_down': monotonic() < self._retry_at,
+                'last_flush_ms': self.last_flush_ms}
+
+    def close(self, timeout=10.0):
+        """
+        Stop the writer thread after a final flush
+        """
+        self._stop.set()
+        self._writer.join(timeout)
+
+    def _swap(self):
+        with self._lock:
+            ticks, rates, buffered = self._ticks, self._rates, self._buffered
+            self._ticks, self._rates, self._buffered, self._oldest = {}, {}, 0, None
+        return ticks, rates, buffered
+
+    @staticmethod
+    def _tick_rows(ticks):
+        rows = []
+        for symbol, values in ticks.items():
+            times, bids, asks = zip(*values)
+            rows.extend(zip([symbol] * len(values), _timestamps(times, 'ns'), bids, asks))
+        return rows
+
+    @staticmethod
+    def _rate_rows(rates):
+        rows = []
+        for symbol, values in rates.items():
+            columns = list(zip(*values))
+            columns[0] = _timestamps(columns[0], 'ns')
+            columns[1] = _timestamps(columns[1], 's')
+            rows.extend(zip([symbol] * len(values), *columns))
+        return rows
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.flush_interval)
+
+            down = monotonic() < self._retry_at
+            if down and self.policy == 'drop' and not stopping:
+                continue  # rows stay buffered, up to max_buffered, until the next attempt
+
+            ticks, rates, buffered = self._swap()
+            spill = self.policy == 'spill' and (down or self._too_slow(buffered))
+
+            start = monotonic()
+            ok = True
+            for table, columns, rows in ((self.tick_table, TICK_COLUMNS, self._tick_rows(ticks)),
+                                         (self.rate_table, RATE_COLUMNS, self._rate_rows(rates))):
+                if not rows:
+                    continue
+                if spill or not ok:
+                    self._spill(table, rows)
+                    continue
+                if not self._copy(table, columns, rows):
+                    ok = False
+                    self.failed_flushes += 1
+                    if self.policy == 'spill':
+                        self._spill(table, rows)
+                    else:
+                        self.dropped += len(rows)
+            self.last_flush_ms = (monotonic() - start) * 1e3
+
+            # Catch up on spilled rows while the DB keeps up
+            if ok and not spill:
+                self._load_spill_files()
+
+            if stopping:
+                break
+
+    def _too_slow(self, rows):
+        """ :return: (bool) True if writing rows would take the DB longer than flush_interval """
+        return rows > self.spill_threshold and self._row_cost is not None \
+            and rows * self._row_cost > self.flush_interval
+
+    def _copy(self, table, columns, rows, source=None):
+        """
+        Bulk load rows, keeping track of the DB's health and speed
+        :param source: (str) (optional) spill file the rows come from, for the log
+        :return: (bool) False if the write failed, the DB is then considered down until the next attempt
+        """
+        start = monotonic()
+        try:
+            self.dbconn.copy_records(table, columns, rows)
+        except Exception as ex:
+            self._backoff = min(self._backoff * 2 or self.flush_interval, self.max_backoff)
+            self._retry_at = monotonic() + self._backoff
+            print('[MARKET_WRITER] Unable to write {} rows to {}{}: {}, next attempt in {:.0f}s'.format(
+                len(rows), table, '' if source is None else ' from ' + source, ex, self._backoff))
+            return False
+
+        cost = (monotonic() - start) / len(rows)
+        self._row_cost = cost if self._row_cost is None else 0.8 * self._row_cost + 0.2 * cost
+        self._backoff = self._retry_at = 0.0
+        if table == self.tick_table:
+            self.written_ticks += len(rows)
+        else:
+            self.written_rates += len(rows)
+        return True
+
+    def _spill(self, table, rows):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, '{}.{}.csv'.format(table, time_ns()))
+        with open(path + '.tmp', 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        os.replace(path + '.tmp', path)
+        self.spilled += len(rows)
+
+    def _spill_files(self):
+        if not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(name for name in os.listdir(self.spill_dir) if name.endswith('.csv'))
+
+    def _load_spill_files(self, max_files=10):
+        for name in self._spill_files()[:max_files]:
+            if monotonic() < self._retry_at:
+                return
+            table = name.rsplit('.', 2)[0]
+            columns = TICK_COLUMNS if table == self.tick_table else RATE_COLUMNS
+            path = os.path.join(self.spill_dir, name)
+            with open(path, newline='') as f:
+                rows = list(csv.reader(f))
+            if not self._copy(table, columns, rows, source=name):
+                return
+            os.remove(path)
+            self.spilled -= len(rows)
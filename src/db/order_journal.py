@@ -0,0 +1,246 @@
+"""
+Write-behind journal for the order_history table.
+
+Trading threads only enqueue order rows. A background thread writes them to Postgres in
+batches (COPY, or executemany) when batch_size rows are waiting or flush_interval
+seconds have passed. If the queue is full or a write fails, the rows are appended to a
+local spool file and fsync'ed. The spool is replayed once the DB accepts writes again,
+and a final flush runs on close() and at interpreter exit.
+
+Each journal owns its spool file, named after the journal (e.g. the strategy), so
+journals never replay each other's rows. Two open journals of a process cannot share a
+spool file, and two processes should not run journals of the same name.
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+
+
+# Columns of the order_history table, in the order of the rows passed to record()
+ORDER_COLUMNS = ('orderid', 'timestamp', 'retcode', 'symbol', 'price', 'bid', 'ask', 'comment', 'volume', 'dealid',
+                 'tr_action', 'tr_volume', 'tr_price', 'tr_stoplimit', 'tr_sl', 'tr_tp', 'tr_type',
+                 'tr_type_filling', 'tr_type_time', 'tr_expiration', 'tr_comment')
+
+
+class OrderJournal:
+
+    # Spool files of the open journals of this process
+    _spool_paths = set()
+    _spool_paths_lock = Lock()
+
+    def __init__(self, dbconn, name=None, table_name='order_history', columns=ORDER_COLUMNS, batch_size=500,
+                 flush_interval=1.0, max_pending=100000, spool_path=None, use_copy=True):
+        """
+        :param dbconn: (DBConnector) connection used by the writer thread
+        :param name: (str) name of the journal, e.g. the strategy's, default spool file is order_journal_<name>.spool
+                     (order_journal_<pid>.spool without a name)
+        :param table_name: (str) target table
+        :param columns: (tuple of str) target columns
+        :param batch_size: (int) rows written per batch
+        :param flush_interval: (float) max seconds a row waits before being written
+        :param max_pending: (int) rows held in memory, rows above it are spooled to disk straight away
+        :param spool_path: (str) (optional) local file holding the rows that could not be written to the DB
+        :param use_copy: (bool) True to bulk load with COPY, False for executemany INSERTs
+        """
+        if spool_path is None:
+            suffix = re.sub(r'\W+', '_', name).strip('_') if name else str(os.getpid())
+            spool_path = 'order_journal_{}.spool'.format(suffix or os.getpid())
+        with OrderJournal._spool_paths_lock:
+            if os.path.abspath(spool_path) in OrderJournal._spool_paths:
+                raise ValueError('Spool file {} is used by another open OrderJournal'.format(spool_path))
+            OrderJournal._spool_paths.add(os.path.abspath(spool_path))
+
+        self.dbconn = dbconn
+        self.name = name
+        self.table_name = table_name
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.use_copy = use_copy
+
+        # Metrics
+        self.written = 0
+        self.spooled = 0
+        self.failed_flushes = 0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._spool_lock = Lock()
+        self._record_lock = Lock()  # no row is queued once close() set _stop
+        self._flush_requested = Event()
+        self._flush_done = Condition()
+        self._flush_generation = 0  # flushes requested
+        self._flushed_generation = 0  # flushes completed
+        self._stop = Event()
+
+        self._writer = Thread(name='Order_Journal', target=self._run)
+        self._writer.daemon = True
+        self._writer.start()
+
+        atexit.register(self.close)
+
+    def record(self, row):
+        """
+        Queue one order row for writing, never blocks on the DB
+        :param row: (tuple) values in the order of columns
+        """
+        row = tuple(row)
+        with self._record_lock:
+            if not self._stop.is_set():
+                try:
+                    self._queue.put_nowait(row)
+                    return
+                except queue.Full:
+                    pass
+        self._spool([row])
+
+    @property
+    def pending(self):
+        """ Number of rows waiting in memory """
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """
+        Write every queued row now
+        :return: (bool) True if the flush completed within timeout
+        """
+        with self._flush_done:
+            self._flush_generation += 1
+            generation = self._flush_generation
+            self._flush_requested.set()
+            return self._flush_done.wait_for(lambda: self._flushed_generation >= generation, timeout)
+
+    def close(self, timeout=10.0):
+        """
+        Stop the writer thread after a final flush. Rows it could not write stay in the spool file.
+        """
+        with self._record_lock:
+            if self._stop.is_set():
+                return
+            self._stop.set()
+        self._flush_requested.set()
+        self._writer.join(timeout)
+
+        # Rows the writer did not take, if it did not stop in time
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._spool(rows)
+
+        with OrderJournal._spool_paths_lock:
+            OrderJournal._spool_paths.discard(os.path.abspath(self.spool_path))
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
+
+    def _run(self):
+        # Rows left over by a previous process, including a replay it did not finish
+        replaying = self.spool_path + '.replay'
+        if os.path.exists(replaying):
+            with open(replaying) as f:
+                self._spool([tuple(json.loads(line)) for line in f if line.strip()])
+            os.remove(replaying)
+            self.spooled = 0
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path) as f:
+                self.spooled = sum(1 for line in f if line.strip())
+            self._replay_spool()
+
+        batch = []
+        deadline = None
+
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=0.05))
+                if deadline is None:
+                    deadline = monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            flush_requested = self._flush_requested.is_set()
+            if not (len(batch) >= self.batch_size or flush_requested or (batch and monotonic() >= deadline)):
+                continue
+
+            if flush_requested:
+                # Flushes requested from now on wait for the next round
+                with self._flush_done:
+                    generation = self._flush_generation
+                    self._flush_requested.clear()
+                stopping = self._stop.is_set()
+                # The rows queued before the request, not those recorded meanwhile
+                for _ in range(self._queue.qsize()):
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            ok = True
+            for start in range(0, len(batch), self.batch_size):
+                ok = self._write(batch[start:start + self.batch_size]) and ok
+            if ok and self.spooled:
+                self._replay_spool()
+            batch = []
+            deadline = None
+
+            if flush_requested:
+                with self._flush_done:
+                    self._flushed_generation = generation
+                    self._flush_done.notify_all()
+                if stopping:
+                    break
+
+    def _write(self, rows):
+        try:
+            if self.use_copy:
+                self.dbconn.copy_records(self.table_name, self.columns, rows)
+            else:
+                query = "INSERT INTO {} ({}) VALUES ({})".format(self.table_name, ', '.join(self.columns),
+                                                                ', '.join(['%s'] * len(self.columns)))
+                self.dbconn.execute_many(query, rows)
+            self.written += len(rows)
+            return True
+        except Exception as ex:
+            self.failed_flushes += 1
+            print('[ORDER_JOURNAL] Unable to write {} rows to {}, spooling them: {}'.format(len(rows),
+                                                                                        self.table_name, ex))
+            self._spool(rows)
+            return False
+
+    def _spool(self, rows):
+        with self._spool_lock:
+            with open(self.spool_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.spooled += len(rows)
+
+    def _replay_spool(self):
+        """
+        Move spooled rows to the DB. Rows that fail again go back to the spool file.
+        """
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            replaying = self.spool_path + '.replay'
+            os.replace(self.spool_path, replaying)
+            with open(replaying) as f:
+                rows = [tuple(json.loads(line)) for line in f if line.strip()]
+            self.spooled -= len(rows)
+
+        for start in range(0, len(rows), self.batch_size):
+            if not self._write(rows[start:start + self.batch_size]):
+                # The failed batch was spooled again by _write(), keep the rest too
+                self._spool(rows[start + self.batch_size:])
+                break
+        os.remove(replaying)
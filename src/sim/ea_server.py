@@ -0,0 +1,295 @@
+"""
+Local stand-in for the MetaTrader ZeroMQ expert advisor.
+
+EAServer binds the three sockets EAConnector connects to and speaks the same text
+protocol:
+    push_port   PULL, receives TRADE / HIST / TRACK_PRICES / TRACK_RATES commands
+    pull_port   PUSH, sends the responses as python dict literals, like the DWX EA
+    sub_port    PUB, publishes "SYMBOL BID;ASK" ticks and "SYMBOL_TF TIME;O;H;L;C;TV;SP;RV" rates
+
+Ticks are published at tick_rate messages per second in total, round robin over the
+tracked symbols. Each symbol's bid encodes its own tick sequence number
+(bid = base + (seq % SEQ_MODULO) * 1e-5), so a consumer can count dropped ticks with
+decode_seq(). When the server runs in the same process, sent_at(symbol, seq) returns the
+publish time, for end-to-end latency.
+
+Run standalone with:
+    python -m src.sim.ea_server --symbols 40 --rate 20000
+"""
+
+import argparse
+from itertools import count
+from threading import Event, Thread
+from time import perf_counter, sleep, time, time_ns
+
+import numpy as np
+import zmq
+
+
+SEQ_MODULO = 100000
+SENT_AT_SIZE = 1 << 16  # publish times kept per symbol, the most recent ticks only
+BASE_PRICE = 1.0
+SPREAD = 0.0002
+
+
+def synthetic_symbols(n):
+    """ :return: (list of str) n symbol names, SYM000, SYM001, ... """
+    return ['SYM{:03d}'.format(i) for i in range(n)]
+
+
+def decode_seq(bid):
+    """
+    :param bid: (float) bid published by EAServer
+    :return: (int) the symbol's tick sequence number modulo SEQ_MODULO
+    """
+    return int(round((bid - BASE_PRICE) * 1e5)) % SEQ_MODULO
+
+
+class EAServer:
+
+    def __init__(self, symbols=None, tick_rate=1000, host='*', push_port=32768, pull_port=32769, sub_port=32770,
+                 order_latency=0.0, rate_interval=1.0, delimiter=';'):
+        """
+        :param symbols: (list of str) symbols tracked from the start, default is 10 synthetic ones
+        :param tick_rate: (float) ticks published per second over all symbols
+        :param host: (str) interface to bind
+        :param push_port: (int) port EAConnector sends commands to
+        :param pull_port: (int) port EAConnector reads responses from
+        :param sub_port: (int) port EAConnector reads market data from
+        :param order_latency: (float) seconds before a TRADE command is answered
+        :param rate_interval: (float) seconds between two rate updates of a TRACK_RATES instrument
+        """
+        self.symbols = list(synthetic_symbols(10) if symbols is None else symbols)
+        self.tick_rate = tick_rate
+        self.order_latency = order_latency
+        self.rate_interval = rate_interval
+        self.delimiter = delimiter
+
+        self._context = zmq.Context()
+        self._commands = self._context.socket(zmq.PULL)
+        self._commands.bind('tcp://{}:{}'.format(host, push_port))
+        self._responses = self._context.socket(zmq.PUSH)
+        self._responses.bind('tcp://{}:{}'.format(host, pull_port))
+        self._pub = self._context.socket(zmq.PUB)
+        self._pub.setsockopt(zmq.SNDHWM, 0)
+        self._pub.bind('tcp://{}:{}'.format(host, sub_port))
+
+        self._tracked = list(self.symbols)
+        self._rates = []  # [(SYMBOL, TIMEFRAME)]
+        self._seq = {}  # {SYMBOL: ticks published}
+        self._sent_at = {}  # {SYMBOL: int64 ring of publish times (ns), indexed by seq % SENT_AT_SIZE}
+        self._tickets = count(1)
+        self._positions = {}  # {TICKET: (MAGIC, SYMBOL, TYPE, LOTS, PRICE)}
+
+        # Metrics
+        self.ticks_sent = 0
+        self.commands = 0
+
+        self._stop = Event()
+        self._threads = []
+
+    def start(self):
+        """ Start the publisher and command threads """
+        for name, target in (('EA_Server_Publisher', self._publish), ('EA_Server_Commands', self._serve)):
+            thread = Thread(name=name, target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._context.destroy(0)
+
+    def sent_at(self, symbol, seq):
+        """
+        :param seq: (int) sequence number from decode_seq()
+        :return: (int) publish time (ns since epoch) of the symbol's tick, 0 if unknown
+        """
+        ring = self._sent_at.get(symbol)
+        return 0 if ring is None else int(ring[seq % SENT_AT_SIZE])
+
+    # Market data
+    def _tick(self, symbol):
+        seq = self._seq.get(symbol, 0)
+        self._seq[symbol] = seq + 1
+        ring = self._sent_at.get(symbol)
+        if ring is None:
+            ring = self._sent_at[symbol] = np.zeros(SENT_AT_SIZE, dtype=np.int64)
+        bid = BASE_PRICE + (seq % SEQ_MODULO) * 1e-5
+        ring[(seq % SEQ_MODULO) % SENT_AT_SIZE] = time_ns()
+        self._pub.send_string('{} {:.5f}{}{:.5f}'.format(symbol, bid, self.delimiter, bid + SPREAD))
+
+    def _rate(self, symbol, timeframe):
+        seq = self._seq.get(symbol, 0)
+        close = BASE_PRICE + (seq % SEQ_MODULO) * 1e-5
+        bar_time = int(time()) // 60 * 60
+        self._pub.send_string('{}_{} {}'.format(symbol, timeframe, self.delimiter.join(
+            str(v) for v in (bar_time, close, close + 5e-5, close - 5e-5, close, 100, 20, 0))))
+
+    def _publish(self):
+        sent = 0
+        budget = 0.0  # ticks due, at most 1 s worth so a stall is not followed by a burst
+        last = next_rates = perf_counter()
+        while not self._stop.is_set():
+            now = perf_counter()
+            budget = min(budget + (now - last) * self.tick_rate, max(self.tick_rate, 1.0))
+            last = now
+            symbols = self._tracked
+            if symbols and budget >= 1.0:
+                # batches of at most 1000, so tick_rate changes and stop() apply quickly
+                batch = min(int(budget), 1000)
+                for _ in range(batch):
+                    self._tick(symbols[sent % len(symbols)])
+                    sent += 1
+                budget -= batch
+                self.ticks_sent = sent
+                if budget >= 1.0:
+                    continue
+            if self._rates and now >= next_rates:
+                for symbol, timeframe in self._rates:
+                    self._rate(symbol, timeframe)
+                next_rates = now + self.rate_interval
+            sleep(0.0005)
+
+    # Commands
+    def _serve(self):
+        poller = zmq.Poller()
+        poller.register(self._commands, zmq.POLLIN)
+        while not self._stop.is_set():
+            if not poller.poll(100):
+                continue
+            msg = self._commands.recv_string()
+            self.commands += 1
+            fields = msg.split(self.delimiter)
+            try:
+                response = self._handle(fields)
+            except (ValueError, IndexError) as ex:
+                response = {'_action': 'ERROR', '_response': 'MALFORMED_COMMAND', '_command': fields[0],
+                            '_response_value': str(ex)}
+            if response is not None:
+                self._send(str(response))
+
+    def _send(self, text):
+        """ Send a response once a client can take it, give up on stop() """
+        while not self._stop.is_set():
+            if self._responses.poll(100, zmq.POLLOUT):
+                try:
+                    self._responses.send_string(text, zmq.NOBLOCK)
+                    return
+                except zmq.Again:
+                    continue
+
+    def _handle(self, fields):
+        command = fields[0]
+        if command == 'TRADE':
+            # TRADE;ACTION;TYPE;SYMBOL;PRICE;SL;TP;COMMENT;LOTS;MAGIC;TICKET[;REQUEST_ID]
+            response = self._trade(fields)
+            request_id = fields[11] if len(fields) > 11 else None
+        elif command == 'HIST':
+            # HIST;SYMBOL;TIMEFRAME;START;END[;REQUEST_ID]
+            response = self._hist(fields[1], int(fields[2]), fields[3], fields[4])
+            request_id = fields[5] if len(fields) > 5 else None
+        elif command == 'TRACK_PRICES':
+            self._tracked = [s for s in fields[1:] if s and not s.isdigit()] or self._tracked
+            response = {'_action': 'TRACK_PRICES', '_data': {'symbol_count': len(self._tracked)}}
+            request_id = fields[-1] if fields[-1].isdigit() else None
+        elif command == 'TRACK_RATES':
+            request_id = fields[-1] if len(fields) % 2 == 0 and fields[-1].isdigit() else None
+            pairs = fields[1:-1] if request_id is not None else fields[1:]
+            self._rates = [(pairs[i], int(pairs[i + 1])) for i in range(0, len(pairs) - 1, 2)]
+            response = {'_action': 'TRACK_RATES', '_data': {'instrument_count': len(self._rates)}}
+        else:
+            return {'_action': 'ERROR', '_response': 'UNKNOWN_COMMAND', '_command': command}
+
+        if request_id is not None:
+            response['_request_id'] = int(request_id)
+        return response
+
+    def _trade(self, fields):
+        action, _type, symbol = fields[1], int(fields[2]), fields[3]
+        lots, magic, ticket = float(fields[8]), int(fields[9]), int(fields[10])
+        if self.order_latency:
+            sleep(self.order_latency)
+        bid = BASE_PRICE + (self._seq.get(symbol, 0) % SEQ_MODULO) * 1e-5
+        price = bid + SPREAD if _type % 2 == 0 else bid
+
+        if action == 'OPEN':
+            ticket = next(self._tickets)
+            self._positions[ticket] = (magic, symbol, _type, lots, price)
+            return {'_action': 'EXECUTION', '_magic': magic, '_ticket': ticket, '_open_price': price,
+                    '_sl': float(fields[5]), '_tp': float(fields[6])}
+        if action in ('CLOSE', 'CLOSE_PARTIAL'):
+            if self._positions.pop(ticket, None) is None:
+                return {'_action': 'CLOSE', '_ticket': ticket, '_response': 'NOT_FOUND'}
+            return {'_action': 'CLOSE', '_ticket': ticket, '_close_price': price, '_close_lots': lots,
+                    '_response': 'CLOSE_MARKET'}
+        if action == 'CLOSE_MAGIC':
+            closed = [t for t, p in self._positions.items() if p[0] == magic]
+            for t in closed:
+                del self._positions[t]
+            return {'_action': 'CLOSE_ALL_MAGIC', '_magic': magic, '_trades': {t: {} for t in closed}}
+        if action == 'CLOSE_ALL':
+            closed = list(self._positions)
+            self._positions.clear()
+            return {'_action': 'CLOSE_ALL', '_trades': {t: {} for t in closed}}
+        if action == 'MODIFY':
+            return {'_action': 'MODIFY', '_ticket': ticket, '_sl': float(fields[5]), '_tp': float(fields[6])}
+        if action == 'GET_OPEN_TRADES':
+            return {'_action': 'OPEN_TRADES', '_trades': {
+                t: {'_magic': p[0], '_symbol': p[1], '_type': p[2], '_lots': p[3], '_open_price': p[4]}
+                for t, p in self._positions.items()}}
+        return {'_action': 'EXECUTION', '_response': 'UNKNOWN_ACTION'}
+
+    def _hist(self, symbol, timeframe, start, end, max_bars=100000):
+        """ Bars between start and end ('YYYY.MM.DD HH:MM[:SS]'), closes on a slow sine wave """
+        def parse(value):
+            return int(np.datetime64(value.replace('.', '-').replace(' ', 'T'), 's').astype(np.int64))
+
+        seconds = 60 * timeframe
+        first = -(-parse(start) // seconds) * seconds
+        times = np.arange(first, parse(end) + 1, seconds, dtype=np.int64)[-max_bars:]
+        closes = np.round(BASE_PRICE + 0.01 * np.sin(times / 86400.0), 5)
+        labels = np.datetime_as_string(times.astype('datetime64[s]'), unit='m')
+        bars = ["{{'time': '{}', 'open': {}, 'high': {}, 'low': {}, 'close': {}, 'tick_volume': 100, 'spread': 20, "
+                "'real_volume': 0}}".format(label.replace('-', '.').replace('T', ' '), c, round(c + 5e-4, 5),
+                                            round(c - 5e-4, 5), c)
+                for label, c in zip(labels, closes)]
+        return _Raw("{{'_action': 'HIST', '_symbol': '{}', '_data': [{}]}}".format(symbol, ', '.join(bars)))
+
+
+class _Raw(dict):
+    """ Pre-rendered response (HIST), sent as is """
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def __setitem__(self, key, value):
+        # '_request_id' is spliced into the rendered text
+        self.text = self.text[:-1] + ", '{}': {}}}".format(key, value)
+
+    def __str__(self):
+        return self.text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local MetaTrader EA simulator')
+    parser.add_argument('--symbols', type=int, default=10, help='number of synthetic symbols')
+    parser.add_argument('--rate', type=float, default=1000, help='ticks per second over all symbols')
+    parser.add_argument('--order-latency', type=float, default=0.0, help='seconds before TRADE responses')
+    args = parser.parse_args()
+
+    server = EAServer(synthetic_symbols(args.symbols), args.rate, order_latency=args.order_latency).start()
+    print('[EA_SERVER] Publishing {} ticks/s over {} symbols, ctrl-c to stop'.format(args.rate, args.symbols))
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
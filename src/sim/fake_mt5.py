@@ -0,0 +1,331 @@
+"""
+In-process stand-in for the MetaTrader5 package.
+
+It exposes the subset of the MetaTrader5 API used by src.client.connector, returning
+namedtuples shaped like the real ones. Prices follow a random walk per symbol and orders
+are filled at once. It is meant for benchmarks and offline runs on machines without a
+terminal:
+
+    from src.sim import fake_mt5
+    fake_mt5.install()                # before anything imports MetaTrader5
+    from src.client.connector import Connector
+
+set_latency() adds a delay to every terminal call to mimic the IPC round trip: a fixed one,
+or per call from a profile like REALISTIC_LATENCY, with a random jitter:
+
+    fake_mt5.install(latency='realistic')
+"""
+
+import sys
+from collections import namedtuple
+from itertools import count
+from random import Random
+from threading import Lock
+from time import sleep, time
+
+import numpy as np
+
+from src.client.order_types import (OrderCheckResult, OrderSendResult, TradePosition, TradeRequest,
+                                     TRADE_RETCODE_DONE, TRADE_RETCODE_INVALID, TRADE_RETCODE_INVALID_STOPS,
+                                     TRADE_RETCODE_MARKET_CLOSED)
+from src.client.rates_cache import timeframe_seconds
+
+
+# Constants (values of the MetaTrader5 package)
+TIMEFRAME_M1, TIMEFRAME_M5, TIMEFRAME_M15, TIMEFRAME_M30 = 1, 5, 15, 30
+TIMEFRAME_H1, TIMEFRAME_H4, TIMEFRAME_D1 = 0x4001, 0x4004, 0x4018
+TIMEFRAME_W1, TIMEFRAME_MN1 = 0x8001, 0xC001
+
+TRADE_ACTION_DEAL, TRADE_ACTION_PENDING, TRADE_ACTION_SLTP, TRADE_ACTION_MODIFY = 1, 5, 6, 7
+TRADE_ACTION_REMOVE, TRADE_ACTION_CLOSE_BY = 8, 10
+ORDER_TYPE_BUY, ORDER_TYPE_SELL, ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_LIMIT = 0, 1, 2, 3
+ORDER_TYPE_BUY_STOP, ORDER_TYPE_SELL_STOP, ORDER_TYPE_BUY_STOP_LIMIT, ORDER_TYPE_SELL_STOP_LIMIT = 4, 5, 6, 7
+ORDER_TIME_GTC, ORDER_TIME_DAY, ORDER_TIME_SPECIFIED, ORDER_TIME_SPECIFIED_DAY = 0, 1, 2, 3
+ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+# TRADE_RETCODE_* and the order structures are shared with the backtester, see src.client.order_types
+
+RATES_DTYPE = np.dtype([('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                        ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')])
+
+AccountInfo = namedtuple('AccountInfo', ['login', 'trade_mode', 'leverage', 'limit_orders', 'margin_so_mode',
+                                         'trade_allowed', 'trade_expert', 'margin_mode', 'currency_digits',
+                                         'fifo_close', 'balance', 'credit', 'profit', 'equity', 'margin',
+                                         'margin_free', 'margin_level', 'margin_so_call', 'margin_so_so',
+                                         'margin_initial', 'margin_maintenance', 'assets', 'liabilities',
+                                         'commission_blocked', 'name', 'server', 'currency', 'company'])
+SymbolInfo = namedtuple('SymbolInfo', ['name', 'visible', 'select', 'bid', 'ask', 'last', 'time', 'point',
+                                       'digits', 'spread', 'trade_tick_size', 'trade_tick_value',
+                                       'trade_contract_size', 'volume_min', 'volume_max', 'volume_step',
+                                       'trade_stops_level', 'trade_freeze_level', 'filling_mode', 'trade_mode',
+                                       'currency_base', 'currency_profit'])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume', 'time_msc', 'flags', 'volume_real'])
+# Typical terminal round trips (s) of a local MT5 terminal, order_send includes the trade server
+REALISTIC_LATENCY = {'order_send': 0.015, 'order_check': 0.0005, 'copy_rates': 0.002, 'symbol_info': 0.0001,
+                     'default': 0.00005}
+REALISTIC_JITTER = 0.5
+
+
+class _Terminal:
+    """
+    State of the simulated terminal
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.random = Random(0)
+        self.latency = {}  # {CALL: seconds}, 'default' for the other calls
+        self.jitter = 0.0
+        self.jitter_random = Random(0)
+        self.connected = False
+        self.last_error = (1, 'Success')
+        self.symbols = {}  # {SYMBOL: {'point': .., 'digits': .., 'visible': .., 'bid': .., 'spread': ..}}
+        self.positions = {}  # {TICKET: TradePosition}
+        self.tickets = count(1)
+        self.orders_sent = 0
+
+    def reset(self, symbols=('EURUSD', 'GBPUSD', 'USDJPY', 'AUDUSD', 'USDCHF'), seed=0, latency=0.0):
+        with self.lock:
+            self.random = Random(seed)
+            self.set_latency(latency)
+            self.positions.clear()
+            self.tickets = count(1)
+            self.orders_sent = 0
+            self.symbols = {}
+            for symbol in symbols:
+                self.add_symbol(symbol)
+
+    def add_symbol(self, symbol, price=None, digits=None, spread=10, visible=False):
+        if digits is None:
+            digits = 3 if symbol.endswith('JPY') else 5
+        if price is None:
+            price = 110.0 if symbol.endswith('JPY') else 1.1
+        self.symbols[symbol] = {'point': 10.0 ** -digits, 'digits': digits, 'visible': visible, 'bid': price,
+                                'spread': spread}
+
+    def step(self, symbol):
+        """ :return: (tuple) (bid, ask) after one random walk step """
+        s = self.symbols[symbol]
+        s['bid'] = round(s['bid'] + self.random.choice((-1, 0, 1)) * s['point'], s['digits'])
+        return s['bid'], round(s['bid'] + s['spread'] * s['point'], s['digits'])
+
+    def set_latency(self, latency, jitter=None):
+        if latency == 'realistic':
+            latency = REALISTIC_LATENCY
+            jitter = REALISTIC_JITTER if jitter is None else jitter
+        self.latency = dict(latency) if isinstance(latency, dict) else {'default': latency}
+        self.jitter = jitter or 0.0
+
+    def wait(self, call='default'):
+        """
+        Sleep for the call's latency
+        :param call: (str) 'order_send', 'order_check', 'copy_rates', 'symbol_info' or 'default'
+        """
+        seconds = self.latency.get(call, self.latency.get('default', 0.0))
+        if seconds:
+            if self.jitter:
+                seconds *= 1.0 + self.jitter_random.uniform(-self.jitter, self.jitter)
+            sleep(seconds)
+
+
+_terminal = _Terminal()
+_terminal.reset()
+
+
+def install(symbols=None, seed=0, latency=0.0):
+    """
+    Register this module as MetaTrader5 in sys.modules and reset the terminal
+    :param symbols: (list of str) (optional) symbols the terminal knows
+    :param seed: (int) seed of the price random walk
+    :param latency: (float, dict or str) seconds added to every terminal call, {CALL: seconds} or 'realistic'
+    :return: (module) this module
+    """
+    module = sys.modules[__name__]
+    sys.modules['MetaTrader5'] = module
+    if symbols is None:
+        _terminal.reset(seed=seed, latency=latency)
+    else:
+        _terminal.reset(symbols, seed, latency)
+    return module
+
+
+def set_latency(seconds, jitter=None):
+    """
+    Delay added to terminal calls
+    :param seconds: (float, dict or str) fixed delay, {CALL: seconds} (see _Terminal.wait()) or 'realistic'
+    :param jitter: (float) (optional) relative jitter, 0.5 draws each delay in [0.5, 1.5] times its value
+    """
+    _terminal.set_latency(seconds, jitter)
+
+
+def orders_sent():
+    """ :return: (int) number of order_send() calls since install() """
+    return _terminal.orders_sent
+
+
+# MetaTrader5 API
+def initialize(*args, **kwargs):
+    _terminal.connected = True
+    return True
+
+
+def shutdown():
+    _terminal.connected = False
+    return True
+
+
+def last_error():
+    return _terminal.last_error
+
+
+def account_info():
+    return AccountInfo(1000001, 0, 100, 200, 0, True, True, 2, 2, False, 10000.0, 0.0, 0.0, 10000.0,
+                       0.0, 10000.0, 0.0, 50.0, 30.0, 0.0, 0.0, 0.0, 0.0, 0.0, 'Simulated', 'Sim-Demo', 'USD',
+                       'src.sim')
+
+
+def terminal_info():
+    return None
+
+
+def symbols_total():
+    return len(_terminal.symbols)
+
+
+def symbol_select(symbol, enable=True):
+    _terminal.wait()
+    s = _terminal.symbols.get(symbol)
+    if s is None:
+        _terminal.last_error = (-1, 'Terminal: Call failed')
+        return False
+    s['visible'] = bool(enable)
+    return True
+
+
+def symbol_info(symbol):
+    _terminal.wait('symbol_info')
+    s = _terminal.symbols.get(symbol)
+    if s is None:
+        return None
+    bid = s['bid']
+    ask = round(bid + s['spread'] * s['point'], s['digits'])
+    return SymbolInfo(symbol, s['visible'], s['visible'], bid, ask, 0.0, int(time()), s['point'], s['digits'],
+                      s['spread'], s['point'], 1.0, 100000.0, 0.01, 100.0, 0.01, 0, 0, 3, 4, symbol[:3], symbol[3:])
+
+
+def symbol_info_tick(symbol):
+    _terminal.wait('symbol_info')
+    if symbol not in _terminal.symbols:
+        return None
+    with _terminal.lock:
+        bid, ask = _terminal.step(symbol)
+    now = time()
+    return Tick(int(now), bid, ask, 0.0, 0, int(now * 1000), 6, 0.0)
+
+
+def _trade_request(request):
+    return TradeRequest(request.get('action', 0), request.get('magic', 0), request.get('order', 0),
+                        request.get('symbol', ''), request.get('volume', 0.0), request.get('price', 0.0),
+                        request.get('stoplimit', 0.0), request.get('sl', 0.0), request.get('tp', 0.0),
+                        request.get('deviation', 0), request.get('type', 0), request.get('type_filling', 0),
+                        request.get('type_time', 0), request.get('expiration', 0), request.get('comment', ''),
+                        request.get('position', 0), request.get('position_by', 0))
+
+
+def order_check(request):
+    _terminal.wait('order_check')
+    retcode = 0 if request.get('symbol') in _terminal.symbols else TRADE_RETCODE_INVALID
+    return OrderCheckResult(retcode, 10000.0, 10000.0, 0.0, 0.0, 10000.0, 0.0, 'Done', _trade_request(request))
+
+
+def order_send(request):
+    _terminal.wait('order_send')
+    symbol = request.get('symbol')
+    with _terminal.lock:
+        _terminal.orders_sent += 1
+        s = _terminal.symbols.get(symbol)
+        if s is None:
+            return OrderSendResult(TRADE_RETCODE_INVALID, 0, 0, 0.0, 0.0, 0.0, 0.0, 'Invalid request', 0, 0,
+                                   _trade_request(request))
+
+        bid = s['bid']
+        ask = round(bid + s['spread'] * s['point'], s['digits'])
+        is_sell = request.get('type', 0) % 2 == 1
+        price = bid if is_sell else ask
+        sl, tp = request.get('sl', 0.0), request.get('tp', 0.0)
+        if (sl and (sl >= price if not is_sell else sl <= price)) or \
+                (tp and (tp <= price if not is_sell else tp >= price)):
+            return OrderSendResult(TRADE_RETCODE_INVALID_STOPS, 0, 0, 0.0, 0.0, bid, ask, 'Invalid stops', 0, 0,
+                                   _trade_request(request))
+
+        ticket = next(_terminal.tickets)
+        volume = request.get('volume', 0.0)
+        _terminal.positions[ticket] = TradePosition(ticket, int(time()), 1 if is_sell else 0,
+                                                    request.get('magic', 0), ticket, volume, price, sl, tp, price,
+                                                    symbol, request.get('comment', ''))
+    return OrderSendResult(TRADE_RETCODE_DONE, ticket, ticket, volume, price, bid, ask, 'Request executed', 0, 0,
+                           _trade_request(request))
+
+
+def orders_total():
+    return 0
+
+
+def orders_get(**kwargs):
+    return ()
+
+
+def positions_total():
+    return len(_terminal.positions)
+
+
+def positions_get(symbol=None, ticket=None, **kwargs):
+    positions = list(_terminal.positions.values())
+    if symbol is not None:
+        positions = [p for p in positions if p.symbol == symbol]
+    if ticket is not None:
+        positions = [p for p in positions if p.ticket == ticket]
+    return tuple(positions)
+
+
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    _terminal.wait('copy_rates')
+    if symbol not in _terminal.symbols:
+        return None
+    # bars ending at the current one
+    seconds = timeframe_seconds(timeframe)
+    last = int(time()) // seconds * seconds - int(start_pos) * seconds
+    times = last - seconds * np.arange(int(count) - 1, -1, -1, dtype=np.int64)
+    return _bars(symbol, times)
+
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    _terminal.wait('copy_rates')
+    if symbol not in _terminal.symbols:
+        return None
+    seconds = timeframe_seconds(timeframe)
+    date_from = date_from if isinstance(date_from, (int, float)) else date_from.timestamp()
+    date_to = date_to if isinstance(date_to, (int, float)) else date_to.timestamp()
+    first = -(-int(date_from) // seconds) * seconds
+    times = np.arange(first, int(date_to) + 1, seconds, dtype=np.int64)
+    return _bars(symbol, times)
+
+
+def copy_rates_from(symbol, timeframe, date_from, count):
+    date_from = date_from if isinstance(date_from, (int, float)) else date_from.timestamp()
+    seconds = timeframe_seconds(timeframe)
+    return copy_rates_range(symbol, timeframe, int(date_from) - (int(count) - 1) * seconds, date_from)
+
+
+def _bars(symbol, times):
+    """ Deterministic bars: the close only depends on the symbol and the bar time """
+    s = _terminal.symbols[symbol]
+    bars = np.zeros(len(times), dtype=RATES_DTYPE)
+    bars['time'] = times
+    wave = np.sin(times / 86400.0) * 100 * s['point']
+    bars['close'] = np.round(s['bid'] + wave, s['digits'])
+    bars['open'] = np.round(bars['close'] - 2 * s['point'], s['digits'])
+    bars['high'] = np.round(bars['close'] + 5 * s['point'], s['digits'])
+    bars['low'] = np.round(bars['close'] - 7 * s['point'], s['digits'])
+    bars['tick_volume'] = 100
+    bars['spread'] = s['spread']
+    return bars
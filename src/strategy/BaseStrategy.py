@@ -3,31 +3,42 @@ TODO: Use expert advisor to stream market data.
 """
 
 from src.db.db_connection import DBConnector
+from src.db.order_journal import OrderJournal, ORDER_COLUMNS
 from src.client.connector import Connector
+from src.client.gateway import MT5Gateway, PRIORITY_ORDER
+from src.strategy.trade_log import TradeLog
 
 from time import sleep
 import datetime
 from threading import Thread, Lock
 
-import pandas as pd
-
 
 class BaseStrategy(object):
 
-    def __init__(self, name="Base Strategy", symbols=None, broker_tz_offset=0, verbose=True):
+    def __init__(self, name="Base Strategy", symbols=None, broker_tz_offset=0, verbose=True, live=True):
+        """
+        :param live: (bool) False to build the strategy without terminal and DB connections, i.e. for backtests
+                     (see src.strategy.backtest)
+        """
         self.name = name
         self.symbols = symbols
         self.broker_tz_offset = broker_tz_offset
         self.verbose = verbose
-
-        self.conn = Connector()
-        self.dbconn = DBConnector()
+        self.live = live
+
+        self.conn = self.gateway = self.dbconn = self.journal = None
+        if live:
+            # Every MT5 call of the traders goes through this thread (MetaTrader5 is not thread safe), starting
+            # with mt5.initialize()
+            self.gateway = MT5Gateway()
+            self.conn = self.gateway.run(Connector, priority=PRIORITY_ORDER).result()
+            self.dbconn = DBConnector()
+            # Orders are written to order_history in the background, trading threads never wait on the DB
+            self.journal = OrderJournal(self.dbconn, name)
         # Strategy's ON/OFF switch
         self.isON = True
-        self.trades = pd.DataFrame(columns=['orderid', 'timestamp', 'retcode', 'symbol', 'price', 'bid', 'ask',
-                                            'comment', 'volume', 'dealid', 'tr_action', 'tr_volume', 'tr_price',
-                                            'tr_stoplimit', 'tr_sl', 'tr_tp', 'tr_type', 'tr_type_filling',
-                                            'tr_type_time', 'tr_expiration', 'tr_comment'])
+        # Orders of this strategy, self.trades.to_frame() for a DataFrame
+        self.trades = TradeLog()
 
         self.lock = Lock()
 
@@ -67,14 +78,11 @@ class BaseStrategy(object):
 
         ])
         # Update
-        self.trades = self.trades.append(pd.concat([result_dict, traderequest_dict]), ignore_index=True)
-
-        sql = """INSERT INTO order_history (
-        orderid, timestamp, retcode, symbol, price, bid, ask, comment, volume, dealid, tr_action, tr_volume, tr_price,
-        tr_stoplimit, tr_sl, tr_tp, tr_type, tr_type_filling, tr_type_time, tr_expiration, tr_comment
-        ) VALUES {}""".format(vals)
+        self.trades.append(dict(zip(ORDER_COLUMNS, vals), timestamp=now, tr_magic=traderequest_dict['magic']))
 
-        self.dbconn.execute_query(sql)
+        # Queue for order_history
+        if self.journal is not None:
+            self.journal.record(vals)
 
 
 class CoinFlipStrategy(BaseStrategy):
@@ -110,7 +118,9 @@ class CoinFlipStrategy(BaseStrategy):
         for trader in self.traders:
             trader.join()
             print('\n[{}] .. and that\'s a wrap! Time to head home.\n'.format(trader.getName()))
-        self.conn.shutdown()
+        self.journal.close()
+        self.gateway.run(self.conn.shutdown)
+        self.gateway.shutdown()
 
     def _updater(self, _delay=0.1):
 
@@ -130,7 +140,7 @@ class CoinFlipStrategy(BaseStrategy):
         """
         TODO: use self.conn.make_request()
         """
-        self.conn.make_request()
+        self.gateway.run(self.conn.make_request, symbol=symbol).result()
 
         while self.isON:
             # Acquire lock
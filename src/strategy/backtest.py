@@ -0,0 +1,387 @@
+"""
+Backtesting on historical bars and ticks.
+
+Two modes share the same fill model and result type:
+
+- backtest_signals(): fully vectorized, for signal strategies. signal[i] is the position
+  (-1, 0, 1) wanted after bar i closes, opened at the next bar's open. SL/TP exits are
+  found for every trade at once with NumPy. It costs O(n) per symbol whatever the number
+  of trades.
+- EventBacktester: bar by bar (or tick by tick) calls to a stateful strategy object
+  implementing on_bar(bt, i) or on_tick(bt, i, bid, ask). The strategy trades through
+  bt.buy(), bt.sell() and bt.close(). Fills are reported to strategy._save_order() like
+  live orders, so BaseStrategy subclasses built with live=False keep their trade log.
+
+Bars follow MetaTrader's convention: prices are bids and the spread column is in points.
+Longs are opened at the ask (bid + spread) and closed at the bid, and shorts the other
+way round. When a bar reaches both SL and TP, SL is assumed to be hit first.
+
+Bars can come from Connector.get_rates() DataFrames, rates arrays, or DB tables
+(bars_from_query()).
+"""
+
+from itertools import count
+
+import numpy as np
+import pandas as pd
+
+from src.client.order_types import OrderSendResult, TradeRequest, TRADE_RETCODE_DONE
+
+
+BAR_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'spread')
+EXIT_REASONS = np.array(['signal', 'sl', 'tp', 'end'])
+SIGNAL, SL, TP, END = range(len(EXIT_REASONS))
+
+
+def load_bars(bars, spread=None):
+    """
+    :param bars: (DataFrame, structured ndarray or dict) with time, open, high, low, close and optionally spread
+    :param spread: (float) (optional) spread in points used when bars have none
+    :return: (dict) {COLUMN: ndarray} time as int64, prices and spread as float64
+    """
+    if isinstance(bars, pd.DataFrame):
+        data = {name: bars[name].to_numpy() for name in bars.columns}
+    elif isinstance(bars, np.ndarray):
+        data = {name: bars[name] for name in bars.dtype.names}
+    else:
+        data = {name: np.asarray(values) for name, values in bars.items()}
+
+    out = {'time': np.asarray(data['time']).astype(np.int64)}
+    for name in ('open', 'high', 'low', 'close'):
+        out[name] = np.asarray(data[name], dtype=np.float64)
+    if 'spread' in data:
+        out['spread'] = np.asarray(data['spread'], dtype=np.float64)
+    else:
+        out['spread'] = np.full(len(out['time']), 0.0 if spread is None else float(spread))
+    return out
+
+
+def bars_from_query(dbconn, query, chunksize=100000):
+    """
+    :param dbconn: (DBConnector)
+    :param query: (str) query returning time, open, high, low, close and optionally spread, ordered by time
+    :return: (dict) {COLUMN: ndarray}, see load_bars()
+    """
+    chunks = list(dbconn.iter_query(query, chunksize=chunksize))
+    if not chunks:
+        return load_bars({name: np.empty(0) for name in BAR_COLUMNS})
+    return load_bars(pd.concat(chunks, ignore_index=True))
+
+
+class BacktestResult:
+
+    def __init__(self, trades, n_bars, symbol=None):
+        """
+        :param trades: (dict) {FIELD: ndarray} side, volume, entry_idx, exit_idx, entry_price, exit_price, pnl, reason
+        :param n_bars: (int) number of bars (or ticks) of the run
+        """
+        self.symbol = symbol
+        self.trades = trades
+        self.n_bars = n_bars
+
+    @property
+    def equity(self):
+        """ (ndarray) realized P&L after each bar """
+        return np.bincount(self.trades['exit_idx'], weights=self.trades['pnl'], minlength=self.n_bars).cumsum()
+
+    def stats(self):
+        """
+        :return: (dict) trades, pnl, win_rate, profit_factor, max_drawdown, sharpe (per bar, not annualized)
+        """
+        pnl = self.trades['pnl']
+        equity = self.equity
+        wins, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+        returns = np.diff(equity, prepend=0.0)
+        std = returns.std()
+        return {'trades': len(pnl),
+                'pnl': float(pnl.sum()),
+                'win_rate': float((pnl > 0).mean()) if len(pnl) else np.nan,
+                'profit_factor': float(wins / losses) if losses > 0 else np.inf if wins > 0 else np.nan,
+                'max_drawdown': float((np.maximum.accumulate(equity) - equity).max()) if len(equity) else 0.0,
+                'sharpe': float(returns.mean() / std) if std > 0 else np.nan}
+
+    def to_frame(self):
+        """ :return: (DataFrame) one row per trade """
+        df = pd.DataFrame(self.trades)
+        df['reason'] = EXIT_REASONS[df['reason'].to_numpy()]
+        return df
+
+
+def backtest_signals(bars, signal, point, sl_points=None, tp_points=None, volume=0.01, contract_size=100000,
+                     spread=None, symbol=None):
+    """
+    Vectorized backtest of a position signal
+    :param bars: (DataFrame, ndarray or dict) see load_bars()
+    :param signal: (array) position wanted after each bar's close: 1 long, -1 short, 0 flat
+    :param point: (float) the symbol's point size
+    :param sl_points: (int) (optional) n# of points between entry and SL
+    :param tp_points: (int) (optional) n# of points between entry and TP
+    :param volume: (float) trade volume in lots
+    :param contract_size: (float) units per lot, P&L is in the quote currency
+    :param spread: (float) (optional) spread in points when bars have none
+    :return: (BacktestResult)
+    """
+    bars = load_bars(bars, spread)
+    n = len(bars['time'])
+    signal = np.sign(np.asarray(signal, dtype=np.float64)).astype(np.int64)
+    if len(signal) != n:
+        raise ValueError('signal has {} values for {} bars'.format(len(signal), n))
+
+    o, h, l, c = bars['open'], bars['high'], bars['low'], bars['close']
+    spread_px = bars['spread'] * point
+
+    # Position held during each bar, opened at its open
+    pos = np.r_[0, signal[:-1]]
+    bounds = np.flatnonzero(np.diff(np.r_[0, pos]) != 0)
+    starts = bounds[pos[bounds] != 0]
+    ends = np.r_[bounds, n][np.searchsorted(bounds, starts, side='right')]  # exclusive
+    side = pos[starts]
+    lengths = ends - starts
+
+    entry = np.where(side > 0, o[starts] + spread_px[starts], o[starts])
+    sl_level = entry - side * sl_points * point if sl_points else None
+    tp_level = entry + side * tp_points * point if tp_points else None
+
+    # First bar of each trade reaching SL or TP
+    exit_idx = np.where(ends < n, ends, n - 1)
+    exit_price = np.where(ends < n, np.where(side > 0, o[exit_idx], o[exit_idx] + spread_px[exit_idx]), 0.0)
+    reason = np.where(ends < n, SIGNAL, END)
+    if len(starts) and (sl_level is not None or tp_level is not None):
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        trade = np.repeat(np.arange(len(starts)), lengths)
+        idx = np.arange(lengths.sum()) - offsets[trade] + starts[trade]
+        long = side[trade] > 0
+        # Longs exit at the bid, shorts at the ask
+        exit_high = np.where(long, h[idx], h[idx] + spread_px[idx])
+        exit_low = np.where(long, l[idx], l[idx] + spread_px[idx])
+
+        sl_hit = np.zeros(len(idx), dtype=bool)
+        tp_hit = np.zeros(len(idx), dtype=bool)
+        if sl_level is not None:
+            sl_hit = np.where(long, exit_low <= sl_level[trade], exit_high >= sl_level[trade])
+        if tp_level is not None:
+            tp_hit = np.where(long, exit_high >= tp_level[trade], exit_low <= tp_level[trade])
+
+        local = np.where(sl_hit | tp_hit, idx, n)
+        first_hit = np.minimum.reduceat(local, offsets)
+        hit = first_hit < n
+        x = first_hit[hit]
+        s = side[hit]
+        exit_open = np.where(s > 0, o[x], o[x] + spread_px[x])
+        flat = offsets[hit] + (x - starts[hit])  # row of the hit bar in the flattened arrays
+        is_sl = sl_hit[flat]
+        # Gaps through a level are filled at the open
+        if sl_level is not None:
+            sl_fill = np.where(s > 0, np.minimum(sl_level[hit], exit_open), np.maximum(sl_level[hit], exit_open))
+        else:
+            sl_fill = exit_open
+        if tp_level is not None:
+            tp_fill = np.where(s > 0, np.maximum(tp_level[hit], exit_open), np.minimum(tp_level[hit], exit_open))
+        else:
+            tp_fill = exit_open
+
+        exit_idx[hit] = x
+        exit_price[hit] = np.where(is_sl, sl_fill, tp_fill)
+        reason[hit] = np.where(is_sl, SL, TP)
+
+    # Still open at the end, marked at the last close
+    at_end = reason == END
+    exit_price[at_end] = np.where(side[at_end] > 0, c[n - 1], c[n - 1] + spread_px[n - 1])
+
+    pnl = side * (exit_price - entry) * volume * contract_size
+    trades = {'side': side, 'volume': np.full(len(side), float(volume)), 'entry_idx': starts, 'exit_idx': exit_idx,
+              'entry_price': entry, 'exit_price': exit_price, 'pnl': pnl, 'reason': reason}
+    return BacktestResult(trades, n, symbol)
+
+
+def run_universe(data, signal_fn, point, **kwargs):
+    """
+    Vectorized backtest of one signal function over many symbols
+    :param data: (dict) {SYMBOL: bars}
+    :param signal_fn: (callable) signal_fn(bars dict) -> signal array
+    :param point: (float or dict) point size, or {SYMBOL: point}
+    :param kwargs: passed to backtest_signals()
+    :return: (tuple) ({SYMBOL: BacktestResult}, DataFrame of stats indexed by symbol)
+    """
+    results = {}
+    for symbol, bars in data.items():
+        bars = load_bars(bars, kwargs.get('spread'))
+        _point = point[symbol] if isinstance(point, dict) else point
+        results[symbol] = backtest_signals(bars, signal_fn(bars), _point, symbol=symbol, **kwargs)
+    summary = pd.DataFrame({symbol: result.stats() for symbol, result in results.items()}).T
+    return results, summary
+
+
+class EventBacktester:
+    """
+    Event-driven backtest of a stateful strategy.
+
+    The strategy implements on_bar(bt, i) (bar mode) or on_tick(bt, i, bid, ask) (tick mode)
+    and reads bt.bars / bt.ticks up to row i. Market orders placed in on_bar(bt, i) are filled
+    at the open of bar i + 1. In tick mode they are filled at the current tick.
+    """
+
+    def __init__(self, strategy, point, symbol='EURUSD', volume=0.01, sl_points=None, tp_points=None,
+                 contract_size=100000, spread=None, magic=0):
+        """
+        :param strategy: (obj) implements on_bar() or on_tick(), and optionally _save_order(result)
+        :param point: (float) the symbol's point size
+        :param symbol: (str) symbol reported in fills
+        :param volume: (float) default trade volume in lots
+        :param sl_points: (int) (optional) default n# of points between entry and SL
+        :param tp_points: (int) (optional) default n# of points between entry and TP
+        :param contract_size: (float) units per lot
+        :param spread: (float) (optional) spread in points when bars have none
+        :param magic: (int) magic number reported in fills
+        """
+        self.strategy = strategy
+        self.point = point
+        self.symbol = symbol
+        self.volume = volume
+        self.sl_points = sl_points
+        self.tp_points = tp_points
+        self.contract_size = contract_size
+        self.spread = spread
+        self.magic = magic
+
+        self.bars = None
+        self.ticks = None
+        self.i = 0
+        self.positions = {}  # {TICKET: [SIDE, VOLUME, ENTRY_IDX, ENTRY_PRICE, SL, TP]}
+        self._pending = []  # [(SIDE, VOLUME, SL_POINTS, TP_POINTS, COMMENT)]
+        self._closed = []  # [(SIDE, VOLUME, ENTRY_IDX, EXIT_IDX, ENTRY_PRICE, EXIT_PRICE, REASON)]
+        self._tickets = count(1)
+        self._bid = self._ask = np.nan
+
+    # Strategy API
+    def buy(self, volume=None, sl_points=None, tp_points=None, comment=''):
+        """ Open a long position, see sell() """
+        return self._order(1, volume, sl_points, tp_points, comment)
+
+    def sell(self, volume=None, sl_points=None, tp_points=None, comment=''):
+        """
+        Open a short position
+        :return: (int) ticket in tick mode, None in bar mode (filled at the next bar's open)
+        """
+        return self._order(-1, volume, sl_points, tp_points, comment)
+
+    def close(self, ticket):
+        """ Close a position at the current price (the current bar's close in bar mode) """
+        side = self.positions[ticket][0]
+        self._exit(ticket, self._bid if side > 0 else self._ask, SIGNAL)
+
+    def close_all(self):
+        for ticket in list(self.positions):
+            self.close(ticket)
+
+    @property
+    def position(self):
+        """ (float) net open volume, positive for long """
+        return sum(p[0] * p[1] for p in self.positions.values())
+
+    def _order(self, side, volume, sl_points, tp_points, comment):
+        volume = self.volume if volume is None else volume
+        sl_points = self.sl_points if sl_points is None else sl_points
+        tp_points = self.tp_points if tp_points is None else tp_points
+        if self.ticks is None:
+            self._pending.append((side, volume, sl_points, tp_points, comment))
+            return None
+        return self._fill(side, volume, sl_points, tp_points, comment, self._bid, self._ask)
+
+    def _fill(self, side, volume, sl_points, tp_points, comment, bid, ask):
+        price = ask if side > 0 else bid
+        sl = price - side * sl_points * self.point if sl_points else 0.0
+        tp = price + side * tp_points * self.point if tp_points else 0.0
+        ticket = next(self._tickets)
+        self.positions[ticket] = [side, volume, self.i, price, sl, tp]
+
+        save_order = getattr(self.strategy, '_save_order', None)
+        if save_order is not None:
+            request = TradeRequest(1, self.magic, 0, self.symbol, volume, price, 0.0, sl, tp, 0, 0 if side > 0 else 1,
+                                   0, 0, 0, comment, 0, 0)
+            save_order(OrderSendResult(TRADE_RETCODE_DONE, ticket, ticket, volume, price, bid, ask, 'Backtest', 0, 0,
+                                       request))
+        return ticket
+
+    def _exit(self, ticket, price, reason):
+        side, volume, entry_idx, entry_price, _, _ = self.positions.pop(ticket)
+        self._closed.append((side, volume, entry_idx, self.i, entry_price, price, reason))
+
+    def _check_stops(self, bid_low, bid_high, ask_low, ask_high, bid_open, ask_open):
+        for ticket, (side, _, _, _, sl, tp) in list(self.positions.items()):
+            if side > 0:
+                if sl and bid_low <= sl:
+                    self._exit(ticket, min(sl, bid_open), SL)
+                elif tp and bid_high >= tp:
+                    self._exit(ticket, max(tp, bid_open), TP)
+            else:
+                if sl and ask_high >= sl:
+                    self._exit(ticket, max(sl, ask_open), SL)
+                elif tp and ask_low <= tp:
+                    self._exit(ticket, min(tp, ask_open), TP)
+
+    def run_bars(self, bars):
+        """
+        :param bars: (DataFrame, ndarray or dict) see load_bars()
+        :return: (BacktestResult)
+        """
+        self.bars = bars = load_bars(bars, self.spread)
+        self.ticks = None
+        o, h, l, c = bars['open'], bars['high'], bars['low'], bars['close']
+        spread_px = bars['spread'] * self.point
+        n = len(o)
+
+        for i in range(n):
+            self.i = i
+            sp = spread_px[i]
+            if self._pending:
+                pending, self._pending = self._pending, []
+                for order in pending:
+                    self._fill(*order, o[i], o[i] + sp)
+            if self.positions:
+                self._check_stops(l[i], h[i], l[i] + sp, h[i] + sp, o[i], o[i] + sp)
+            self._bid, self._ask = c[i], c[i] + sp
+            self.strategy.on_bar(self, i)
+
+        return self._result(n)
+
+    def run_ticks(self, ticks):
+        """
+        :param ticks: (DataFrame or dict) with time, bid and ask
+        :return: (BacktestResult)
+        """
+        if isinstance(ticks, pd.DataFrame):
+            ticks = {name: ticks[name].to_numpy() for name in ticks.columns}
+        self.ticks = ticks
+        self.bars = None
+        bids = np.asarray(ticks['bid'], dtype=np.float64)
+        asks = np.asarray(ticks['ask'], dtype=np.float64)
+        n = len(bids)
+
+        for i in range(n):
+            self.i = i
+            bid, ask = bids[i], asks[i]
+            self._bid, self._ask = bid, ask
+            if self.positions:
+                self._check_stops(bid, bid, ask, ask, bid, ask)
+            self.strategy.on_tick(self, i, bid, ask)
+
+        return self._result(n)
+
+    def _result(self, n):
+        # Close what is still open at the last price
+        self.i = max(n - 1, 0)
+        for ticket in list(self.positions):
+            side = self.positions[ticket][0]
+            self._exit(ticket, self._bid if side > 0 else self._ask, END)
+        self._pending = []
+
+        closed = np.array(self._closed, dtype=np.float64).reshape(-1, 7)
+        side = closed[:, 0].astype(np.int64)
+        trades = {'side': side, 'volume': closed[:, 1], 'entry_idx': closed[:, 2].astype(np.int64),
+                  'exit_idx': closed[:, 3].astype(np.int64), 'entry_price': closed[:, 4],
+                  'exit_price': closed[:, 5],
+                  'pnl': side * (closed[:, 5] - closed[:, 4]) * closed[:, 1] * self.contract_size,
+                  'reason': closed[:, 6].astype(np.int64)}
+        self._closed = []
+        return BacktestResult(trades, n, self.symbol)
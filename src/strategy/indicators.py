@@ -0,0 +1,332 @@
+"""
+Incremental technical indicators over the live tick feed.
+
+IndicatorEngine is an EAConnector subscriber (see EAConnector.add_subscriber()). Each
+symbol owns a slot (a row) in preallocated NumPy arrays, and every tick updates its row
+in O(1): running sums over fixed-size rings, Wilder averages and EMAs, never a pass over a
+window. update() applies a batch of ticks of many symbols at once with vectorized row
+updates.
+
+Tick indicators use the mid price: EMA, SMA, RSI, z-score of the mid against its SMA
+window, and volatility (std of log returns over vol_window ticks). ATR and VWAP need bar
+highs, lows and volumes, so they are updated from rates (onRate(), or update_bar()).
+
+values is a zero-copy (n_symbols, len(INDICATORS)) view of the latest values, with one
+row per symbol in slot order (see slot()).
+"""
+
+from math import log, sqrt
+
+import numpy as np
+import pandas as pd
+
+
+INDICATORS = ('mid', 'ema', 'sma', 'rsi', 'atr', 'volatility', 'vwap', 'zscore')
+MID, EMA, SMA, RSI, ATR, VOLATILITY, VWAP, ZSCORE = range(len(INDICATORS))
+
+
+class IndicatorEngine:
+
+    def __init__(self, symbols=(), ema_span=20, sma_window=20, rsi_period=14, atr_period=14, vol_window=100,
+                 capacity=64):
+        """
+        :param symbols: (list of str) (optional) symbols to allocate a slot for up front, in this order
+        :param ema_span: (int) EMA span in ticks, alpha = 2 / (span + 1)
+        :param sma_window: (int) SMA and z-score window in ticks
+        :param rsi_period: (int) RSI period in ticks (Wilder smoothing)
+        :param atr_period: (int) ATR period in bars (Wilder smoothing)
+        :param vol_window: (int) volatility window in ticks
+        :param capacity: (int) slots allocated up front, doubled when full (values views taken before are then stale)
+        """
+        self.ema_span = ema_span
+        self.sma_window = sma_window
+        self.rsi_period = rsi_period
+        self.atr_period = atr_period
+        self.vol_window = vol_window
+        self._alpha = 2.0 / (ema_span + 1)
+
+        self._slots = {}  # {SYMBOL: SLOT}
+        self._symbols = []
+        self._capacity = 0
+        self._allocate(max(int(capacity), len(symbols), 1))
+        for symbol in symbols:
+            self.slot(symbol)
+
+    def _allocate(self, capacity):
+        """
+        (Re)allocate every state array with capacity slots, keeping the current ones
+        """
+        def grow(name, shape, fill, dtype=np.float64):
+            new = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[:len(old)] = old
+            setattr(self, name, new)
+
+        grow('_values', (len(INDICATORS),), np.nan)
+        grow('_count', (), 0, np.int64)  # ticks seen
+        grow('_ref', (), np.nan)  # first mid, the rings hold mid - ref to keep the running sums precise
+        grow('_mid_ring', (self.sma_window,), 0.0)
+        grow('_mid_sum', (), 0.0)
+        grow('_mid_sumsq', (), 0.0)
+        grow('_ret_ring', (self.vol_window,), 0.0)
+        grow('_ret_sum', (), 0.0)
+        grow('_ret_sumsq', (), 0.0)
+        grow('_avg_gain', (), 0.0)
+        grow('_avg_loss', (), 0.0)
+        # Bars
+        grow('_bar', (4,), np.nan)  # current bar: time, high, low, close
+        grow('_prev_close', (), np.nan)
+        grow('_atr_count', (), 0, np.int64)
+        grow('_vwap', (4,), 0.0)  # day, sum(price * volume), sum(volume), current bar's price * volume
+        grow('_bar_volume', (), 0.0)
+        self._capacity = capacity
+
+    def slot(self, symbol):
+        """
+        :param symbol: (str)
+        :return: (int) row of the symbol in values, allocated on first use
+        """
+        slot = self._slots.get(symbol)
+        if slot is None:
+            slot = len(self._symbols)
+            if slot == self._capacity:
+                self._allocate(2 * self._capacity)
+            self._slots[symbol] = slot
+            self._symbols.append(symbol)
+        return slot
+
+    @property
+    def symbols(self):
+        """ (list of str) symbols in slot order """
+        return list(self._symbols)
+
+    @property
+    def values(self):
+        """ (ndarray) zero-copy (n_symbols, len(INDICATORS)) view of the latest values """
+        return self._values[:len(self._symbols)]
+
+    def value(self, symbol, indicator):
+        """
+        :param indicator: (str) one of INDICATORS
+        :return: (float) latest value, NaN before enough data
+        """
+        return float(self._values[self._slots[symbol], INDICATORS.index(indicator)])
+
+    def to_frame(self):
+        """ :return: (DataFrame) copy of the latest values indexed by symbol """
+        return pd.DataFrame(self.values.copy(), index=self.symbols, columns=INDICATORS)
+
+    def attach(self, conn, symbols=None):
+        """
+        Subscribe to conn's parsed ticks and rates
+        :param conn: (EAConnector)
+        :param symbols: (list of str) (optional) symbols to follow, default is every symbol
+        """
+        conn.add_subscriber(self, symbols)
+
+    # EAConnector subscriber interface
+    def onTick(self, symbol, time_ns, bid, ask):
+        self._update_one(self.slot(symbol), (bid + ask) / 2.0)
+
+    def onRate(self, symbol, time_ns, bar_time, open, high, low, close, tick_volume, spread, real_volume):
+        self.update_bar(symbol, bar_time, high, low, close, real_volume or tick_volume)
+
+    def update(self, symbols, bids, asks):
+        """
+        Apply a batch of ticks, in order
+        :param symbols: (list of str) symbol of each tick
+        :param bids: (array) bid of each tick
+        :param asks: (array) ask of each tick
+        """
+        slots = np.fromiter((self.slot(s) for s in symbols), dtype=np.int64, count=len(symbols))
+        mids = (np.asarray(bids, dtype=np.float64) + np.asarray(asks, dtype=np.float64)) / 2.0
+        if not len(slots):
+            return
+
+        # Round k updates the k-th tick of every symbol, each round touches a slot at most once
+        order = np.argsort(slots, kind='stable')
+        ordered = slots[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        occurrence = np.empty(len(slots), dtype=np.int64)
+        occurrence[order] = np.arange(len(slots)) - np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+
+        for k in range(int(occurrence.max()) + 1):
+            ticks = np.flatnonzero(occurrence == k)
+            self._update(slots[ticks], mids[ticks])
+
+    def _update(self, idx, mid):
+        """
+        Tick update of slot(s) idx, idx and mid are both scalars or both arrays without duplicate slots
+        """
+        v = self._values
+        count = self._count[idx]
+        first = count == 0
+        self._ref[idx] = np.where(first, mid, self._ref[idx])
+        prev = np.where(first, mid, v[idx, MID])
+        v[idx, MID] = mid
+
+        # EMA
+        v[idx, EMA] = np.where(first, mid, v[idx, EMA] + self._alpha * (mid - v[idx, EMA]))
+
+        # SMA and z-score over the last sma_window mids
+        w = self.sma_window
+        pos = count % w
+        x = mid - self._ref[idx]
+        old = self._mid_ring[idx, pos]
+        self._mid_ring[idx, pos] = x
+        self._mid_sum[idx] += x - old
+        self._mid_sumsq[idx] += x * x - old * old
+        n = np.minimum(count + 1, w)
+        mean = self._mid_sum[idx] / n
+        std = np.sqrt(np.maximum(self._mid_sumsq[idx] / n - mean * mean, 0.0))
+        v[idx, SMA] = mean + self._ref[idx]
+        v[idx, ZSCORE] = np.where(std > 0, (x - mean) / np.where(std > 0, std, 1.0), 0.0)
+
+        # Volatility, std of the last vol_window log returns (the first tick has none)
+        w = self.vol_window
+        rpos = (count - 1) % w
+        r = np.log(mid / prev)
+        old = np.where(first, 0.0, self._ret_ring[idx, rpos])
+        self._ret_ring[idx, rpos] = np.where(first, self._ret_ring[idx, rpos], r)
+        self._ret_sum[idx] += np.where(first, 0.0, r - old)
+        self._ret_sumsq[idx] += np.where(first, 0.0, r * r - old * old)
+        n = np.maximum(np.minimum(count, w), 1)
+        rmean = self._ret_sum[idx] / n
+        v[idx, VOLATILITY] = np.where(count >= 2, np.sqrt(np.maximum(self._ret_sumsq[idx] / n - rmean * rmean, 0.0)),
+                                      np.nan)
+
+        # RSI, Wilder averages of the mid changes (simple averages for the first rsi_period changes)
+        change = mid - prev
+        k = np.maximum(np.minimum(count, self.rsi_period), 1)
+        gain = self._avg_gain[idx] + (np.maximum(change, 0.0) - self._avg_gain[idx]) / k
+        loss = self._avg_loss[idx] + (np.maximum(-change, 0.0) - self._avg_loss[idx]) / k
+        self._avg_gain[idx] = np.where(first, 0.0, gain)
+        self._avg_loss[idx] = np.where(first, 0.0, loss)
+        rsi = np.where(loss > 0, 100.0 - 100.0 / (1.0 + gain / np.where(loss > 0, loss, 1.0)),
+                       np.where(gain > 0, 100.0, 50.0))
+        v[idx, RSI] = np.where(count >= self.rsi_period, rsi, np.nan)
+
+        self._count[idx] = count + 1
+
+        # Running sums drift, recompute them from the rings once per lap (O(1) per tick amortized)
+        if np.ndim(idx) == 0:
+            if (count + 1) % self.sma_window == 0:
+                self._resync(idx)
+        else:
+            lap = idx[(count + 1) % self.sma_window == 0]
+            if len(lap):
+                self._resync(lap)
+
+    def _update_one(self, i, mid):
+        """
+        Same as _update() for a single tick, on Python floats (NumPy calls on scalars cost more than the math)
+        """
+        v = self._values[i]
+        count = int(self._count[i])
+        if count == 0:
+            self._ref[i] = ref = mid
+            prev = mid
+            v[EMA] = mid
+        else:
+            ref = float(self._ref[i])
+            prev = float(v[MID])
+            ema = float(v[EMA])
+            v[EMA] = ema + self._alpha * (mid - ema)
+        v[MID] = mid
+
+        # SMA and z-score
+        w = self.sma_window
+        pos = count % w
+        x = mid - ref
+        old = float(self._mid_ring[i, pos])
+        self._mid_ring[i, pos] = x
+        total = float(self._mid_sum[i]) + x - old
+        total_sq = float(self._mid_sumsq[i]) + x * x - old * old
+        self._mid_sum[i], self._mid_sumsq[i] = total, total_sq
+        n = min(count + 1, w)
+        mean = total / n
+        std = sqrt(max(total_sq / n - mean * mean, 0.0))
+        v[SMA] = mean + ref
+        v[ZSCORE] = (x - mean) / std if std > 0 else 0.0
+
+        if count:
+            # Volatility
+            w = self.vol_window
+            rpos = (count - 1) % w
+            r = log(mid / prev)
+            old = float(self._ret_ring[i, rpos])
+            self._ret_ring[i, rpos] = r
+            total = float(self._ret_sum[i]) + r - old
+            total_sq = float(self._ret_sumsq[i]) + r * r - old * old
+            self._ret_sum[i], self._ret_sumsq[i] = total, total_sq
+            n = min(count, w)
+            rmean = total / n
+            v[VOLATILITY] = sqrt(max(total_sq / n - rmean * rmean, 0.0)) if count >= 2 else np.nan
+
+            # RSI
+            change = mid - prev
+            k = min(count, self.rsi_period)
+            gain = float(self._avg_gain[i])
+            loss = float(self._avg_loss[i])
+            gain += (max(change, 0.0) - gain) / k
+            loss += (max(-change, 0.0) - loss) / k
+            self._avg_gain[i], self._avg_loss[i] = gain, loss
+            if count >= self.rsi_period:
+                if loss > 0:
+                    v[RSI] = 100.0 - 100.0 / (1.0 + gain / loss)
+                else:
+                    v[RSI] = 100.0 if gain > 0 else 50.0
+
+        self._count[i] = count + 1
+        if (count + 1) % self.sma_window == 0:
+            self._resync(i)
+
+    def _resync(self, idx):
+        ring = self._mid_ring[idx]
+        self._mid_sum[idx] = ring.sum(axis=-1)
+        self._mid_sumsq[idx] = (ring * ring).sum(axis=-1)
+        ring = self._ret_ring[idx]
+        self._ret_sum[idx] = ring.sum(axis=-1)
+        self._ret_sumsq[idx] = (ring * ring).sum(axis=-1)
+
+    def update_bar(self, symbol, bar_time, high, low, close, volume):
+        """
+        Bar update for ATR and VWAP. Updates of the bar in progress (same bar_time) replace each other.
+        :param bar_time: (int) bar open time (s since epoch)
+        :param volume: (float) bar volume (real or tick volume)
+        """
+        idx = self.slot(symbol)
+        bar = self._bar[idx]
+        v = self._values
+        same_bar = bar[0] == bar_time
+
+        # ATR, the previous bar is complete once a new one opens
+        if not np.isnan(bar[0]) and not same_bar:
+            prev_close = self._prev_close[idx]
+            if np.isnan(prev_close):
+                true_range = bar[1] - bar[2]
+            else:
+                true_range = max(bar[1], prev_close) - min(bar[2], prev_close)
+            n = min(self._atr_count[idx] + 1, self.atr_period)
+            atr = true_range if np.isnan(v[idx, ATR]) else v[idx, ATR] + (true_range - v[idx, ATR]) / n
+            self._atr_count[idx] += 1
+            v[idx, ATR] = atr
+            self._prev_close[idx] = bar[3]
+        bar[:] = (bar_time, high, low, close)
+
+        # VWAP of the day
+        vw = self._vwap[idx]
+        day = bar_time // 86400
+        if vw[0] != day:
+            vw[:] = (day, 0.0, 0.0, 0.0)
+            self._bar_volume[idx] = 0.0
+        elif same_bar:
+            vw[1] -= vw[3]
+            vw[2] -= self._bar_volume[idx]
+        typical = (high + low + close) / 3.0
+        vw[3] = typical * volume
+        vw[1] += vw[3]
+        vw[2] += volume
+        self._bar_volume[idx] = volume
+        v[idx, VWAP] = vw[1] / vw[2] if vw[2] > 0 else typical
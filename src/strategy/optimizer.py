@@ -0,0 +1,364 @@
+"""
+Parallel parameter search over historical data.
+
+Optimizer evaluates strategy configurations on a process pool:
+
+- the bars of every symbol are copied once into a shared memory block (SharedBars),
+  and each worker maps it when it starts, so configurations are sent to the workers
+  as small dicts and the data is never pickled;
+- grid(), random() and successive_halving() build the configurations. Successive
+  halving evaluates many configurations on a fraction of the history, keeps the best
+  1/eta, and repeats with eta times more history until the full history;
+- every result is memoized on disk, keyed by the objective (its name, a hash of its
+  bytecode and an optional version), the parameters, the history fraction and a
+  fingerprint of the data, so a rerun only evaluates new configurations and an edited
+  signal function is evaluated again.
+
+An objective is a picklable callable objective(data, params, fraction) -> dict of
+metrics, with data {SYMBOL: {COLUMN: ndarray}} (see load_bars()) and fraction the share
+of each symbol's bars to use. SignalObjective backtests a signal function with
+backtest_signals(). Trader parameters such as max_trades fit the same interface with an
+objective running EventBacktester.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+from random import Random
+
+import numpy as np
+import pandas as pd
+
+from src.strategy.backtest import BAR_COLUMNS, backtest_signals, load_bars
+
+
+BAR_DTYPES = {name: np.int64 if name == 'time' else np.float64 for name in BAR_COLUMNS}
+BACKTEST_PARAMS = frozenset(('sl_points', 'tp_points', 'volume', 'contract_size', 'spread'))
+
+
+class SharedBars:
+    """
+    Bars of many symbols in one shared memory block, one contiguous array per symbol and column
+    """
+
+    def __init__(self, data=None, spec=None):
+        """
+        :param data: (dict) {SYMBOL: bars} to copy into a new block (see load_bars())
+        :param spec: (tuple) SharedBars.spec of an existing block, to attach to it instead
+        """
+        if spec is None:
+            data = {symbol: load_bars(bars) for symbol, bars in data.items()}
+            layout, offset = [], 0
+            for symbol, bars in data.items():
+                layout.append((symbol, len(bars['time']), offset))
+                offset += len(bars['time']) * 8 * len(BAR_COLUMNS)
+            self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+            self._owner = True
+            self.layout = layout
+        else:
+            name, self.layout = spec
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+
+        self.data = {}
+        for symbol, n, offset in self.layout:
+            self.data[symbol] = {name: np.ndarray((n,), dtype=BAR_DTYPES[name], buffer=self._shm.buf,
+                                                  offset=offset + i * n * 8)
+                                 for i, name in enumerate(BAR_COLUMNS)}
+        if spec is None:
+            for symbol, bars in data.items():
+                for name in BAR_COLUMNS:
+                    self.data[symbol][name][:] = bars[name]
+
+    @property
+    def spec(self):
+        """ (tuple) picklable description of the block, for SharedBars(spec=...) in another process """
+        return self._shm.name, self.layout
+
+    def fingerprint(self):
+        """ :return: (str) hash of the bars, part of the memoization key """
+        digest = hashlib.sha1()
+        for symbol, bars in self.data.items():
+            digest.update(symbol.encode('utf-8'))
+            for name in BAR_COLUMNS:
+                digest.update(bars[name].tobytes())
+        return digest.hexdigest()
+
+    def close(self):
+        self.data = {}
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def code_hash(fn):
+    """
+    :param fn: (callable) function, or object with a __call__ method
+    :return: (str) hash of the bytecode, constants and global names of fn and of the functions defined in it, so
+             editing the code changes it (functions it calls are not followed, see SignalObjective's version)
+    """
+    code = getattr(fn, '__code__', None) or getattr(getattr(fn, '__call__', None), '__code__', None)
+    if code is None:
+        return ''
+    digest = hashlib.sha1()
+
+    def update(code):
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode('utf-8'))
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                update(const)
+            elif isinstance(const, frozenset):
+                digest.update(repr(sorted(repr(c) for c in const)).encode('utf-8'))  # set order varies per process
+            else:
+                digest.update(repr(const).encode('utf-8'))
+
+    update(code)
+    return digest.hexdigest()
+
+
+class SignalObjective:
+
+    def __init__(self, signal_fn, point, version=None, **fixed):
+        """
+        Backtest of a signal function over every symbol
+        :param signal_fn: (callable) module level signal_fn(bars, **signal_params) -> signal array
+        :param point: (float or dict) point size, or {SYMBOL: point}
+        :param version: (str) (optional) part of the memoization key, change it to invalidate the cached results when
+                        code signal_fn calls changed
+        :param fixed: parameters applied to every configuration (backtest_signals() arguments or signal parameters)
+        Parameters named like backtest_signals() arguments (sl_points, tp_points, volume, contract_size, spread) go
+        to the backtest, the others to signal_fn.
+        """
+        self.signal_fn = signal_fn
+        self.point = point
+        self.version = version
+        self.fixed = fixed
+
+    @property
+    def key(self):
+        """ (str) identity of the objective in the memoization key """
+        return '{}.{}@{}:{}:{}:{}'.format(self.signal_fn.__module__, self.signal_fn.__qualname__,
+                                          code_hash(self.signal_fn), self.version, self.point,
+                                          json.dumps(self.fixed, sort_keys=True, default=str))
+
+    def __call__(self, data, params, fraction=1.0):
+        """
+        :return: (dict) pnl and trades summed over the symbols, mean sharpe, worst max_drawdown, win_rate
+        """
+        params = dict(self.fixed, **params)
+        backtest = {k: v for k, v in params.items() if k in BACKTEST_PARAMS}
+        signal_params = {k: v for k, v in params.items() if k not in BACKTEST_PARAMS}
+
+        pnl, trades, wins, drawdown, sharpes = 0.0, 0, 0.0, 0.0, []
+        for symbol, bars in data.items():
+            n = max(int(len(bars['time']) * fraction), 2)
+            bars = {name: values[:n] for name, values in bars.items()}
+            point = self.point[symbol] if isinstance(self.point, dict) else self.point
+            stats = backtest_signals(bars, self.signal_fn(bars, **signal_params), point, symbol=symbol,
+                                     **backtest).stats()
+            pnl += stats['pnl']
+            trades += stats['trades']
+            wins += stats['win_rate'] * stats['trades'] if stats['trades'] else 0.0
+            drawdown = max(drawdown, stats['max_drawdown'])
+            sharpes.append(stats['sharpe'])
+        sharpes = [s for s in sharpes if not np.isnan(s)]
+        return {'pnl': pnl, 'trades': trades, 'win_rate': wins / trades if trades else np.nan,
+                'max_drawdown': drawdown, 'sharpe': float(np.mean(sharpes)) if sharpes else np.nan}
+
+
+def grid(space):
+    """
+    :param space: (dict) {PARAM: list of values}
+    :return: (list of dict) every combination
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in product(*(space[name] for name in names))]
+
+
+def sample(space, n, seed=0):
+    """
+    :param space: (dict) {PARAM: list of values to choose from, or (low, high) range}. Ranges of two ints draw
+                  ints, other ranges draw floats.
+    :param n: (int) number of configurations
+    :return: (list of dict) distinct random configurations (fewer than n when the space is smaller)
+    """
+    rng = Random(seed)
+    configs, seen = [], set()
+    for _ in range(n * 20):
+        if len(configs) == n:
+            break
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = rng.randint(low, high)
+                else:
+                    config[name] = rng.uniform(low, high)
+            else:
+                config[name] = rng.choice(list(values))
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+# Worker process state, set once per process by _init_worker()
+_WORKER = {}
+
+
+def _init_worker(spec, objective):
+    _WORKER['bars'] = SharedBars(spec=spec)
+    _WORKER['objective'] = objective
+
+
+def _evaluate(params, fraction):
+    return _WORKER['objective'](_WORKER['bars'].data, params, fraction)
+
+
+class Optimizer:
+
+    def __init__(self, objective, data, metric='pnl', maximize=True, processes=None, cache_dir='optimizer_cache',
+                 verbose=True):
+        """
+        :param objective: (callable) picklable objective(data, params, fraction) -> dict, see SignalObjective
+        :param data: (dict) {SYMBOL: bars} (see load_bars())
+        :param metric: (str) key of the objective's result to optimize
+        :param maximize: (bool) False to minimize metric
+        :param processes: (int) (optional) pool size, default is the number of cores
+        :param cache_dir: (str) directory of the memoized results, None to disable memoization
+        """
+        self.objective = objective
+        self.metric = metric
+        self.maximize = maximize
+        self.processes = processes or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+
+        self.bars = SharedBars(data)
+        self._fingerprint = self.bars.fingerprint()
+        self._objective_key = getattr(objective, 'key', None) or '{}.{}@{}'.format(
+            getattr(objective, '__module__', ''), getattr(objective, '__qualname__', type(objective).__name__),
+            code_hash(objective))
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker, initargs=(self.bars.spec, objective))
+        # Metrics
+        self.evaluated = 0
+        self.cached = 0
+        self.history = []  # every result returned, with its fraction
+
+    def close(self):
+        self._pool.shutdown()
+        self.bars.close()
+
+    # Searches
+    def grid(self, space, fraction=1.0):
+        """
+        :param space: (dict) {PARAM: list of values}
+        :return: (DataFrame) one row per configuration, best first
+        """
+        return self.evaluate(grid(space), fraction)
+
+    def random(self, space, n, seed=0, fraction=1.0):
+        """
+        :param space: (dict) see sample()
+        :param n: (int) number of configurations
+        :return: (DataFrame) one row per configuration, best first
+        """
+        return self.evaluate(sample(space, n, seed), fraction)
+
+    def successive_halving(self, configs, eta=3, min_fraction=1.0 / 9):
+        """
+        :param configs: (list of dict) candidate configurations (see grid() and sample())
+        :param eta: (int) 1/eta of the configurations is kept at each round, on eta times more history
+        :param min_fraction: (float) history fraction of the first round
+        :return: (DataFrame) configurations of the last round (full history), best first
+        """
+        fraction = min_fraction
+        while True:
+            fraction = min(fraction, 1.0)
+            results = self.evaluate(configs, fraction)
+            if fraction >= 1.0 or len(configs) <= 1:
+                return results
+            keep = max(1, len(configs) // eta)
+            configs = results['params'].iloc[:keep].tolist()
+            fraction *= eta
+
+    def evaluate(self, configs, fraction=1.0):
+        """
+        :param configs: (list of dict) configurations
+        :param fraction: (float) share of each symbol's history to use
+        :return: (DataFrame) params, one column per parameter and per metric, score, best first
+        """
+        keys = [self._key(params, fraction) for params in configs]
+        results = [self._load(key) for key in keys]
+        todo = [i for i, result in enumerate(results) if result is None]
+        self.cached += len(configs) - len(todo)
+
+        if todo:
+            chunksize = max(1, len(todo) // (self.processes * 4))
+            computed = self._pool.map(_evaluate, [configs[i] for i in todo], [fraction] * len(todo),
+                                      chunksize=chunksize)
+            for i, result in zip(todo, computed):
+                results[i] = result
+                self._store(keys[i], configs[i], fraction, result)
+            self.evaluated += len(todo)
+
+        if self.verbose:
+            print('[OPTIMIZER] {} configurations on {:.0%} of the history, {} evaluated, {} from cache'.format(
+                len(configs), fraction, len(todo), len(configs) - len(todo)))
+
+        rows = [dict(params, **result, params=params) for params, result in zip(configs, results)]
+        frame = pd.DataFrame(rows)
+        if frame.empty:
+            return frame
+        frame['score'] = frame[self.metric] if self.maximize else -frame[self.metric]
+        frame['fraction'] = fraction
+        frame = frame.sort_values('score', ascending=False, na_position='last', kind='stable').reset_index(drop=True)
+        self.history.append(frame)
+        return frame
+
+    def best(self):
+        """ :return: (dict) best configuration evaluated on the full history, None if there is none """
+        full = [frame for frame in self.history if frame['fraction'].iloc[0] >= 1.0]
+        if not full:
+            return None
+        frame = pd.concat(full, ignore_index=True).sort_values('score', ascending=False, na_position='last')
+        return frame['params'].iloc[0]
+
+    # Memoization
+    def _key(self, params, fraction):
+        raw = json.dumps({'objective': self._objective_key, 'data': self._fingerprint, 'fraction': fraction,
+                          'params': params}, sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)['result']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store(self, key, params, fraction, result):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'params': params, 'fraction': fraction, 'result': result}, f, default=float)
+        os.replace(tmp, path)
@@ -0,0 +1,205 @@
+"""
+Multi-process strategy runner.
+
+CoinFlipStrategy runs every trader as a thread of one interpreter, so CPU heavy signal
+code on one symbol slows down every other symbol. ProcessRunner spreads the symbols over
+worker processes running a ProcessTrader subclass (see src.strategy.process_trader):
+
+    runner process                                     worker processes (spawned)
+      market data -> SharedTickFeed (shared memory) ->   ProcessTrader.onTick() / onBar()
+      MT5Gateway  <- order intents (Queue)          <-   buy() / sell()
+                  -> order results (Queue per worker) -> ProcessTrader.onOrder()
+
+The runner is the only process calling MetaTrader5. Market data comes from an
+EAConnector when one is given, otherwise from Connector.snapshot() polled every
+poll_interval. Bars are built by a BarAggregator in the runner and published with the
+ticks, workers read both without pickling.
+"""
+
+import multiprocessing
+import os
+from queue import Empty
+from threading import Thread
+from time import sleep, time_ns
+
+import numpy as np
+
+import MetaTrader5 as mt5
+
+from src.client.bar_aggregator import BarAggregator
+from src.client.connector import Connector
+from src.client.gateway import PRIORITY_ORDER
+from src.client.shared_feed import SharedTickFeed
+from src.strategy.BaseStrategy import BaseStrategy
+from src.strategy.process_trader import run_worker
+
+
+class ProcessRunner(BaseStrategy):
+
+    def __init__(self, trader_cls, name='Process_Runner', symbols=None, processes=None, groups=None,
+                 capacity=4096, bar_spec='M1', poll_interval=0.005, ea=None, trader_kwargs=None,
+                 broker_tz_offset=0, verbose=True, live=True):
+        """
+        :param trader_cls: (type) ProcessTrader subclass, importable by the workers
+        :param processes: (int) (optional) number of workers, default is one per core but one, at most one per symbol
+        :param groups: (list of list of str) (optional) explicit symbol groups, one worker each (overrides processes)
+        :param capacity: (int) ticks kept per symbol in shared memory
+        :param bar_spec: (str) bars published to the workers (see BarAggregator)
+        :param poll_interval: (float) seconds between two Connector.snapshot() polls, without an EA feed
+        :param ea: (EAConnector) (optional) market data source instead of snapshot polling
+        :param trader_kwargs: (dict) (optional) extra arguments of trader_cls
+        """
+        super().__init__(name, symbols, broker_tz_offset, verbose, live)
+
+        if groups is None:
+            processes = processes or max(1, (os.cpu_count() or 2) - 1)
+            processes = max(1, min(processes, len(self.symbols)))
+            groups = [self.symbols[i::processes] for i in range(processes)]
+        self.groups = [list(group) for group in groups if group]
+
+        self.trader_cls = trader_cls
+        self.trader_kwargs = trader_kwargs or {}
+        self.capacity = capacity
+        self.bar_spec = bar_spec
+        self.poll_interval = poll_interval
+        self.ea = ea
+
+        self.feed = None
+        self.bars = None
+        self.processes = []
+        self.reports = []
+        self._templates = {}  # {(SYMBOL, TYPE): OrderTemplate}
+        self._threads = []
+
+        # Metrics
+        self.orders_executed = 0
+        self.orders_failed = 0
+
+    def run(self, timeout=60.0):
+        """
+        Start the workers, then the feed and order threads
+        :param timeout: (float) seconds to wait for the workers to start (spawning imports every module again)
+        """
+        context = multiprocessing.get_context('spawn')
+        self.feed = SharedTickFeed(self.symbols, self.capacity, self.bar_spec)
+        self.bars = BarAggregator(specs=(self.bar_spec,), tz_offset=self.broker_tz_offset)
+        self.bars.add_handler(self.feed)
+        if self.ea is not None:
+            self.feed.attach_connector(self.ea)
+            self.bars.attach(self.ea, self.symbols)
+
+        self._intents = context.Queue()
+        self._results = [context.Queue() for _ in self.groups]
+        self._reports = context.Queue()
+        self._stop_workers = context.Event()
+        ready = context.Semaphore(0)
+
+        for worker, group in enumerate(self.groups):
+            process = context.Process(name='{}_Worker_{}'.format(self.name, worker), target=run_worker,
+                                      args=(self.trader_cls, worker, group, self.feed.spec, self._intents,
+                                            self._results[worker], self._stop_workers, ready, self._reports,
+                                            self.trader_kwargs))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+            print('[PROCESS_RUNNER] Worker {} (pid {}) trading {}'.format(worker, process.pid, ', '.join(group)))
+
+        for process in self.processes:
+            if not ready.acquire(timeout=timeout):
+                print('[PROCESS_RUNNER] Workers not ready after {}s, starting anyway'.format(timeout))
+                break
+
+        for name, target in (('Feed', self._feeder), ('Orders', self._executor)):
+            thread = Thread(name='{}_{}'.format(self.name, name), target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        self._stop_workers.set()
+        for _ in self.processes:
+            try:
+                self.reports.append(self._reports.get(timeout=timeout))
+            except Empty:
+                print('[PROCESS_RUNNER] A worker did not report back')
+                break
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        # Intents still queued were sent by stopped workers
+        self.isON = False
+        for thread in self._threads:
+            thread.join()
+        if self.ea is not None:
+            self.ea.remove_subscriber(self.feed)
+            self.ea.remove_subscriber(self.bars)
+        self.feed.close()
+
+        print('[PROCESS_RUNNER] {} workers stopped, {} orders executed, {} failed'.format(
+            len(self.processes), self.orders_executed, self.orders_failed))
+        if self.journal is not None:
+            self.journal.close()
+        if self.gateway is not None:
+            self.gateway.run(self.conn.shutdown)
+            self.gateway.shutdown()
+
+    def _feeder(self):
+        """ Publish market data to the workers: snapshot polling, or closing the bars of an EA feed """
+        if self.ea is not None:
+            while self.isON:
+                self.bars.poll()
+                sleep(0.1)
+            return
+
+        symbols = self.symbols
+        last = np.zeros(len(symbols), dtype=np.int64)
+        # time_msc is the broker's server time, the feed and the bars (like the EA feed's receive times) are UTC
+        offset_ms = int(round(self.broker_tz_offset * 3600)) * 1000
+        while self.isON:
+            snapshot = self.gateway.run(Connector.snapshot, symbols).result()
+            time_msc = snapshot['time_msc']
+            snapshot['time_msc'] = np.where(time_msc > 0, time_msc - offset_ms, 0)
+            new = self.feed.publish_snapshot(snapshot, last)
+            for i in np.flatnonzero(new):
+                self.bars.update(symbols[i], int(snapshot['time_msc'][i]) * 1000000, float(snapshot['bid'][i]))
+            last = np.maximum(last, snapshot['time_msc'])
+            self.bars.poll()
+            sleep(self.poll_interval)
+
+    def _executor(self):
+        """ Send the workers' order intents through the gateway, one at a time """
+        while self.isON:
+            try:
+                intent = self._intents.get(timeout=0.1)
+            except Empty:
+                continue
+            self._results[intent.worker].put(self._execute(intent))
+
+    def _execute(self, intent):
+        """
+        :param intent: (OrderIntent)
+        :return: (dict) symbol, type, tag, retcode, order, price, volume, comment and latency_us, the time from
+                 the worker's buy()/sell() to the terminal's answer
+        """
+        key = (intent.symbol, intent.type)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self.gateway.run(Connector.order_template, intent.symbol,
+                                                               intent.type, priority=PRIORITY_ORDER).result()
+
+        result = self.gateway.run(self.conn.send_order, template, intent.volume, priority=PRIORITY_ORDER).result()
+        response = {'symbol': intent.symbol, 'type': intent.type, 'tag': intent.tag,
+                    'latency_us': (time_ns() - intent.created_ns) / 1e3}
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            self.orders_failed += 1
+            response.update(retcode=None if result is None else result.retcode, order=0, price=0.0, volume=0.0,
+                            comment=None if result is None else result.comment)
+            return response
+
+        self.orders_executed += 1
+        self._save_order(result)
+        response.update(retcode=result.retcode, order=result.order, price=result.price, volume=result.volume,
+                        comment=result.comment)
+        return response
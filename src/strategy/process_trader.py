@@ -0,0 +1,152 @@
+"""
+Worker side of ProcessRunner (see src.strategy.process_runner).
+
+A ProcessTrader runs in its own process, on a group of symbols. It reads ticks and bars
+from the SharedTickFeed written by the runner, and sends order intents back to the runner,
+the only process talking to MetaTrader5. This module does not import MetaTrader5, so
+workers start without a terminal.
+
+Subclasses implement onTick() and/or onBar() and trade with buy() / sell():
+
+    class MyTrader(ProcessTrader):
+        def onTick(self, symbol, time_ns, bid, ask):
+            if self.signal(symbol, bid, ask):
+                self.buy(symbol)
+
+The class must be importable by the worker processes (module level, not __main__ of
+an interactive session), since workers are spawned.
+"""
+
+from collections import namedtuple
+from queue import Empty
+from time import sleep, time_ns
+
+from src.client.shared_feed import SharedTickFeed
+
+
+BUY, SELL = 0, 1  # ORDER_TYPE_BUY, ORDER_TYPE_SELL
+
+# Order intent sent to the runner (type is BUY or SELL, volume None for the template's default)
+OrderIntent = namedtuple('OrderIntent', ['worker', 'symbol', 'type', 'volume', 'tag', 'created_ns'])
+
+
+class ProcessTrader:
+
+    def __init__(self, worker, symbols, feed, intents, results, stop_event, ready=None, idle_sleep=0.0005):
+        """
+        Built by the worker process (see run_worker())
+        :param worker: (int) worker id
+        :param symbols: (list of str) symbols traded by this worker
+        :param feed: (SharedTickFeed) feed attached in this process
+        :param intents: (multiprocessing.Queue) order intents to the runner
+        :param results: (multiprocessing.Queue) order results from the runner, for this worker only
+        :param stop_event: (multiprocessing.Event) set by the runner to stop the workers
+        :param ready: (multiprocessing.Semaphore) (optional) released once onStart() returned
+        :param idle_sleep: (float) seconds slept when no symbol had a new tick
+        """
+        self.worker = worker
+        self.symbols = list(symbols)
+        self.feed = feed
+        self._intents = intents
+        self._results = results
+        self._stop = stop_event
+        self._ready = ready
+        self.idle_sleep = idle_sleep
+
+        # Metrics
+        self.ticks = 0
+        self.lost = 0
+        self.orders_sent = 0
+
+    # Strategy interface
+    def onStart(self):
+        pass
+
+    def onTick(self, symbol, time_ns, bid, ask):
+        pass
+
+    def onBar(self, symbol, bar):
+        """ :param bar: (tuple) last completed bar in BAR_FIELDS order """
+        pass
+
+    def onOrder(self, result):
+        """ :param result: (dict) see ProcessRunner._execute() """
+        pass
+
+    def onStop(self):
+        pass
+
+    # Orders
+    def buy(self, symbol, volume=None, tag=None):
+        self._send(symbol, BUY, volume, tag)
+
+    def sell(self, symbol, volume=None, tag=None):
+        self._send(symbol, SELL, volume, tag)
+
+    def _send(self, symbol, _type, volume, tag):
+        self._intents.put(OrderIntent(self.worker, symbol, _type, volume, tag, time_ns()))
+        self.orders_sent += 1
+
+    # Loop
+    def run(self):
+        """
+        Dispatch every new tick and bar of the worker's symbols until the runner stops
+        :return: (dict) metrics of the worker
+        """
+        feed = self.feed
+        seqs = {symbol: feed.tick_count(symbol) for symbol in self.symbols}
+        bars = {symbol: feed.bar_count(symbol) for symbol in self.symbols}
+        self.onStart()
+        if self._ready is not None:
+            self._ready.release()
+
+        while not self._stop.is_set():
+            busy = False
+            for symbol in self.symbols:
+                rows, seqs[symbol], lost = feed.ticks_since(symbol, seqs[symbol])
+                n = len(rows['time'])
+                if n:
+                    busy = True
+                    self.lost += lost
+                    self.ticks += n
+                    for t, bid, ask in zip(rows['time'].tolist(), rows['bid'].tolist(), rows['ask'].tolist()):
+                        self.onTick(symbol, t, bid, ask)
+
+                count = feed.bar_count(symbol)
+                if count != bars[symbol]:
+                    bars[symbol] = count
+                    bar = feed.last_bar(symbol)
+                    if bar is not None:
+                        self.onBar(symbol, bar)
+
+            self._drain_results()
+            if not busy:
+                sleep(self.idle_sleep)
+
+        self.onStop()
+        self._drain_results()
+        return {'worker': self.worker, 'symbols': len(self.symbols), 'ticks': self.ticks, 'lost': self.lost,
+                'orders': self.orders_sent}
+
+    def _drain_results(self):
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except Empty:
+                return
+            self.onOrder(result)
+
+
+def run_worker(trader_cls, worker, symbols, feed_spec, intents, results, stop_event, ready, report, kwargs):
+    """
+    Entry point of a worker process
+    :param trader_cls: (type) ProcessTrader subclass
+    :param report: (multiprocessing.Queue) receives the worker's metrics when it stops
+    :param kwargs: (dict) extra arguments of trader_cls
+    """
+    feed = SharedTickFeed.attach(feed_spec)
+    try:
+        trader = trader_cls(worker, symbols, feed, intents, results, stop_event, ready, **kwargs)
+        report.put(trader.run())
+    finally:
+        feed.close()
@@ -0,0 +1,135 @@
+"""
+Append-optimized in-memory log of a strategy's orders.
+"""
+
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+
+# order_history columns plus the request's magic number
+TRADE_LOG_FIELDS = (('orderid', np.int64),
+                    ('timestamp', 'datetime64[ns]'),
+                    ('retcode', np.int64),
+                    ('symbol', object),
+                    ('price', np.float64),
+                    ('bid', np.float64),
+                    ('ask', np.float64),
+                    ('comment', object),
+                    ('volume', np.float64),
+                    ('dealid', np.int64),
+                    ('tr_action', np.int64),
+                    ('tr_volume', np.float64),
+                    ('tr_price', np.float64),
+                    ('tr_stoplimit', np.float64),
+                    ('tr_sl', np.float64),
+                    ('tr_tp', np.float64),
+                    ('tr_type', np.int64),
+                    ('tr_type_filling', np.int64),
+                    ('tr_type_time', np.int64),
+                    ('tr_expiration', np.int64),
+                    ('tr_comment', object),
+                    ('tr_magic', np.int64))
+
+
+class TradeLog:
+    """
+    Thread-safe columnar trade log.
+
+    Every column is a typed array grown by doubling, so append() is amortized O(1) instead
+    of copying a whole DataFrame per order. Row ids are indexed by symbol and by magic
+    number for fast lookups.
+    """
+
+    def __init__(self, fields=TRADE_LOG_FIELDS, initial_capacity=1024):
+        """
+        :param fields: (tuple of (str, dtype)) column names and dtypes
+        :param initial_capacity: (int) rows allocated up front
+        """
+        self.fields = tuple(name for name, _ in fields)
+        self._dtypes = tuple(np.dtype(dtype) for _, dtype in fields)
+        self._columns = [np.zeros(max(int(initial_capacity), 1), dtype=dtype) for dtype in self._dtypes]
+        self._size = 0
+
+        self._symbol_idx = self.fields.index('symbol') if 'symbol' in self.fields else None
+        self._magic_idx = self.fields.index('tr_magic') if 'tr_magic' in self.fields else None
+        self._by_symbol = {}  # {SYMBOL: [ROW, ...]}
+        self._by_magic = {}  # {MAGIC: [ROW, ...]}
+
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        """
+        :param row: (tuple or dict) values in the order of fields, or {FIELD: VALUE} (missing fields are left empty)
+        :return: (int) row id
+        """
+        if isinstance(row, dict):
+            row = tuple(row.get(name) for name in self.fields)
+
+        with self._lock:
+            idx = self._size
+            if idx == len(self._columns[0]):
+                self._grow()
+
+            for col, value in zip(self._columns, row):
+                if value is not None:
+                    col[idx] = value
+            self._size = idx + 1
+
+            if self._symbol_idx is not None:
+                self._by_symbol.setdefault(row[self._symbol_idx], []).append(idx)
+            if self._magic_idx is not None:
+                self._by_magic.setdefault(row[self._magic_idx], []).append(idx)
+        return idx
+
+    def _grow(self):
+        capacity = 2 * len(self._columns[0])
+        grown = []
+        for col, dtype in zip(self._columns, self._dtypes):
+            new = np.zeros(capacity, dtype=dtype)
+            new[:self._size] = col[:self._size]
+            grown.append(new)
+        self._columns = grown
+
+    def snapshot(self, rows=None):
+        """
+        :param rows: (array of int) (optional) row ids to copy, default is every row
+        :return: (dict) {FIELD: ndarray} copies, safe to use while orders keep being appended
+        """
+        with self._lock:
+            if rows is None:
+                return {name: col[:self._size].copy() for name, col in zip(self.fields, self._columns)}
+            return {name: col[rows] for name, col in zip(self.fields, self._columns)}
+
+    def to_frame(self, rows=None):
+        """
+        :return: (DataFrame) the log (or the given row ids) as a DataFrame
+        """
+        return pd.DataFrame(self.snapshot(rows), columns=list(self.fields))
+
+    def rows_for_symbol(self, symbol):
+        """ :return: (ndarray) row ids of the symbol's orders """
+        with self._lock:
+            return np.array(self._by_symbol.get(symbol, ()), dtype=np.int64)
+
+    def rows_for_magic(self, magic):
+        """ :return: (ndarray) row ids of the orders sent with the magic number """
+        with self._lock:
+            return np.array(self._by_magic.get(magic, ()), dtype=np.int64)
+
+    def by_symbol(self, symbol):
+        """ :return: (dict) {FIELD: ndarray} the symbol's orders """
+        return self.snapshot(self.rows_for_symbol(symbol))
+
+    def by_magic(self, magic):
+        """ :return: (dict) {FIELD: ndarray} the orders sent with the magic number """
+        return self.snapshot(self.rows_for_magic(magic))
+
+    def symbols(self):
+        """ :return: (list of str) symbols with at least one order """
+        with self._lock:
+            return list(self._by_symbol)
@@ -0,0 +1,60 @@
+import unittest
+from time import perf_counter
+
+from src.client.client import Client
+from src.client.tick_store import TickStore
+
+
+class _Conn:
+
+    def __init__(self, capacity):
+        self.tick_store = TickStore(capacity)
+
+
+def _fill(store, symbols, start, n):
+    for i in range(start, start + n):
+        for k, symbol in enumerate(symbols):
+            store.append_tick(symbol, i * 1000 + k, 1.0 + i * 1e-6, 1.0002 + i * 1e-6)
+
+
+class ClientTest(unittest.TestCase):
+
+    def test_market_to_df_cost_does_not_grow_with_history(self):
+        symbols = ['EURUSD', 'GBPUSD']
+
+        def call_time(history):
+            client = Client(conn=_Conn(history + 1000))
+            store = client.conn.tick_store
+            _fill(store, symbols, 0, history)
+            client.market_to_df()
+            client.market_data  # a cached frame must not be rebuilt by later calls
+            best = float('inf')
+            for j in range(20):
+                _fill(store, symbols, history + 10 * j, 10)
+                start = perf_counter()
+                new = client.market_to_df()
+                best = min(best, perf_counter() - start)
+                self.assertEqual(len(new), 20)
+            return best
+
+        small, large = call_time(10000), call_time(400000)
+        self.assertLess(large, small * 3 + 0.002)
+
+    def test_market_data_matches_full_rebuild(self):
+        client = Client(conn=_Conn(10000))
+        store = client.conn.tick_store
+        _fill(store, ['A', 'B'], 0, 50)
+        client.market_to_df()
+        first = client.market_data
+        _fill(store, ['A'], 50, 5)
+        store.append_tick('A', 54 * 1000, 9.0, 9.5)  # same receive time as the previous tick, replaces it
+        client.market_to_df()
+
+        self.assertEqual(len(client.symbol_data('A')), 55)
+        self.assertEqual(client.symbol_data('A').iloc[-1].tolist(), [9.0, 9.5])
+        self.assertEqual(len(client.symbol_data('B')), 50)
+        self.assertEqual(len(client.market_data), len(first) + 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from time import sleep
+
+from src.client.correlation import PendingRequests
+
+
+class PendingRequestsTest(unittest.TestCase):
+
+    def test_late_response_after_timeout_is_absorbed(self):
+        requests = PendingRequests(timeout=0.01)
+        _, first = requests.create('EXECUTION')
+        sleep(0.02)
+        requests.expire()
+        self.assertIsInstance(first.exception(0), TimeoutError)
+
+        _, second = requests.create('EXECUTION')
+        late = {'_action': 'EXECUTION', '_magic': 111, '_ticket': 1}
+        self.assertIsNone(requests.resolve(late))
+        self.assertFalse(second.done())
+
+        response = {'_action': 'EXECUTION', '_magic': 222, '_ticket': 2}
+        self.assertIs(requests.resolve(response), second)
+        self.assertEqual(second.result(0), response)
+        self.assertEqual(len(requests), 0)
+
+    def test_late_tagged_response_is_dropped(self):
+        requests = PendingRequests(timeout=0.01)
+        first_id, first = requests.create('EXECUTION')
+        sleep(0.02)
+        requests.expire()
+        second_id, second = requests.create('EXECUTION')
+
+        self.assertIsNone(requests.resolve({'_action': 'EXECUTION', '_request_id': str(first_id)}))
+        self.assertFalse(second.done())
+        self.assertIs(requests.resolve({'_action': 'EXECUTION', '_request_id': str(second_id)}), second)
+
+    def test_fifo_per_key(self):
+        requests = PendingRequests()
+        _, close = requests.create('CLOSE')
+        _, first = requests.create('EXECUTION')
+        _, second = requests.create('EXECUTION')
+
+        requests.resolve({'_action': 'EXECUTION', '_ticket': 1})
+        self.assertEqual(first.result(0)['_ticket'], 1)
+        self.assertFalse(second.done())
+        self.assertFalse(close.done())
+        self.assertEqual(len(requests), 2)
+
+    def test_never_answered_request_stops_shifting_matches(self):
+        requests = PendingRequests(timeout=0.01, tombstone_ttl=0.01)
+        _, ignored = requests.create('EXECUTION', command='TRADE')
+        sleep(0.02)
+        requests.expire()
+        self.assertIsInstance(ignored.exception(0), TimeoutError)
+        sleep(0.02)
+        requests.expire()  # the EA never answered, the tombstone is reclaimed
+
+        _, first = requests.create('EXECUTION', command='TRADE')
+        _, second = requests.create('EXECUTION', command='TRADE')
+        self.assertIs(requests.resolve({'_action': 'EXECUTION', '_ticket': 1}), first)
+        self.assertIs(requests.resolve({'_action': 'EXECUTION', '_ticket': 2}), second)
+        self.assertEqual(second.result(0)['_ticket'], 2)
+        self.assertEqual(len(requests), 0)
+        self.assertIsNone(requests.next_deadline())
+
+    def test_error_reply_fails_the_rejected_request(self):
+        requests = PendingRequests()
+        _, hist = requests.create('HIST', 'EURUSD', command='HIST')
+        _, rejected = requests.create('EXECUTION', command='TRADE')
+        _, opened = requests.create('EXECUTION', command='TRADE')
+
+        error = {'_action': 'ERROR', '_response': 'MALFORMED_COMMAND', '_command': 'TRADE',
+                 '_response_value': 'could not convert string to float'}
+        self.assertIs(requests.resolve(error), rejected)
+        self.assertIs(rejected.exception(0).response, error)
+        self.assertIsNone(requests.resolve({'_action': 'ERROR', '_response': 'UNKNOWN_COMMAND', '_command': 'FOO'}))
+
+        self.assertIs(requests.resolve({'_action': 'EXECUTION', '_ticket': 7}), opened)
+        self.assertEqual(opened.result(0)['_ticket'], 7)
+        self.assertFalse(hist.done())
+
+    def test_tagged_error_reply_fails_its_request(self):
+        requests = PendingRequests()
+        _, first = requests.create('EXECUTION', command='TRADE')
+        second_id, second = requests.create('EXECUTION', command='TRADE')
+
+        requests.resolve({'_action': 'ERROR', '_response': 'MALFORMED_COMMAND', '_command': 'TRADE',
+                          '_request_id': second_id})
+        self.assertIsInstance(second.exception(0), RuntimeError)
+        self.assertFalse(first.done())
+
+
+if __name__ == '__main__':
+    unittest.main()